@@ -3,7 +3,6 @@ from datetime import datetime, timedelta
 import os
 import shutil
 import glob
-import subprocess
 from airflow import DAG
 from airflow.models import Variable
 from airflow.operators.python import PythonOperator
@@ -16,20 +15,117 @@ ART_DIR = "/opt/airflow/artifacts"
 HOLDOUT = os.path.join(DATA_DIR, "holdout.csv")
 REF = os.path.join(DATA_DIR, "raw", "reference.csv")
 CUR = os.path.join(DATA_DIR, "raw", "current.csv")
+DEDUP_INDEX = os.path.join(DATA_DIR, "dedup_index.sqlite")
+INCOMING = os.path.join(DATA_DIR, "incoming")
+INGEST_STATE = os.path.join(DATA_DIR, "ingest_state.json")
+PUSHGATEWAY = "http://pushgateway:9091"
+# buffer per run e push rimasti in spool quando il gateway non risponde
+METRICS_SPOOL = os.path.join(ART_DIR, "metrics_spool")
+
+# "schedule": run giornaliero sull'ultimo file di incoming (comportamento
+# storico); "event": run ogni pochi minuti che parte solo se il sensore trova
+# nuovi file (debounce), e ingest/drift lavorano solo sui file nuovi
+EVENT_MODE = os.environ.get("RETRAIN_TRIGGER_MODE", "schedule") == "event"
 
 MLFLOW = os.environ.get("MLFLOW_TRACKING_URI", "http://mlflow:5000")
 MODEL_NAME = os.environ.get("REGISTERED_MODEL_NAME", "Sentiment")
 
 
-def ingest():
+def _exporter(run_id):
+    """Buffer metriche del run: i task registrano, `export_metrics` fa un solo
+    push (con retry e spool) a fine DAG."""
+    from src.monitoring.exporter import MetricsExporter
+
+    return MetricsExporter.for_run(
+        run_id or "manual",
+        gateway=PUSHGATEWAY,
+        job="retrain_sentiment",
+        grouping_key={"instance": "airflow"},
+        spool_dir=METRICS_SPOOL,
+    )
+
+
+def wait_for_batch(run_id=None):
+    from airflow.sensors.base import PokeReturnValue
+
+    from src.monitoring.incoming import IncomingWatch
+
+    batch = IncomingWatch(INCOMING, INGEST_STATE).ready()
+    if batch is None:
+        return PokeReturnValue(is_done=False)
+    print(f"[wait_for_batch] {len(batch['files'])} file pronti: {batch['files']}")
+    _record_freshness(run_id, "detected", batch["oldest_mtime"])
+    return PokeReturnValue(is_done=True, xcom_value=batch)
+
+
+def _record_freshness(run_id, stage, oldest_mtime):
+    try:
+        from src.monitoring.incoming import freshness_lag
+        from src.monitoring.push_metrics import record_freshness
+
+        lag = freshness_lag(oldest_mtime)
+        record_freshness(_exporter(run_id), stage, lag)
+        print(f"[freshness] {stage}: {lag:.0f}s dall'arrivo del batch")
+    except Exception as e:
+        print(f"[freshness] metrics WARN: {e}")
+
+
+def _ingest_delta(ti, run_id):
+    """Modalità a eventi: i file rilevati dal sensore (e solo quelli) diventano
+    `current.csv`, così il drift misura il delta dall'ultimo ingest."""
+    import pandas as pd
+
+    from src.features.dedup import dedup_file
+    from src.monitoring.incoming import IncomingWatch
+
+    batch = ti.xcom_pull(task_ids="wait_for_batch")
+    staging = f"{CUR}.delta.csv"
+    if os.path.exists(staging):
+        os.remove(staging)
+    for path in batch["files"]:
+        for chunk in pd.read_csv(path, chunksize=50000):
+            chunk.to_csv(
+                staging, mode="a", header=not os.path.exists(staging), index=False
+            )
+    try:
+        stats = dedup_file(staging, CUR, DEDUP_INDEX, run=run_id)
+        print(
+            f"[ingest] {len(batch['files'])} file nuovi deduplicati -> {CUR}: {stats}"
+        )
+        ti.xcom_push(key="dedup", value=stats)
+    except Exception as e:
+        print(f"[ingest] dedup WARN ({e}): delta copiato senza deduplicazione")
+        shutil.copy(staging, CUR)
+    finally:
+        os.remove(staging)
+    IncomingWatch(INCOMING, INGEST_STATE).mark_processed(
+        batch["files"], batch["mtimes"]
+    )
+
+
+def ingest(ti=None, run_id=None):
     os.makedirs(os.path.dirname(CUR), exist_ok=True)
-    incoming = glob.glob(os.path.join(DATA_DIR, "incoming", "*.csv"))
+    if EVENT_MODE and ti:
+        return _ingest_delta(ti, run_id)
+    incoming = glob.glob(os.path.join(INCOMING, "*.csv"))
     if incoming:
         latest_csv = max(incoming, key=os.path.getmtime)
         if os.path.exists(CUR):
             os.remove(CUR)
-        shutil.copy(latest_csv, CUR)
-        print(f"[ingest] Copiato batch {latest_csv} -> {CUR}")
+        # duplicati esatti e near-duplicate (retweet, copy-pasta, varianti di
+        # URL) collassati in una riga con colonna `weight`; l'indice persiste
+        # tra i run giornalieri
+        try:
+            from src.features.dedup import dedup_file
+
+            stats = dedup_file(latest_csv, CUR, DEDUP_INDEX, run=run_id)
+            print(f"[ingest] Batch {latest_csv} deduplicato -> {CUR}: {stats}")
+            if ti:
+                ti.xcom_push(key="dedup", value=stats)
+        except Exception as e:
+            print(f"[ingest] dedup WARN ({e}): copia senza deduplicazione")
+            shutil.copy(latest_csv, CUR)
+            print(f"[ingest] Copiato batch {latest_csv} -> {CUR}")
     else:
         # fallback: riusa l'holdout come batch current per demo
         if os.path.exists(CUR):
@@ -38,42 +134,44 @@ def ingest():
         print(f"[ingest] Nessun incoming: fallback {HOLDOUT} -> {CUR}")
 
 
-def compute_drift():
+def _use_mlflow_uri():
+    # I moduli `src` vengono importati nel processo del task: la tracking URI va
+    # impostata prima dell'import di `src.utils.mlflow_utils`, che la legge.
+    os.environ["MLFLOW_TRACKING_URI"] = MLFLOW
+    import mlflow
+
+    mlflow.set_tracking_uri(MLFLOW)
+
+
+def _latest_model_uri(model_name):
+    # una sola versione ordinata lato registry (niente scansione di tutte)
+    from src.utils.mlflow_utils import latest_version_uri
+
+    uri = latest_version_uri(model_name)
+    if uri is None:
+        raise RuntimeError(f"Nessuna versione trovata per il modello '{model_name}'")
+    return uri
+
+
+def compute_drift(ti=None, run_id=None):
+    # Import in-process (niente `python -m`): pandas/numpy restano caldi nel
+    # processo del task e il risultato viaggia come dict via XCom.
+    from src.monitoring import drift_report, push_metrics
+
     os.makedirs(ART_DIR, exist_ok=True)
-    cmd = [
-        "python",
-        "-m",
-        "src.monitoring.drift_report",
-        "--reference",
-        REF,
-        "--current",
-        CUR,
-        "--out",
-        ART_DIR,
-    ]
-    proc = subprocess.run(cmd, text=True)
-    code = (
-        proc.returncode if proc.returncode in (0, 1) else 1
-    )  # 0=no drift, 1=drift (default: prudente)
-    # push metrica
     try:
-        subprocess.check_call(
-            [
-                "python",
-                "-m",
-                "src.monitoring.push_metrics",
-                "--gateway",
-                "http://pushgateway:9091",
-                "--job",
-                "retrain_sentiment",
-                "--instance",
-                "airflow",
-                "--drift",
-                str(code),
-            ]
-        )
+        summary = drift_report.run(REF, CUR, ART_DIR)
+        code = int(summary["drift_flag"])  # 0=no drift, 1=drift
     except Exception as e:
-        print("[drift] pushgateway WARN:", e)
+        print("[drift] ERRORE nel calcolo del drift (default prudente=1):", e)
+        summary, code = None, 1
+    if ti and summary is not None:
+        ti.xcom_push(key="drift_summary", value=summary)
+    # metrica nel buffer del run (push in export_metrics)
+    try:
+        push_metrics.record_drift(_exporter(run_id), code)
+    except Exception as e:
+        print("[drift] metrics WARN:", e)
     return code
 
 
@@ -115,75 +213,48 @@ def branch_callable(**context):
     return "train" if (drift_code == 1 or time_gate) else "finish"
 
 
-def train(ti=None):
-    env = os.environ.copy()
-    env["MLFLOW_TRACKING_URI"] = MLFLOW
+def train(ti=None, run_id=None):
+    if EVENT_MODE and ti:
+        batch = ti.xcom_pull(task_ids="wait_for_batch")
+        if batch:
+            _record_freshness(run_id, "train_start", batch["oldest_mtime"])
+    _use_mlflow_uri()
+    from src.models import train_roberta
+
     # 1) esegui il training (registra nuova versione nel Registry)
-    cmd = ["python", "-m", "src.models.train_roberta", "--experiment", "sentiment"]
-    result = subprocess.run(cmd, env=env, capture_output=True, text=True)
-    if result.returncode != 0:
-        print(f"[train] STDOUT:\n{result.stdout}")
-        print(f"[train] STDERR:\n{result.stderr}")
-        raise subprocess.CalledProcessError(result.returncode, result.args)
-    # 2) risali alla ULTIMA versione registrata e mettila in XCom
-    from mlflow.tracking import MlflowClient
-
-    client = MlflowClient(tracking_uri=MLFLOW)
-    versions = client.search_model_versions(f"name='{MODEL_NAME}'")
-    if not versions:
-        raise RuntimeError(f"Nessuna versione trovata per il modello '{MODEL_NAME}'")
-    latest = max(versions, key=lambda v: int(v.version))
-    new_uri = f"models:/{MODEL_NAME}/{int(latest.version)}"
+    result = train_roberta.train(experiment="sentiment")
+    # 2) URI della versione appena registrata (o, se il registry non la
+    #    restituisce, l'ULTIMA registrata) in XCom
+    new_uri = result.get("model_uri") or _latest_model_uri(MODEL_NAME)
+    result["model_uri"] = new_uri
     if ti:
         ti.xcom_push(key="new_uri", value=new_uri)
+    return result
 
 
 def train_smoke(ti=None):
-    env = os.environ.copy()
-    env["MLFLOW_TRACKING_URI"] = MLFLOW
+    _use_mlflow_uri()
+    from src.models import train_smoke as smoke
+
     dev_suffix = os.environ.get("REGISTERED_MODEL_DEV_SUFFIX", "-dev")
-    n_samples = os.environ.get("SMOKE_N_SAMPLES", "50")
+    n_samples = int(os.environ.get("SMOKE_N_SAMPLES", "50"))
     # esegui il training dev (script leggero)
     try:
-        result = subprocess.run(
-            [
-                "python",
-                "-m",
-                "src.models.train_smoke",
-                "--experiment",
-                "sentiment",
-                "--n_samples",
-                str(n_samples),
-                f"--dev_suffix={dev_suffix}",
-            ],
-            env=env,
-            capture_output=True,
-            text=True,
+        result = smoke.train(
+            experiment="sentiment", n_samples=n_samples, dev_suffix=dev_suffix
         )
-        if result.returncode != 0:
-            print(f"[train_smoke] STDOUT:\n{result.stdout}")
-            print(f"[train_smoke] STDERR:\n{result.stderr}")
-            raise subprocess.CalledProcessError(result.returncode, result.args)
-    except subprocess.CalledProcessError as e:
+    except Exception as e:
         print(f"[train_smoke] ERRORE durante l'esecuzione: {e}")
         raise
     # recupera la versione dev appena registrata
-    from mlflow.tracking import MlflowClient
-
-    client = MlflowClient(tracking_uri=MLFLOW)
-    dev_model_name = f"{MODEL_NAME}{dev_suffix}"
-    versions = client.search_model_versions(f"name='{dev_model_name}'")
-    if not versions:
-        raise RuntimeError(
-            f"Nessuna versione trovata per il modello '{dev_model_name}'"
-        )
-    latest = max(versions, key=lambda v: int(v.version))
-    new_uri = f"models:/{dev_model_name}/{int(latest.version)}"
+    new_uri = result.get("model_uri") or _latest_model_uri(f"{MODEL_NAME}{dev_suffix}")
+    result["model_uri"] = new_uri
     if ti:
         ti.xcom_push(key="new_uri", value=new_uri)
+    return result
 
 
-def evaluate_and_promote(ti=None):
+def evaluate_and_promote(ti=None, run_id=None):
     # 1) prova a leggere la URI dal train
     new_uri = None
     if ti:
@@ -192,108 +263,80 @@ def evaluate_and_promote(ti=None):
             # try the dev smoke task too
             new_uri = ti.xcom_pull(task_ids="train_smoke", key="new_uri")
 
+    _use_mlflow_uri()
+    from src.models.evaluate import evaluate_and_maybe_promote
+    from src.monitoring.push_model_metrics import record_model_metrics
+
     # 2) fallback robusto: prendi comunque l'ultima versione registrata
     if not new_uri:
-        from mlflow.tracking import MlflowClient
-
-        client = MlflowClient(tracking_uri=MLFLOW)
-        versions = client.search_model_versions(f"name='{MODEL_NAME}'")
-        if not versions:
-            raise RuntimeError(
-                f"Nessuna versione trovata per il modello '{MODEL_NAME}'"
-            )
-        latest = max(versions, key=lambda v: int(v.version))
-        new_uri = f"models:/{MODEL_NAME}/{int(latest.version)}"
+        new_uri = _latest_model_uri(MODEL_NAME)
 
     print(f"[evaluate_and_promote] new_model_uri = {new_uri}")
 
-    env = os.environ.copy()
-    env["MLFLOW_TRACKING_URI"] = MLFLOW
-
-    # File temporaneo per catturare le metriche
-    metrics_file = "/tmp/model_metrics.json"
-
     try:
-        result = subprocess.run(
-            [
-                "python",
-                "-m",
-                "src.models.evaluate",
-                "--new_model_uri",
-                new_uri,
-                "--eval_csv",
-                HOLDOUT,
-                "--min_improvement",
-                "0.0",
-                "--metrics_output",
-                metrics_file,
-            ],
-            env=env,
-            capture_output=True,
-            text=True,
+        metrics = evaluate_and_maybe_promote(
+            new_uri,
+            HOLDOUT,
+            min_improvement=0.0,
+            # niente gate shadow: il modello appena addestrato non è ancora
+            # stato mirrorato dalla serving app, quindi non ha report; il gate
+            # si usa dalla CLI sul candidato di SHADOW_MODEL_URI
         )
-        if result.returncode != 0:
-            print(f"[evaluate_and_promote] STDOUT:\n{result.stdout}")
-            print(f"[evaluate_and_promote] STDERR:\n{result.stderr}")
-            raise subprocess.CalledProcessError(result.returncode, result.args)
-
-        # Estrai le metriche dal JSON
-        import json
+    except Exception as e:
+        print(f"[evaluate_and_promote] ERRORE durante l'esecuzione: {e}")
+        raise
 
-        if os.path.exists(metrics_file):
-            with open(metrics_file, "r") as f:
-                metrics = json.load(f)
+    f1_score = metrics.get("new_f1", 0.0)
+    accuracy = metrics.get("new_accuracy", 0.0)
+    version = metrics.get("new_version", 1)
 
-            f1_score = metrics.get("new_f1", 0.0)
-            accuracy = metrics.get("new_accuracy", 0.0)
-            version = metrics.get("new_version", 1)
+    print(
+        f"[evaluate_and_promote] F1={f1_score}, Accuracy={accuracy}, Version={version}"
+    )
 
-            print(
-                f"[evaluate_and_promote] F1={f1_score}, Accuracy={accuracy}, Version={version}"
-            )
+    # Metriche nel buffer del run (push a Prometheus in export_metrics)
+    try:
+        record_model_metrics(
+            _exporter(run_id),
+            model_name=MODEL_NAME,
+            model_version=str(version),
+            f1_score=f1_score,
+            accuracy=accuracy,
+            per_class=metrics.get("per_class"),
+            bootstrap=metrics.get("bootstrap"),
+        )
+        print("[evaluate_and_promote] Metriche registrate per il push")
+    except Exception as e:
+        print(f"[evaluate_and_promote] metrics WARN: {e}")
 
-            # Push delle metriche a Prometheus
-            try:
-                subprocess.check_call(
-                    [
-                        "python",
-                        "-m",
-                        "src.monitoring.push_model_metrics",
-                        "--gateway",
-                        "http://pushgateway:9091",
-                        "--job",
-                        "model_performance",
-                        "--instance",
-                        "airflow",
-                        "--model_name",
-                        MODEL_NAME,
-                        "--model_version",
-                        str(version),
-                        "--f1_score",
-                        str(f1_score),
-                        "--accuracy",
-                        str(accuracy),
-                    ],
-                    env=env,
-                )
-                print("[evaluate_and_promote] Metriche pushate a Prometheus")
-            except Exception as e:
-                print(f"[evaluate_and_promote] pushgateway WARN: {e}")
-
-    except subprocess.CalledProcessError as e:
-        print(f"[evaluate_and_promote] ERRORE durante l'esecuzione: {e}")
-        raise
+    # le metriche viaggiano via XCom (niente piu' /tmp/model_metrics.json)
+    return metrics
 
 
 def _noop():
     pass
 
 
+def export_metrics(run_id=None):
+    # un solo push per run: prima i push rimasti in spool dai run precedenti,
+    # poi il buffer di questo run (in spool se il gateway non risponde)
+    exporter = _exporter(run_id)
+    n = len(exporter.samples())
+    if exporter.flush():
+        print(f"[export_metrics] {n} metriche pushate a Prometheus")
+    else:
+        print(
+            f"[export_metrics] pushgateway WARN: {n} metriche in spool "
+            f"({exporter.pending()} push in attesa)"
+        )
+
+
 with DAG(
     dag_id="retrain_sentiment",
-    schedule_interval="@daily",
+    schedule_interval="*/5 * * * *" if EVENT_MODE else "@daily",
     start_date=datetime(2025, 1, 1),
     catchup=False,
+    max_active_runs=1,
     default_args={"retries": 0},
 ) as dag:
     t_ingest = PythonOperator(task_id="ingest", python_callable=ingest)
@@ -310,8 +353,32 @@ with DAG(
         trigger_rule="none_failed_or_skipped",
     )
     t_finish = PythonOperator(task_id="finish", python_callable=_noop)
+    # gira anche se i task a monte falliscono o sono skipped
+    t_export = PythonOperator(
+        task_id="export_metrics",
+        python_callable=export_metrics,
+        trigger_rule="all_done",
+    )
+
+    if EVENT_MODE:
+        # reschedule: tra un poke e l'altro lo slot dell'executor resta libero
+        # (il compose non avvia un triggerer per i sensori deferrable); senza
+        # file nuovi il sensore va in timeout come skipped e il run si chiude
+        # senza ingest né drift
+        from airflow.sensors.python import PythonSensor
+
+        t_wait = PythonSensor(
+            task_id="wait_for_batch",
+            python_callable=wait_for_batch,
+            mode="reschedule",
+            poke_interval=60,
+            timeout=4 * 60,
+            soft_fail=True,
+        )
+        t_wait >> t_ingest
 
     t_ingest >> t_drift >> t_branch
     t_branch >> t_train >> t_eval
     t_branch >> t_train_smoke >> t_eval
     t_branch >> t_finish
+    [t_eval, t_finish] >> t_export
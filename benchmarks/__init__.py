@@ -0,0 +1 @@
+# Package esplicito: pyarrow installa un modulo top-level `benchmarks` che altrimenti avrebbe la precedenza su questa cartella.
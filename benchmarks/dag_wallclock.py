@@ -0,0 +1,116 @@
+"""Before/after del DAG: task lanciati come `python -m` vs chiamati in-process.
+
+Riproduce la catena `drift` (+ push della metrica) ed il costo di import dei
+moduli usati da `train`/`evaluate_and_promote`, misurando:
+
+- **before**: un interprete nuovo per ogni step (come faceva il DAG con
+  `subprocess.run(["python", "-m", ...])`);
+- **after**: gli stessi entry point chiamati nel processo corrente (come fa ora
+  il DAG), con il costo di import pagato una sola volta.
+
+Il Pushgateway punta di default a una porta chiusa in locale: il push fallisce
+subito (nessun retry, spool nella directory temporanea) e si misura solo
+l'overhead della chiamata.
+
+Usage:
+    python -m benchmarks.dag_wallclock --repeat 3 --out artifacts/bench_dag.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+REF = os.path.join(ROOT, "data", "raw", "reference.csv")
+CUR = os.path.join(ROOT, "data", "raw", "current.csv")
+DEAD_GATEWAY = "http://127.0.0.1:9"
+HEAVY_MODULES = ["src.models.evaluate", "src.models.train_roberta"]
+
+
+def _subprocess_chain(out_dir: str) -> float:
+    env = dict(
+        os.environ,
+        PYTHONPATH=ROOT,
+        PUSH_RETRIES="0",
+        METRICS_SPOOL_DIR=os.path.join(out_dir, "spool"),
+    )
+    steps = [
+        [
+            "-m",
+            "src.monitoring.drift_report",
+            "--reference",
+            REF,
+            "--current",
+            CUR,
+            "--out",
+            out_dir,
+        ],
+        [
+            "-m",
+            "src.monitoring.push_metrics",
+            "--gateway",
+            DEAD_GATEWAY,
+            "--drift",
+            "0",
+        ],
+    ] + [["-c", f"import {m}"] for m in HEAVY_MODULES]
+    start = time.perf_counter()
+    for step in steps:
+        subprocess.run([sys.executable, *step], env=env, cwd=ROOT, capture_output=True)
+    return time.perf_counter() - start
+
+
+def _inprocess_chain(out_dir: str) -> float:
+    import importlib
+
+    start = time.perf_counter()
+    from src.monitoring import drift_report, push_metrics
+    from src.monitoring.exporter import MetricsExporter
+
+    summary = drift_report.run(REF, CUR, out_dir)
+    exporter = MetricsExporter(
+        DEAD_GATEWAY, "bench", retries=0, spool_dir=os.path.join(out_dir, "spool")
+    )
+    push_metrics.record_drift(exporter, summary["drift_flag"])
+    exporter.flush()
+    for m in HEAVY_MODULES:
+        importlib.import_module(m)
+    return time.perf_counter() - start
+
+
+def main(repeat: int = 3, out: str | None = None) -> dict:
+    sys.path.insert(0, ROOT)
+    with tempfile.TemporaryDirectory() as tmp:
+        before = [_subprocess_chain(tmp) for _ in range(repeat)]
+        # il primo giro in-process paga gli import (come il primo task del
+        # worker), i successivi riflettono il processo gia' caldo
+        after = [_inprocess_chain(tmp) for _ in range(repeat)]
+    result = {
+        "repeat": repeat,
+        "before_subprocess_s": before,
+        "after_inprocess_s": after,
+        "before_median_s": statistics.median(before),
+        "after_cold_s": after[0],
+        "after_warm_median_s": statistics.median(after[1:] or after),
+    }
+    print(json.dumps(result, indent=2))
+    if out:
+        os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+        with open(out, "w") as f:
+            json.dump(result, f, indent=2)
+    return result
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--out", default=None, help="Path JSON per salvare i risultati")
+    args = ap.parse_args()
+    main(args.repeat, args.out)
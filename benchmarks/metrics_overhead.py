@@ -0,0 +1,98 @@
+"""Overhead per richiesta della strumentazione Prometheus della serving app.
+
+Misura (in microsecondi per richiesta):
+- `labels_lookup`: la vecchia sequenza di `/predict` (`inc()` +
+  `.labels(...).inc()` + `observe()`), con lookup dei label ad ogni chiamata;
+- `prebound`: la stessa sequenza con i figli pre-istanziati del modello
+  (`ModelMetrics`), e `prebound_stages` con in più i tre stage;
+- `middleware`: costo di `MetricsMiddleware` attorno a un'app ASGI vuota.
+
+Usage:
+    python -m benchmarks.metrics_overhead --n 100000
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import time
+
+from src.serving import metrics
+
+
+def _per_call_us(fn, n: int) -> float:
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - start) / n * 1e6
+
+
+_MODEL = metrics.DEFAULT_MODEL
+
+
+def _labels_lookup():
+    metrics.REQUEST_COUNT.labels(model=_MODEL).inc()
+    metrics.SENTIMENT_PREDICTIONS.labels(model=_MODEL, sentiment_label="positive").inc()
+    metrics.REQUEST_LATENCY.labels(model=_MODEL).observe(0.01)
+
+
+_TIMINGS = {"tokenization": 0.001, "inference": 0.008, "postprocessing": 0.0005}
+_BOUND = metrics.model_metrics(_MODEL)
+
+
+def _prebound():
+    _BOUND.prediction("positive")
+    _BOUND.latency.observe(0.01)
+
+
+def _prebound_stages():
+    _BOUND.prediction("positive", _TIMINGS)
+    _BOUND.latency.observe(0.01)
+
+
+class _Route:
+    path = "/predict"
+
+
+async def _endpoint(scope, receive, send):
+    scope["route"] = _Route
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def _noop_send(message):
+    pass
+
+
+async def _asgi_us(app, n: int) -> float:
+    scope = {"type": "http", "method": "POST", "path": "/predict"}
+    start = time.perf_counter()
+    for _ in range(n):
+        await app(dict(scope), None, _noop_send)
+    return (time.perf_counter() - start) / n * 1e6
+
+
+def main(n: int, out: str | None) -> dict:
+    bare = asyncio.run(_asgi_us(_endpoint, n))
+    wrapped = asyncio.run(_asgi_us(metrics.MetricsMiddleware(_endpoint), n))
+    result = {
+        "n": n,
+        "labels_lookup_us": _per_call_us(_labels_lookup, n),
+        "prebound_us": _per_call_us(_prebound, n),
+        "prebound_stages_us": _per_call_us(_prebound_stages, n),
+        "middleware_us": wrapped - bare,
+    }
+    print(json.dumps(result, indent=2))
+    if out:
+        with open(out, "w") as f:
+            json.dump(result, f, indent=2)
+    return result
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=100_000)
+    ap.add_argument("--out", default=None)
+    args = ap.parse_args()
+    main(args.n, args.out)
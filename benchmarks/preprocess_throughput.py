@@ -0,0 +1,73 @@
+"""Throughput della normalizzazione testi: loop su `normalize_text` vs `normalize_texts`.
+
+Il batch viene costruito ricampionando i testi dei CSV in `data/` (con una
+quota di duplicati, come retweet e copy-pasta) fino a `--rows` righe.
+
+Usage:
+    python -m benchmarks.preprocess_throughput --rows 1000000 --jobs 1,4
+"""
+
+from __future__ import annotations
+
+import argparse
+import glob
+import json
+import os
+import random
+import time
+
+import pandas as pd
+
+from src.features.preprocess import normalize_text, normalize_texts
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def make_batch(rows: int, unique_ratio: float = 0.5, seed: int = 0) -> pd.Series:
+    """`rows` testi di cui circa `unique_ratio` distinti, derivati dai CSV di `data/`."""
+    base = []
+    for path in sorted(
+        glob.glob(os.path.join(ROOT, "data", "**", "*.csv"), recursive=True)
+    ):
+        base.extend(pd.read_csv(path)["text"].dropna().astype(str).tolist())
+    rnd = random.Random(seed)
+    n_unique = max(1, int(rows * unique_ratio))
+    uniques = [
+        f"{rnd.choice(base)} @u{i % 997} #t{i % 101} https://x.co/{i}  "
+        for i in range(n_unique)
+    ]
+    return pd.Series(rnd.choices(uniques, k=rows), name="text")
+
+
+def _rate(fn, texts) -> float:
+    start = time.perf_counter()
+    fn(texts)
+    return len(texts) / (time.perf_counter() - start)
+
+
+def main(rows: int, jobs: list[int], unique_ratio: float, out: str | None) -> dict:
+    texts = make_batch(rows, unique_ratio)
+    result = {
+        "rows": rows,
+        "unique_ratio": unique_ratio,
+        "loop_rows_per_s": _rate(lambda s: [normalize_text(t) for t in s], texts),
+    }
+    for n in jobs:
+        result[f"batch_jobs{n}_rows_per_s"] = _rate(
+            lambda s: normalize_texts(s, n_jobs=n), texts
+        )
+    print(json.dumps(result, indent=2))
+    if out:
+        with open(out, "w") as f:
+            json.dump(result, f, indent=2)
+    return result
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=200_000)
+    ap.add_argument("--jobs", default="1", help="lista di n_jobs, es. 1,4")
+    ap.add_argument("--unique_ratio", type=float, default=0.5)
+    ap.add_argument("--out", default=None)
+    args = ap.parse_args()
+    main(args.rows, [int(j) for j in args.jobs.split(",")], args.unique_ratio, args.out)
@@ -0,0 +1,146 @@
+"""Confronto tra `/predict` (JSON + pydantic, un testo per richiesta) e
+l'interfaccia interna (`src/serving/internal_api.py`): `/v1/predict/batch`
+(orjson, più testi per richiesta) e lo stream WebSocket `/v1/predict/stream`.
+
+Tutto in-process sull'app ASGI e, di default, sullo stub `_FallbackPipeline`:
+il costo del modello è trascurabile, quindi si misura soprattutto l'overhead
+di protocollo, parsing e serializzazione per testo.
+
+Usage:
+    python -m benchmarks.protocol_overhead --texts 5000 --batch-sizes 1,16,64
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import httpx
+
+from benchmarks.serving_load import ROOT, load_payloads
+
+
+def _result(name: str, n_texts: int, elapsed: float, **extra) -> dict:
+    return {
+        "interface": name,
+        "texts": n_texts,
+        "texts_per_s": n_texts / elapsed if elapsed else 0.0,
+        "us_per_text": elapsed / n_texts * 1e6 if n_texts else 0.0,
+        **extra,
+    }
+
+
+async def _json_predict(app, texts: list[str], concurrency: int) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as c:
+        it = iter(texts)
+
+        async def worker():
+            for text in it:
+                r = await c.post("/predict", json={"text": text})
+                r.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return time.perf_counter() - start
+
+
+async def _batch_predict(app, texts: list[str], batch_size: int, concurrency: int):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as c:
+        it = iter(range(0, len(texts), batch_size))
+
+        async def worker():
+            for i in it:
+                r = await c.post(
+                    "/v1/predict/batch", json={"texts": texts[i : i + batch_size]}
+                )
+                r.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return time.perf_counter() - start
+
+
+def _stream_predict(app, texts: list[str], window: int) -> float:
+    """Un messaggio per testo, fino a `window` messaggi in volo (pipelining)."""
+    from fastapi.testclient import TestClient
+
+    with TestClient(app).websocket_connect("/v1/predict/stream") as ws:
+        start = time.perf_counter()
+        sent = received = 0
+        while received < len(texts):
+            while sent < len(texts) and sent - received < window:
+                ws.send_bytes(json.dumps({"id": sent, "text": texts[sent]}).encode())
+                sent += 1
+            ws.receive_bytes()
+            received += 1
+        return time.perf_counter() - start
+
+
+def run(n_texts: int, batch_sizes: list[int], concurrency: int) -> list[dict]:
+    from src.serving.app import app
+
+    texts = [p["text"] for p in load_payloads(n_texts)]
+    # warm-up (import lazy, caricamento dello stub)
+    asyncio.run(_json_predict(app, texts[:20], 1))
+
+    results = [
+        _result(
+            "json /predict",
+            n_texts,
+            asyncio.run(_json_predict(app, texts, concurrency)),
+            concurrency=concurrency,
+        )
+    ]
+    for b in batch_sizes:
+        elapsed = asyncio.run(_batch_predict(app, texts, b, concurrency))
+        results.append(
+            _result("orjson /v1/predict/batch", n_texts, elapsed, batch_size=b)
+        )
+    for window in batch_sizes:
+        results.append(
+            _result(
+                "ws /v1/predict/stream",
+                n_texts,
+                _stream_predict(app, texts, window),
+                inflight=window,
+            )
+        )
+    return results
+
+
+def main(argv: list[str] | None = None) -> dict:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--texts", type=int, default=5000)
+    ap.add_argument("--batch-sizes", default="1,16,64")
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--online", action="store_true")
+    ap.add_argument("--out", default=None, help="Path JSON per salvare i risultati")
+    args = ap.parse_args(argv)
+
+    if not args.online:
+        os.environ["HF_HUB_OFFLINE"] = "1"
+    sys.path.insert(0, ROOT)
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "runs": run(
+            args.texts,
+            [int(b) for b in args.batch_sizes.split(",")],
+            args.concurrency,
+        ),
+    }
+    print(json.dumps(report, indent=2))
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+"""Load test riproducibile della serving app (`src.serving.app`).
+
+Rigioca payload realistici (i testi dei CSV in `data/`) contro l'app:
+
+- `--mode asgi`: in-process via `httpx.ASGITransport`, senza rete;
+- `--mode uvicorn`: server uvicorn reale lanciato come subprocess, uno per
+  ogni combinazione di `--workers` e `--sweep-env` (es. impostazioni di
+  batching lette dall'app all'avvio).
+
+Per ogni livello di `--concurrency` riporta latenza p50/p95/p99, throughput,
+errori, CPU (secondi CPU / secondi wall) e RSS del processo server. Di default
+il download del modello HF è disabilitato (`HF_HUB_OFFLINE=1`), quindi l'app
+usa lo stub `_FallbackPipeline` e il benchmark gira offline; `--model-uri`
+permette di puntare a un modello locale (es. un piccolo modello `-dev`).
+
+Usage:
+    python -m benchmarks.serving_load --mode asgi --concurrency 1,8,32 --requests 2000
+    python -m benchmarks.serving_load --mode uvicorn --workers 1,2 \\
+        --sweep-env SOME_SETTING=1,8 --out artifacts/bench_serving.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import glob
+import itertools
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+_CLK_TCK = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+_PAGE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def load_payloads(n: int, seed: int = 0) -> list[dict]:
+    """`n` payload `{"text": ...}` campionati dai testi dei CSV in `data/`."""
+    texts = []
+    for path in sorted(
+        glob.glob(os.path.join(ROOT, "data", "**", "*.csv"), recursive=True)
+    ):
+        texts.extend(pd.read_csv(path)["text"].dropna().astype(str).tolist())
+    rnd = random.Random(seed)
+    return [{"text": t} for t in rnd.choices(texts, k=n)]
+
+
+def summarize(latencies: list[float], elapsed: float, errors: int) -> dict:
+    lat = np.asarray(latencies) * 1000
+    p50, p95, p99 = np.percentile(lat, [50, 95, 99]) if len(lat) else (0, 0, 0)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+    }
+
+
+# ----------------------------------------------------
+# Risorse del processo server (Linux /proc)
+# ----------------------------------------------------
+def _process_tree(pid: int) -> list[int]:
+    children: dict[int, list[int]] = {}
+    for stat in glob.glob("/proc/[0-9]*/stat"):
+        try:
+            with open(stat) as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            children.setdefault(int(fields[1]), []).append(int(stat.split("/")[2]))
+        except (OSError, IndexError, ValueError):
+            continue
+    tree, stack = [], [pid]
+    while stack:
+        p = stack.pop()
+        tree.append(p)
+        stack.extend(children.get(p, []))
+    return tree
+
+
+def _resources(pid: int) -> tuple[float, int]:
+    """(secondi CPU user+sys, RSS in byte) sommati sull'albero di `pid`."""
+    cpu, rss = 0.0, 0
+    for p in _process_tree(pid):
+        try:
+            with open(f"/proc/{p}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            cpu += (int(fields[11]) + int(fields[12])) / _CLK_TCK
+            rss += int(fields[21]) * _PAGE
+        except (OSError, IndexError, ValueError):
+            continue
+    return cpu, rss
+
+
+# ----------------------------------------------------
+# Generatore di carico
+# ----------------------------------------------------
+async def run_level(
+    client: httpx.AsyncClient, payloads: list[dict], concurrency: int
+) -> dict:
+    latencies: list[float] = []
+    errors = 0
+    it = iter(payloads)
+
+    async def worker():
+        nonlocal errors
+        for payload in it:
+            t0 = time.perf_counter()
+            try:
+                r = await client.post("/predict", json=payload)
+                ok = r.status_code == 200 and "error" not in r.json()
+            except httpx.HTTPError:
+                ok = False
+            latencies.append(time.perf_counter() - t0)
+            errors += not ok
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, time.perf_counter() - start, errors)
+
+
+def _measure(pid: int, coro_factory) -> dict:
+    cpu0, _ = _resources(pid)
+    t0 = time.perf_counter()
+    result = asyncio.run(coro_factory())
+    wall = time.perf_counter() - t0
+    cpu1, rss = _resources(pid)
+    result["cpu_utilization"] = (cpu1 - cpu0) / wall if wall else 0.0
+    result["rss_mb"] = rss / 2**20
+    return result
+
+
+def bench_asgi(concurrency: list[int], n: int, warmup: int) -> list[dict]:
+    from src.serving.app import app
+
+    payloads = load_payloads(n + warmup)
+    results = []
+    for c in concurrency:
+
+        async def go(c=c):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(
+                transport=transport, base_url="http://bench"
+            ) as client:
+                await run_level(client, payloads[:warmup], c)
+                return await run_level(client, payloads[warmup:], c)
+
+        results.append({"mode": "asgi", "concurrency": c, **_measure(os.getpid(), go)})
+    return results
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _start_server(workers: int, env: dict) -> tuple[subprocess.Popen, str]:
+    port = _free_port()
+    proc = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "src.serving.app:app",
+            "--host",
+            "127.0.0.1",
+            "--port",
+            str(port),
+            "--workers",
+            str(workers),
+            "--log-level",
+            "warning",
+        ],
+        cwd=ROOT,
+        env=env,
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"{url}/health", timeout=1).status_code == 200:
+                return proc, url
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError("uvicorn non è diventato ready entro 60s")
+
+
+def bench_uvicorn(
+    concurrency: list[int],
+    n: int,
+    warmup: int,
+    workers: list[int],
+    sweep: dict[str, list[str]],
+) -> list[dict]:
+    payloads = load_payloads(n + warmup)
+    results = []
+    names = list(sweep)
+    for w, values in itertools.product(workers, itertools.product(*sweep.values())):
+        settings = dict(zip(names, values))
+        env = dict(os.environ, PYTHONPATH=ROOT, **settings)
+        proc, url = _start_server(w, env)
+        try:
+            for c in concurrency:
+
+                async def go(c=c):
+                    limits = httpx.Limits(max_connections=c)
+                    async with httpx.AsyncClient(base_url=url, limits=limits) as client:
+                        await run_level(client, payloads[:warmup], c)
+                        return await run_level(client, payloads[warmup:], c)
+
+                results.append(
+                    {
+                        "mode": "uvicorn",
+                        "workers": w,
+                        "settings": settings,
+                        "concurrency": c,
+                        **_measure(proc.pid, go),
+                    }
+                )
+        finally:
+            proc.terminate()
+            proc.wait(timeout=30)
+    return results
+
+
+def _parse_sweep(items: list[str]) -> dict[str, list[str]]:
+    sweep = {}
+    for item in items:
+        name, _, values = item.partition("=")
+        sweep[name] = values.split(",")
+    return sweep
+
+
+def main(argv: list[str] | None = None) -> dict:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--mode", choices=["asgi", "uvicorn"], default="asgi")
+    ap.add_argument("--concurrency", default="1,8,32")
+    ap.add_argument("--requests", type=int, default=1000, help="richieste per livello")
+    ap.add_argument("--warmup", type=int, default=50)
+    ap.add_argument("--workers", default="1", help="solo --mode uvicorn, es. 1,2,4")
+    ap.add_argument(
+        "--sweep-env",
+        action="append",
+        default=[],
+        help="NOME=v1,v2: variabile d'ambiente del server da variare (uvicorn)",
+    )
+    ap.add_argument("--model-uri", default=None, help="MODEL_URI da servire")
+    ap.add_argument(
+        "--online", action="store_true", help="consente il download del modello HF"
+    )
+    ap.add_argument("--out", default=None, help="Path JSON per salvare i risultati")
+    args = ap.parse_args(argv)
+
+    env = {}
+    if not args.online:
+        env["HF_HUB_OFFLINE"] = "1"
+    if args.model_uri:
+        env["MODEL_URI"] = args.model_uri
+    concurrency = [int(c) for c in args.concurrency.split(",")]
+
+    # le variabili valgono solo per il benchmark: main() gira anche in-process
+    # (test), dove non devono restare impostate dopo il ritorno
+    saved = {name: os.environ.get(name) for name in env}
+    os.environ.update(env)
+    try:
+        if args.mode == "asgi":
+            sys.path.insert(0, ROOT)
+            runs = bench_asgi(concurrency, args.requests, args.warmup)
+        else:
+            runs = bench_uvicorn(
+                concurrency,
+                args.requests,
+                args.warmup,
+                [int(w) for w in args.workers.split(",")],
+                _parse_sweep(args.sweep_env),
+            )
+        model_uri = os.environ.get("MODEL_URI")
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "model_uri": model_uri,
+        "cpu_count": os.cpu_count(),
+        "runs": runs,
+    }
+    print(json.dumps(report, indent=2))
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    main()
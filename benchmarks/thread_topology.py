@@ -0,0 +1,73 @@
+"""Cerca lo split worker x thread torch migliore per il nodo corrente.
+
+Per ogni coppia di `src.serving.runtime.candidate_splits()` avvia uvicorn
+(via `benchmarks.serving_load`) con `SERVING_WORKERS`/`TORCH_NUM_THREADS`
+fissati e misura throughput e p99; sceglie lo split con throughput massimo
+tra quelli che rispettano `--p99-budget-ms` (o il p99 minimo se nessuno lo
+rispetta). Va lanciato con un modello vero (`--model-uri` o `--online`):
+con lo stub offline misura solo l'overhead HTTP.
+
+Usage:
+    python -m benchmarks.thread_topology --model-uri models:/Sentiment/Production \\
+        --concurrency 16 --requests 500 --p99-budget-ms 250 --out artifacts/topology.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+
+from benchmarks import serving_load
+from src.serving.runtime import available_cpus, candidate_splits
+
+
+def pick_best(runs: list[dict], p99_budget_ms: float | None) -> dict:
+    within = [r for r in runs if p99_budget_ms is None or r["p99_ms"] <= p99_budget_ms]
+    if within:
+        return max(within, key=lambda r: r["throughput_rps"])
+    return min(runs, key=lambda r: r["p99_ms"])
+
+
+def main(argv: list[str] | None = None) -> dict:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--requests", type=int, default=500)
+    ap.add_argument("--warmup", type=int, default=50)
+    ap.add_argument("--p99-budget-ms", type=float, default=None)
+    ap.add_argument("--pin", action="store_true", help="SERVING_PIN_CORES=1")
+    ap.add_argument("--model-uri", default=None)
+    ap.add_argument("--online", action="store_true")
+    ap.add_argument("--out", default=None)
+    args = ap.parse_args(argv)
+
+    if not args.online:
+        os.environ["HF_HUB_OFFLINE"] = "1"
+    if args.model_uri:
+        os.environ["MODEL_URI"] = args.model_uri
+
+    runs = []
+    for workers, threads in candidate_splits():
+        sweep = {
+            "SERVING_WORKERS": [str(workers)],
+            "TORCH_NUM_THREADS": [str(threads)],
+            "SERVING_PIN_CORES": ["1" if args.pin else "0"],
+        }
+        runs += serving_load.bench_uvicorn(
+            [args.concurrency], args.requests, args.warmup, [workers], sweep
+        )
+    best = pick_best(runs, args.p99_budget_ms)
+    report = {
+        "cpus": available_cpus(),
+        "best": {"workers": best["workers"], **best["settings"]},
+        "runs": runs,
+    }
+    print(json.dumps(report, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    main()
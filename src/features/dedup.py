@@ -0,0 +1,382 @@
+"""
+Deduplicazione esatta e near-duplicate dei batch in ingresso (MinHash + LSH).
+
+I testi vengono normalizzati in modo aggressivo (`normalize_texts`, minuscolo,
+prefisso `rt <USER>:` e punteggiatura rimossi), così retweet e varianti di URL
+coincidono. Testi uguali dopo la normalizzazione sono duplicati esatti (hash
+del testo); gli altri ricevono una firma MinHash sulle shingle di
+`shingle` byte e vengono confrontati, tramite LSH a `bands` bande, con i
+rappresentanti già indicizzati: sopra `threshold` di similarità di Jaccard
+stimata finiscono nello stesso cluster.
+
+L'indice è un database SQLite persistente tra le esecuzioni giornaliere:
+firme dei rappresentanti, un rappresentante per bucket LSH, hash esatti e
+conteggi per cluster. I file sono letti e scritti a chunk e le strutture in
+memoria dipendono dal chunk, non dal numero di righe indicizzate.
+
+`dedup_file` scrive una riga per cluster presente nel batch (la prima
+occorrenza) con la colonna `weight` = numero di occorrenze nel batch; con
+`drop_seen` esclude i cluster già visti in esecuzioni precedenti.
+
+Usage:
+    python -m src.features.dedup --input data/incoming/batch.csv \\
+        --output data/raw/current.csv --index data/dedup_index.sqlite
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import sqlite3
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from src.features.preprocess import normalize_texts
+from src.utils.chunks import iter_chunks
+from src.utils.tokenization import text_hash
+
+NUM_PERM = 64
+BANDS = 16
+THRESHOLD = 0.8
+SHINGLE = 5
+CHUNK_SIZE = 10000
+
+_rt = re.compile(r"^rt <user>:?\s*")
+_punct = re.compile(r"[^\w<>]+")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS docs (
+    id INTEGER PRIMARY KEY,
+    signature BLOB NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    first_run TEXT NOT NULL,
+    run TEXT NOT NULL,
+    run_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS exact (hash INTEGER PRIMARY KEY, doc INTEGER NOT NULL)
+    WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS bands (
+    band INTEGER NOT NULL, key INTEGER NOT NULL, doc INTEGER NOT NULL,
+    PRIMARY KEY (band, key)
+) WITHOUT ROWID;
+"""
+
+
+def dedup_normalize(texts: list[str]) -> list[str]:
+    """Forma usata per il confronto (non per il training)."""
+    out = []
+    for t in normalize_texts([str(t) for t in texts]):
+        t = _rt.sub("", t.lower())
+        out.append(" ".join(_punct.sub(" ", t).split()))
+    return out
+
+
+def _signed(values) -> np.ndarray:
+    """uint64 -> int64 con gli stessi bit (SQLite ha solo interi con segno)."""
+    return np.asarray(values, dtype=np.uint64).view(np.int64)
+
+
+class DedupIndex:
+    """Indice MinHash/LSH persistente su SQLite."""
+
+    def __init__(
+        self,
+        path: str,
+        num_perm: int = NUM_PERM,
+        bands: int = BANDS,
+        threshold: float = THRESHOLD,
+        shingle: int = SHINGLE,
+        seed: int = 1,
+    ):
+        if num_perm % bands:
+            raise ValueError("num_perm deve essere multiplo di bands")
+        self.path = path
+        self.threshold = threshold
+        self.shingle = shingle
+        self.bands = bands
+        self.rows = num_perm // bands
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.db = sqlite3.connect(path)
+        # un solo scrittore, commit per chunk: WAL e sync ridotto bastano
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("PRAGMA temp_store=MEMORY")
+        self.db.executescript(_SCHEMA)
+        params = {
+            "num_perm": num_perm,
+            "bands": bands,
+            "shingle": shingle,
+            "seed": seed,
+        }
+        stored = dict(self.db.execute("SELECT name, value FROM meta"))
+        if stored and stored != {k: str(v) for k, v in params.items()}:
+            raise ValueError(f"{path} creato con parametri diversi: {stored}")
+        self.db.executemany(
+            "INSERT OR IGNORE INTO meta VALUES (?, ?)",
+            [(k, str(v)) for k, v in params.items()],
+        )
+        self.db.commit()
+        # hashing multiply-shift: a dispari, (a*h + b) mod 2^64, 32 bit alti
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(0, 2**63, num_perm, dtype=np.uint64) * 2 + 1
+        self._b = rng.integers(0, 2**63, num_perm, dtype=np.uint64)
+        self._band_coef = rng.integers(0, 2**63, self.rows, dtype=np.uint64) * 2 + 1
+        self._pow = np.uint64(257) ** np.arange(shingle, dtype=np.uint64)
+        self._next_id = (
+            self.db.execute("SELECT MAX(id) FROM docs").fetchone()[0] or 0
+        ) + 1
+
+    def close(self) -> None:
+        self.db.close()
+
+    def signature(self, text: str) -> np.ndarray:
+        """Firma MinHash `(num_perm,)` uint32 delle shingle di byte del testo."""
+        data = np.frombuffer(text.encode("utf-8"), dtype=np.uint8).astype(np.uint64)
+        if len(data) < self.shingle:
+            data = np.pad(data, (0, self.shingle - len(data)))
+        windows = np.lib.stride_tricks.sliding_window_view(data, self.shingle)
+        h = np.unique((windows * self._pow).sum(axis=1))
+        h = (h >> np.uint64(32)) ^ (h & np.uint64(0xFFFFFFFF))
+        perm = (self._a[:, None] * h[None, :] + self._b[:, None]) >> np.uint64(32)
+        return perm.min(axis=1).astype(np.uint32)
+
+    def band_keys(self, sig: np.ndarray) -> np.ndarray:
+        bands = sig.astype(np.uint64).reshape(self.bands, self.rows)
+        return _signed((bands * self._band_coef).sum(axis=1))
+
+    def _query(self, sql: str, values: list, width: int = 1, params=()) -> list:
+        """`sql` in join con la tabella temporanea `q` dei valori (colonne
+        `c0`, `c1`, ...): niente liste `IN (...)` lunghe quanto il chunk."""
+        self.db.execute("DROP TABLE IF EXISTS temp.q")
+        cols = ", ".join(f"c{i}" for i in range(width))
+        self.db.execute(f"CREATE TEMP TABLE q ({cols})")
+        self.db.executemany(
+            f"INSERT INTO q VALUES ({', '.join('?' * width)})",
+            values if width > 1 else [(v,) for v in values],
+        )
+        return self.db.execute(sql, params).fetchall()
+
+    def process(self, texts: list[str], run: str) -> dict:
+        """Assegna ogni testo a un cluster e aggiorna l'indice.
+
+        Ritorna array per riga: `doc` (id del cluster), `first` (prima
+        occorrenza del cluster nel run), `seen` (cluster di run precedenti),
+        `kind` (0 nuovo, 1 duplicato esatto, 2 near-duplicate).
+        """
+        norm = dedup_normalize(texts)
+        hashes = [int(h) for h in _signed([text_hash(t) for t in norm])]
+        known = dict(
+            self._query(
+                "SELECT e.hash, e.doc FROM exact e JOIN q ON e.hash = q.c0",
+                list(set(hashes)),
+            )
+        )
+        todo = {h: t for h, t in zip(hashes, norm) if h not in known}
+        sigs = {h: self.signature(t) for h, t in todo.items()}
+        keys = {h: self.band_keys(s) for h, s in sigs.items()}
+        candidates: dict = {}
+        rows = [(h, b, int(k)) for h, ks in keys.items() for b, k in enumerate(ks)]
+        for h, doc in self._query(
+            "SELECT q.c0, b.doc FROM q JOIN bands b ON b.band = q.c1 AND b.key = q.c2",
+            rows,
+            width=3,
+        ):
+            candidates.setdefault(h, set()).add(doc)
+        doc_sigs = {
+            doc: np.frombuffer(blob, dtype=np.uint32)
+            for doc, blob in self._query(
+                "SELECT d.id, d.signature FROM docs d JOIN q ON d.id = q.c0",
+                list({d for ds in candidates.values() for d in ds}),
+            )
+        }
+
+        n = len(texts)
+        docs = np.empty(n, dtype=np.int64)
+        kind = np.zeros(n, dtype=np.int8)
+        local_exact: dict = {}
+        local_buckets: dict = {}
+        new_docs = []
+        for i, h in enumerate(hashes):
+            if h in known or h in local_exact:
+                docs[i] = known.get(h, local_exact.get(h))
+                kind[i] = 1
+                continue
+            sig = sigs[h]
+            cands = set(candidates.get(h, ()))
+            cands.update(
+                local_buckets[b, int(k)]
+                for b, k in enumerate(keys[h])
+                if (b, int(k)) in local_buckets
+            )
+            best, best_sim = None, self.threshold
+            for doc in cands:
+                sim = float((doc_sigs[doc] == sig).mean())
+                if sim >= best_sim:
+                    best, best_sim = doc, sim
+            if best is None:
+                best = self._next_id
+                self._next_id += 1
+                doc_sigs[best] = sig
+                new_docs.append(best)
+                for b, k in enumerate(keys[h]):
+                    local_buckets.setdefault((b, int(k)), best)
+            else:
+                kind[i] = 2
+            docs[i] = local_exact[h] = best
+
+        self.db.executemany(
+            "INSERT INTO docs (id, signature, first_run, run) VALUES (?, ?, ?, '')",
+            [(d, doc_sigs[d].tobytes(), run) for d in new_docs],
+        )
+        self.db.executemany(
+            "INSERT OR IGNORE INTO bands VALUES (?, ?, ?)",
+            # in ordine di chiave primaria: inserimenti sequenziali nel B-tree
+            sorted((b, k, d) for (b, k), d in local_buckets.items()),
+        )
+        self.db.executemany(
+            "INSERT OR IGNORE INTO exact VALUES (?, ?)", list(local_exact.items())
+        )
+        uniq, first_idx, inverse, counts = np.unique(
+            docs, return_index=True, return_inverse=True, return_counts=True
+        )
+        prior = {
+            doc: (first_run != run, doc_run != run)
+            for doc, first_run, doc_run in self._query(
+                "SELECT d.id, d.first_run, d.run FROM docs d JOIN q ON d.id = q.c0",
+                uniq.tolist(),
+            )
+        }
+        old, fresh = np.array([prior[d] for d in uniq.tolist()], dtype=bool).T
+        first = np.zeros(n, dtype=bool)
+        first[first_idx[fresh]] = True
+        seen = old[inverse]
+        self.db.executemany(
+            "UPDATE docs SET count = count + ?,"
+            " run_count = CASE WHEN run = ? THEN run_count + ? ELSE ? END,"
+            " run = ? WHERE id = ?",
+            [(c, run, c, c, run, d) for d, c in zip(uniq.tolist(), counts.tolist())],
+        )
+        self.db.commit()
+        return {"doc": docs, "first": first, "seen": seen, "kind": kind}
+
+    def reset_run(self, run: str) -> int:
+        """Annulla i conteggi di un'esecuzione precedente (o interrotta) con lo
+        stesso id, così rieseguire `run` dà lo stesso risultato. I cluster
+        restano nell'indice; quelli già ripresi da un run successivo non sono
+        più attribuibili a `run` e non vengono toccati."""
+        reset = self.db.execute(
+            "UPDATE docs SET count = count - run_count, run = '', run_count = 0"
+            " WHERE run = ?",
+            (run,),
+        ).rowcount
+        self.db.commit()
+        return reset
+
+    def run_counts(self, docs: list, run: str) -> dict:
+        """Occorrenze nel run `run` dei cluster `docs`."""
+        return dict(
+            self._query(
+                "SELECT d.id, d.run_count FROM docs d JOIN q ON d.id = q.c0"
+                " WHERE d.run = ?",
+                list(docs),
+                params=(run,),
+            )
+        )
+
+    def size(self) -> int:
+        return self.db.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+
+def _append(df: pd.DataFrame, path: str) -> None:
+    df.to_csv(path, mode="a", header=not os.path.exists(path), index=False)
+
+
+def dedup_file(
+    input_path: str,
+    output_path: str,
+    index_path: str,
+    run: str | None = None,
+    text_column: str = "text",
+    drop_seen: bool = False,
+    chunksize: int = CHUNK_SIZE,
+    **index_kwargs,
+) -> dict:
+    """Scrive in `output_path` (CSV) il batch deduplicato con colonna `weight`.
+
+    Due passate a chunk: la prima assegna i cluster e tiene le prime
+    occorrenze, la seconda aggiunge i pesi finali del run dall'indice.
+    `output_path` può coincidere con `input_path`. Rieseguire con lo stesso
+    `run` (retry del task) dà lo stesso output e non raddoppia i conteggi.
+    """
+    run = run or uuid.uuid4().hex
+    index = DedupIndex(index_path, **index_kwargs)
+    # retry del task con lo stesso run: si riparte da zero, non dal "già visto"
+    index.reset_run(run)
+    stage = f"{output_path}.stage-{os.getpid()}"
+    tmp = f"{output_path}.tmp-{os.getpid()}"
+    stats = {"run": run, "rows": 0, "exact_duplicates": 0, "near_duplicates": 0}
+    stats["seen_before"] = 0
+    try:
+        for chunk in iter_chunks(input_path, chunksize, columns=None):
+            texts = chunk[text_column].fillna("").astype(str).tolist()
+            res = index.process(texts, run)
+            stats["rows"] += len(texts)
+            stats["exact_duplicates"] += int((res["kind"] == 1).sum())
+            stats["near_duplicates"] += int((res["kind"] == 2).sum())
+            keep = res["first"] & ~(res["seen"] & drop_seen)
+            stats["seen_before"] += int((res["first"] & res["seen"]).sum())
+            out = chunk[keep].assign(_doc=res["doc"][keep])
+            _append(out, stage)
+        stats["output_rows"] = 0
+        if os.path.exists(stage):
+            for chunk in pd.read_csv(stage, chunksize=chunksize):
+                weights = index.run_counts(chunk["_doc"].tolist(), run)
+                chunk["weight"] = chunk["_doc"].map(weights).astype(int)
+                _append(chunk.drop(columns="_doc"), tmp)
+                stats["output_rows"] += len(chunk)
+        if not os.path.exists(tmp):  # batch vuoto
+            pd.DataFrame(columns=[text_column, "weight"]).to_csv(tmp, index=False)
+        os.replace(tmp, output_path)
+        stats["index_docs"] = index.size()
+    finally:
+        index.close()
+        for path in (stage, tmp):
+            if os.path.exists(path):
+                os.remove(path)
+    return stats
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--input", required=True, help="CSV, Parquet o JSONL")
+    ap.add_argument("--output", required=True, help="CSV deduplicato con `weight`")
+    ap.add_argument("--index", default="data/dedup_index.sqlite")
+    ap.add_argument("--run", default=None, help="Id dell'esecuzione (default uuid)")
+    ap.add_argument("--text_column", default="text")
+    ap.add_argument("--threshold", type=float, default=THRESHOLD)
+    ap.add_argument(
+        "--drop_seen",
+        action="store_true",
+        help="Esclude i cluster già visti in esecuzioni precedenti",
+    )
+    args = ap.parse_args(argv)
+    stats = dedup_file(
+        args.input,
+        args.output,
+        args.index,
+        run=args.run,
+        text_column=args.text_column,
+        drop_seen=args.drop_seen,
+        threshold=args.threshold,
+    )
+    print(json.dumps(stats, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,10 +1,27 @@
 import re
+from concurrent.futures import ProcessPoolExecutor
 
 _url = re.compile(r"https?://\S+")
 _mention = re.compile(r"@[A-Za-z0-9_]+")
 _hashtag = re.compile(r"#[\w_]+")
 _whitespace = re.compile(r"\s+")
 
+# Le quattro sostituzioni di `normalize_text` fuse in un'unica scansione.
+# Mention e hashtag si fermano dove inizierebbe un URL (nella versione a passi
+# l'URL viene sostituito per primo); per gli spazi si riscrivono solo le
+# sequenze che cambiano davvero (2+ spazi o spazi diversi da " ").
+_fused = re.compile(
+    r"(?P<url>https?://\S+)"
+    r"|(?P<user>@(?:(?!https?://\S)[A-Za-z0-9_])+)"
+    r"|#(?P<tag>(?:(?!https?://\S)\w)+)"
+    r"|(?P<ws>\s{2,}|[^\S ])"
+)
+_FUSED_REPL = {"url": "<URL>", "user": "<USER>", "ws": " "}
+
+# sotto questa soglia (testi distinti) il process pool costa più di quanto fa
+# risparmiare
+PARALLEL_MIN_ITEMS = 50_000
+
 
 def normalize_text(text: str) -> str:
     """Sostituzioni leggere e conservative per social text."""
@@ -14,3 +31,51 @@ def normalize_text(text: str) -> str:
     t = _hashtag.sub(lambda m: m.group(0)[1:], t)  # drop '#'
     t = _whitespace.sub(" ", t)
     return t
+
+
+def _fused_repl(m: re.Match) -> str:
+    kind = m.lastgroup
+    return m.group("tag") if kind == "tag" else _FUSED_REPL[kind]
+
+
+def _normalize_chunk(texts: list) -> list:
+    sub = _fused.sub
+    return [sub(_fused_repl, t.strip()) for t in texts]
+
+
+def _normalize_unique(uniques: list, n_jobs: int) -> list:
+    if n_jobs <= 1 or len(uniques) < PARALLEL_MIN_ITEMS:
+        return _normalize_chunk(uniques)
+    size = -(-len(uniques) // n_jobs)
+    chunks = [uniques[i : i + size] for i in range(0, len(uniques), size)]
+    with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+        return [t for part in pool.map(_normalize_chunk, chunks) for t in part]
+
+
+def normalize_texts(texts, n_jobs: int = 1):
+    """Versione batch di `normalize_text`, con output identico elemento per elemento.
+
+    Accetta una `pandas.Series`, un array/ChunkedArray di stringhe Arrow o una
+    lista, e ritorna lo stesso tipo (i null restano null). Ogni testo distinto
+    viene normalizzato una sola volta (retweet e duplicati sono frequenti) con
+    un'unica scansione regex; con `n_jobs > 1` e molti testi distinti il lavoro
+    è distribuito su un process pool.
+    """
+    module = type(texts).__module__.split(".")[0]
+    if module == "pandas":
+        import pandas as pd
+
+        codes, uniques = pd.factorize(texts, use_na_sentinel=True)
+        normalized = _normalize_unique(list(uniques), n_jobs)
+        values = pd.Series(normalized + [None], dtype=object).to_numpy()[codes]
+        return pd.Series(values, index=texts.index, name=texts.name, dtype=object)
+    if module == "pyarrow":
+        import pyarrow as pa
+
+        values = normalize_texts(texts.to_pylist(), n_jobs)
+        return pa.array(values, type=pa.string())
+
+    values = list(texts)
+    uniques = list(dict.fromkeys(t for t in values if t is not None))
+    lookup = dict(zip(uniques, _normalize_unique(uniques, n_jobs)))
+    return [None if t is None else lookup[t] for t in values]
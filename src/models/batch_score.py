@@ -0,0 +1,267 @@
+"""
+Scoring offline di un corpus con un modello registrato (default Production).
+
+L'input (CSV, Parquet o JSONL con colonna `text`) viene letto a shard di
+`--shard_size` righe e gli shard sono distribuiti a un pool di `--workers`
+processi; ogni processo carica il modello una volta sola e predice lo shard
+a batch di `--batch_size` testi. Lo shard `i` finisce in
+`<out>/part-<i>.<formato>` con le colonne originali più `label` e `score`,
+scritto in modo atomico e seguito dal marker `part-<i>.done` (righe, secondi,
+processo): rilanciando lo stesso comando gli shard completati vengono saltati.
+`_manifest.json` fissa input (percorso e SHA-1 del contenuto), modello e
+dimensione degli shard, così un resume con parametri diversi, o dopo che il
+file di input è stato riscritto, non mescola partizioni incompatibili.
+
+Alla fine stampa (e salva in `_report.json`) righe/s per worker e complessive.
+
+Usage:
+    python -m src.models.batch_score --input data/corpus.parquet \\
+        --out artifacts/scores --workers 4
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import get_context
+
+import mlflow
+import mlflow.pyfunc
+import numpy as np
+import pandas as pd
+
+from src.utils.chunks import iter_chunks
+from src.utils.labels import decode_labels, encode_labels
+from src.utils.mlflow_utils import REGISTERED_NAME, registry
+from src.utils.tokenization import file_digest
+
+SHARD_SIZE = 50000
+BATCH_SIZE = 256
+FORMATS = ("parquet", "csv", "jsonl")
+
+# modello del processo worker, caricato da `_init_worker`
+_model = None
+
+
+def _init_worker(model_uri: str, tracking_uri: str | None, threads: int) -> None:
+    global _model
+    if tracking_uri:
+        mlflow.set_tracking_uri(tracking_uri)
+    _model = mlflow.pyfunc.load_model(model_uri)
+    if "torch" in sys.modules:  # core divisi tra i worker, niente oversubscription
+        sys.modules["torch"].set_num_threads(threads)
+
+
+def production_version_uri(model_name: str = REGISTERED_NAME) -> str | None:
+    """URI della versione Production corrente (non dello stage): un resume
+    dopo una promozione non mescola le predizioni di due versioni."""
+    version = registry().stage_version(model_name, "Production")
+    return f"models:/{model_name}/{version.version}" if version else None
+
+
+def labels_and_scores(outputs) -> tuple[np.ndarray, np.ndarray]:
+    """Output pyfunc -> (etichette canoniche, score); score NaN se il modello
+    restituisce solo l'etichetta (es. sklearn)."""
+    if isinstance(outputs, np.ndarray) and outputs.dtype.kind != "O":
+        outputs = outputs.tolist()
+    raw = [o["label"] if isinstance(o, dict) else o for o in outputs]
+    scores = np.array(
+        [
+            float(o.get("score", np.nan)) if isinstance(o, dict) else np.nan
+            for o in outputs
+        ]
+    )
+    return decode_labels(encode_labels(raw)), scores
+
+
+def _part(out_dir: str, shard: int, ext: str) -> str:
+    return os.path.join(out_dir, f"part-{shard:05d}.{ext}")
+
+
+def _write(df: pd.DataFrame, path: str, fmt: str) -> None:
+    tmp = f"{path}.tmp-{os.getpid()}"
+    if fmt == "parquet":
+        df.to_parquet(tmp, index=False)
+    elif fmt == "jsonl":
+        df.to_json(tmp, orient="records", lines=True, force_ascii=False)
+    else:
+        df.to_csv(tmp, index=False)
+    os.replace(tmp, path)
+
+
+def score_shard(
+    shard: int,
+    chunk: pd.DataFrame,
+    out_dir: str,
+    fmt: str = "parquet",
+    text_column: str = "text",
+    batch_size: int = BATCH_SIZE,
+    model=None,
+) -> dict:
+    """Predice uno shard, scrive la partizione e poi il marker `.done`."""
+    model = model or _model
+    start = time.perf_counter()
+    texts = chunk[text_column].fillna("").astype(str).tolist()
+    labels, scores = [], []
+    for i in range(0, len(texts), batch_size):
+        lab, sc = labels_and_scores(model.predict(texts[i : i + batch_size]))
+        labels.append(lab)
+        scores.append(sc)
+    out = chunk.reset_index(drop=True)
+    out["label"] = np.concatenate(labels) if labels else []
+    out["score"] = np.concatenate(scores) if scores else []
+    _write(out, _part(out_dir, shard, fmt), fmt)
+    done = {
+        "shard": shard,
+        "rows": len(out),
+        "seconds": round(time.perf_counter() - start, 4),
+        "pid": os.getpid(),
+    }
+    with open(_part(out_dir, shard, "done"), "w") as f:
+        json.dump(done, f)
+    return done
+
+
+def _manifest(
+    input_path: str, model_uri: str, shard_size: int, text_column: str, fmt: str
+) -> dict:
+    return {
+        "input": os.path.abspath(input_path),
+        # stesso percorso ma contenuto nuovo: i marker `.done` non valgono più
+        "input_sha1": file_digest(input_path),
+        "model_uri": model_uri,
+        "shard_size": shard_size,
+        "text_column": text_column,
+        "format": fmt,
+    }
+
+
+def _check_manifest(out_dir: str, manifest: dict) -> None:
+    path = os.path.join(out_dir, "_manifest.json")
+    if os.path.exists(path):
+        with open(path) as f:
+            previous = json.load(f)
+        if previous != manifest:
+            raise ValueError(
+                f"{out_dir} contiene uno scoring con parametri diversi: "
+                f"{previous} (usa un'altra --out o rimuovila)"
+            )
+        return
+    with open(path, "w") as f:
+        json.dump(manifest, f, indent=2)
+
+
+def _summary(results: list, wall_seconds: float, skipped: int) -> dict:
+    workers: dict = {}
+    for r in results:
+        w = workers.setdefault(r["pid"], {"shards": 0, "rows": 0, "seconds": 0.0})
+        w["shards"] += 1
+        w["rows"] += r["rows"]
+        w["seconds"] += r["seconds"]
+    for w in workers.values():
+        w["seconds"] = round(w["seconds"], 3)
+        w["rows_per_sec"] = round(w["rows"] / w["seconds"], 1) if w["seconds"] else None
+    rows = sum(r["rows"] for r in results)
+    return {
+        "shards_scored": len(results),
+        "shards_skipped": skipped,
+        "rows": rows,
+        "wall_seconds": round(wall_seconds, 3),
+        "rows_per_sec": round(rows / wall_seconds, 1) if wall_seconds else None,
+        "workers": {str(pid): w for pid, w in workers.items()},
+    }
+
+
+def batch_score(
+    input_path: str,
+    out_dir: str,
+    model_uri: str | None = None,
+    workers: int = 1,
+    shard_size: int = SHARD_SIZE,
+    batch_size: int = BATCH_SIZE,
+    fmt: str = "parquet",
+    text_column: str = "text",
+) -> dict:
+    """Scoring sharded e riprendibile di `input_path` in `out_dir`."""
+    if fmt not in FORMATS:
+        raise ValueError(f"formato {fmt!r} non supportato: {FORMATS}")
+    model_uri = model_uri or production_version_uri()
+    if not model_uri:
+        raise RuntimeError(f"Nessun modello Production per {REGISTERED_NAME}")
+    os.makedirs(out_dir, exist_ok=True)
+    _check_manifest(
+        out_dir, _manifest(input_path, model_uri, shard_size, text_column, fmt)
+    )
+
+    start = time.perf_counter()
+    results, skipped = [], 0
+    # lo stesso pool anche con un worker: il modello è caricato in un processo
+    # separato come negli altri casi
+    with ProcessPoolExecutor(
+        max(1, workers),
+        mp_context=get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(
+            model_uri,
+            mlflow.get_tracking_uri(),
+            max(1, (os.cpu_count() or 1) // max(1, workers)),
+        ),
+    ) as pool:
+        pending: set = set()
+        for shard, chunk in enumerate(
+            iter_chunks(input_path, shard_size, columns=None)
+        ):
+            if os.path.exists(_part(out_dir, shard, "done")):
+                skipped += 1
+                continue
+            # al massimo due shard in coda per worker: memoria limitata
+            if len(pending) >= 2 * max(1, workers):
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                results.extend(f.result() for f in finished)
+            pending.add(
+                pool.submit(
+                    score_shard, shard, chunk, out_dir, fmt, text_column, batch_size
+                )
+            )
+        results.extend(f.result() for f in pending)
+
+    report = _summary(results, time.perf_counter() - start, skipped)
+    report["model_uri"] = model_uri
+    with open(os.path.join(out_dir, "_report.json"), "w") as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--input", required=True, help="CSV, Parquet o JSONL")
+    ap.add_argument("--out", required=True, help="Directory delle partizioni")
+    ap.add_argument(
+        "--model_uri", default=None, help="Default: Production del modello registrato"
+    )
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--shard_size", type=int, default=SHARD_SIZE)
+    ap.add_argument("--batch_size", type=int, default=BATCH_SIZE)
+    ap.add_argument("--format", choices=FORMATS, default="parquet")
+    ap.add_argument("--text_column", default="text")
+    args = ap.parse_args(argv)
+    report = batch_score(
+        args.input,
+        args.out,
+        model_uri=args.model_uri,
+        workers=args.workers,
+        shard_size=args.shard_size,
+        batch_size=args.batch_size,
+        fmt=args.format,
+        text_column=args.text_column,
+    )
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,263 @@
+"""
+Distillazione del teacher RoBERTa in uno student TF-IDF + regressione logistica.
+
+Il teacher (`HFTextClassifier`, ~125M parametri) etichetta a batch un corpus
+non etichettato (CSV/JSONL con colonna `text`: `data/incoming`, traffico
+loggato, ...) con distribuzioni di probabilità ammorbidite da `temperature`.
+Lo student impara quelle soft label: ogni testo compare una volta per classe
+con peso pari alla probabilità del teacher, così la log-loss pesata coincide
+con la cross-entropy verso la distribuzione del teacher.
+
+Lo student viene registrato in MLflow come pyfunc con lo stesso schema di
+output del teacher (`[{"label", "score"}]`), quindi è servibile con
+`MODEL_URI` o come alias in `SERVING_MODELS`. Il report accuracy/latenza
+contro il teacher su `holdout.csv` finisce nel run e, con `--report`, su file.
+
+Nota: al posto di pochi layer transformer o di una CNN/BiLSTM si usa il
+modello lineare già adottato da `train_smoke`: si addestra in secondi su CPU
+e ha latenza per testo di qualche decina di microsecondi.
+
+Usage:
+    python -m src.models.distill --unlabeled "data/incoming/*.csv" \\
+        --holdout_csv data/holdout.csv --report artifacts/distill_report.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import glob
+import json
+import os
+import tempfile
+import time
+
+import joblib
+import mlflow
+import mlflow.pyfunc
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import accuracy_score, f1_score
+from sklearn.pipeline import Pipeline
+
+from src.utils.labels import decode_labels, encode_labels
+from src.utils.mlflow_utils import REGISTERED_NAME, get_or_create_experiment, registry
+
+STUDENT_SUFFIX = "-student"
+
+
+class StudentClassifier(mlflow.pyfunc.PythonModel):
+    """Pyfunc drop-in: stesso output di `HFTextClassifier`."""
+
+    def __init__(self, pipeline=None):
+        self.pipeline = pipeline
+
+    def load_context(self, context):
+        self.pipeline = joblib.load(context.artifacts["student"])
+
+    def predict_proba(self, texts) -> np.ndarray:
+        return self.pipeline.predict_proba([str(t) for t in texts])
+
+    def predict(self, context, model_input):
+        probs = self.predict_proba(list(model_input))
+        codes = probs.argmax(axis=-1)
+        scores = probs[np.arange(len(probs)), codes]
+        return [
+            {"label": label, "score": float(score)}
+            for label, score in zip(decode_labels(codes).tolist(), scores)
+        ]
+
+
+def load_texts(patterns: list[str], max_texts: int | None = None) -> list[str]:
+    """Testi unici dai file CSV/JSONL che corrispondono ai glob `patterns`."""
+    frames = []
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)):
+            if path.endswith((".jsonl", ".json")):
+                df = pd.read_json(path, lines=path.endswith(".jsonl"))
+            else:
+                df = pd.read_csv(path)
+            if "text" in df.columns:
+                frames.append(df["text"])
+    if not frames:
+        raise FileNotFoundError(f"Nessun testo trovato in {patterns}")
+    texts = pd.concat(frames).dropna().astype(str).str.strip()
+    texts = texts[texts != ""].drop_duplicates()
+    if max_texts:
+        texts = texts.head(max_texts)
+    return texts.tolist()
+
+
+def load_teacher():
+    from src.models.train_roberta import HFTextClassifier
+
+    teacher = HFTextClassifier()
+    teacher.load_context(None)
+    return teacher
+
+
+def train_student(
+    texts: list[str], soft_labels: np.ndarray, max_features: int = 50000
+) -> Pipeline:
+    """TF-IDF + regressione logistica multinomiale sulle soft label."""
+    n, k = soft_labels.shape
+    pipeline = Pipeline(
+        [
+            (
+                "tfidf",
+                TfidfVectorizer(
+                    ngram_range=(1, 2), max_features=max_features, sublinear_tf=True
+                ),
+            ),
+            ("clf", LogisticRegression(max_iter=1000, C=10.0)),
+        ]
+    )
+    # ogni testo ripetuto per classe, pesato con la probabilità del teacher
+    # (peso minimo > 0: lbfgs non accetta righe a peso nullo in modo stabile)
+    weights = np.maximum(soft_labels.T.ravel(), 1e-6)
+    pipeline.fit(
+        list(texts) * k,
+        np.repeat(np.arange(k), n),
+        clf__sample_weight=weights,
+    )
+    return pipeline
+
+
+def _timed(fn, texts: list[str]) -> tuple[np.ndarray, float]:
+    start = time.perf_counter()
+    probs = fn(texts)
+    return probs, (time.perf_counter() - start) / max(len(texts), 1) * 1000
+
+
+def compare(teacher, student: StudentClassifier, holdout_csv: str) -> dict:
+    """Accuracy, macro-F1 e ms/testo di teacher e student sull'holdout."""
+    df = pd.read_csv(holdout_csv)
+    texts = df["text"].astype(str).tolist()
+    y_true = encode_labels(df["label"].to_numpy())
+    report = {"holdout": holdout_csv, "n": len(texts)}
+    preds = {}
+    for name, model in (("teacher", teacher), ("student", student)):
+        probs, ms = _timed(model.predict_proba, texts)
+        preds[name] = probs.argmax(axis=-1)
+        report[name] = {
+            "accuracy": round(accuracy_score(y_true, preds[name]), 4),
+            "macro_f1": round(f1_score(y_true, preds[name], average="macro"), 4),
+            "ms_per_text": round(ms, 4),
+        }
+    report["agreement"] = round(float((preds["teacher"] == preds["student"]).mean()), 4)
+    report["speedup"] = (
+        round(report["teacher"]["ms_per_text"] / report["student"]["ms_per_text"], 1)
+        if report["student"]["ms_per_text"]
+        else None
+    )
+    return report
+
+
+def distill(
+    unlabeled: list[str],
+    holdout_csv: str,
+    experiment: str = "sentiment",
+    temperature: float = 2.0,
+    max_texts: int | None = None,
+    registered_name: str = REGISTERED_NAME + STUDENT_SUFFIX,
+    report_path: str | None = None,
+    teacher=None,
+) -> dict:
+    """Soft label dal teacher, training dello student, report e registrazione.
+
+    `teacher` serve ai test: qualsiasi oggetto con `predict_proba(texts,
+    temperature=...)`; di default il RoBERTa di `train_roberta`.
+    """
+    texts = load_texts(unlabeled, max_texts)
+    teacher = teacher or load_teacher()
+    start = time.perf_counter()
+    soft = teacher.predict_proba(texts, temperature=temperature)
+    label_seconds = time.perf_counter() - start
+    print(f"[distill] {len(texts)} testi etichettati in {label_seconds:.1f}s")
+
+    start = time.perf_counter()
+    student = StudentClassifier(train_student(texts, soft))
+    train_seconds = time.perf_counter() - start
+    report = compare(teacher, student, holdout_csv)
+    report.update(
+        {
+            "unlabeled_texts": len(texts),
+            "temperature": temperature,
+            "label_seconds": round(label_seconds, 2),
+            "train_seconds": round(train_seconds, 2),
+        }
+    )
+    print(json.dumps(report, indent=2))
+    if report_path:
+        os.makedirs(os.path.dirname(os.path.abspath(report_path)), exist_ok=True)
+        with open(report_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+    get_or_create_experiment(experiment)
+    mlflow.set_experiment(experiment)
+    with tempfile.TemporaryDirectory() as tmp, mlflow.start_run() as run:
+        path = os.path.join(tmp, "student.joblib")
+        joblib.dump(student.pipeline, path)
+        mlflow.log_params(
+            {
+                "teacher": "HFTextClassifier",
+                "student": "tfidf+logreg",
+                "temperature": temperature,
+                "unlabeled_texts": len(texts),
+            }
+        )
+        for name in ("teacher", "student"):
+            for key, value in report[name].items():
+                mlflow.log_metric(f"{name}_{key}", value)
+        mlflow.log_metric("agreement", report["agreement"])
+        mlflow.log_dict(report, "distill_report.json")
+        info = mlflow.pyfunc.log_model(
+            artifact_path="model",
+            python_model=StudentClassifier(),
+            artifacts={"student": path},
+            registered_model_name=registered_name,
+        )
+    registry().invalidate(registered_name)
+
+    version = getattr(info, "registered_model_version", None)
+    return {
+        "run_id": run.info.run_id,
+        "model_name": registered_name,
+        "version": int(version) if version is not None else None,
+        "model_uri": (
+            f"models:/{registered_name}/{int(version)}" if version is not None else None
+        ),
+        "report": report,
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument(
+        "--unlabeled",
+        action="append",
+        default=None,
+        help="Glob di CSV/JSONL con colonna text (ripetibile)",
+    )
+    ap.add_argument("--holdout_csv", default="data/holdout.csv")
+    ap.add_argument("--experiment", default="sentiment")
+    ap.add_argument("--temperature", type=float, default=2.0)
+    ap.add_argument("--max_texts", type=int, default=None)
+    ap.add_argument("--registered_name", default=REGISTERED_NAME + STUDENT_SUFFIX)
+    ap.add_argument("--report", default=None, help="Path JSON del report")
+    args = ap.parse_args(argv)
+    distill(
+        args.unlabeled or ["data/incoming/*.csv", "data/raw/current.csv"],
+        args.holdout_csv,
+        experiment=args.experiment,
+        temperature=args.temperature,
+        max_texts=args.max_texts,
+        registered_name=args.registered_name,
+        report_path=args.report,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
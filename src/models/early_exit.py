@@ -0,0 +1,329 @@
+"""
+Early exit per il backend RoBERTa: teste di classificazione sui layer intermedi.
+
+Ogni testa è una regressione logistica sul token `<s>` dell'hidden state di un
+layer intermedio, addestrata a imitare la predizione del modello completo
+(self-distillation, non servono etichette). Le soglie di confidenza vengono poi
+calibrate su `holdout.csv`: per ogni layer di uscita, in ordine, la soglia più
+bassa che tiene il calo di accuracy rispetto al modello completo entro
+`max_accuracy_drop`.
+
+A inferenza (`forward_probs`) il batch attraversa i layer del encoder uno alla
+volta; a ogni layer di uscita gli esempi la cui testa supera la soglia escono
+con quella predizione, gli altri proseguono (il batch si restringe) fino alla
+testa finale del modello.
+
+Attivazione per deployment: `EARLY_EXIT_HEADS=<path .npz>` (prodotto da questo
+modulo) abilita la modalità nel path RoBERTa di serving (`load_model`) e in
+`HFTextClassifier`; senza la variabile tutto resta com'è.
+
+Usage:
+    python -m src.models.early_exit --train_csv data/raw/current.csv \\
+        --holdout_csv data/holdout.csv --out artifacts/early_exit_heads.npz
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from src.utils.labels import encode_labels, softmax
+
+EARLY_EXIT_HEADS = os.getenv("EARLY_EXIT_HEADS")
+# soglie candidate della calibrazione; > 1 = uscita disattivata
+_THRESHOLDS = np.append(np.round(np.linspace(0.4, 0.99, 60), 2), 1.01)
+
+
+@dataclass
+class ExitHeads:
+    layers: list  # layer (1-based) dopo cui si può uscire
+    weights: list  # per layer: (hidden, n_classi)
+    biases: list  # per layer: (n_classi,)
+    thresholds: list = field(default_factory=list)
+    report: dict = field(default_factory=dict)
+
+    def save(self, path: str) -> str:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        arrays = {f"w{i}": w for i, w in enumerate(self.weights)}
+        arrays.update({f"b{i}": b for i, b in enumerate(self.biases)})
+        meta = {
+            "layers": self.layers,
+            "thresholds": self.thresholds,
+            "report": self.report,
+        }
+        np.savez(path, meta=np.array(json.dumps(meta)), **arrays)
+        return path
+
+    @classmethod
+    def load(cls, path: str) -> "ExitHeads":
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            n = len(meta["layers"])
+            return cls(
+                layers=meta["layers"],
+                weights=[data[f"w{i}"] for i in range(n)],
+                biases=[data[f"b{i}"] for i in range(n)],
+                thresholds=meta["thresholds"],
+                report=meta["report"],
+            )
+
+
+_heads_cache: dict = {}
+
+
+def heads_from_env() -> ExitHeads | None:
+    """Teste configurate con `EARLY_EXIT_HEADS` (caricate una volta)."""
+    path = os.getenv("EARLY_EXIT_HEADS", EARLY_EXIT_HEADS or "")
+    if not path:
+        return None
+    if path not in _heads_cache:
+        _heads_cache[path] = heads = ExitHeads.load(path)
+        _observe_calibration(heads)
+    return _heads_cache[path]
+
+
+def _observe_calibration(heads: ExitHeads) -> None:
+    try:
+        from src.serving.metrics import observe_early_exit_calibration
+    except ImportError:  # pragma: no cover - fuori dalla serving app
+        return
+    observe_early_exit_calibration(heads.report)
+
+
+def _observe_layers(layers: np.ndarray) -> None:
+    try:
+        from src.serving.metrics import observe_early_exit
+    except ImportError:  # pragma: no cover
+        return
+    observe_early_exit(layers)
+
+
+def _layers_and_mask(model, enc):
+    import torch
+
+    base = getattr(model, model.base_model_prefix)
+    mask = enc.get("attention_mask")
+    if mask is None:
+        mask = torch.ones_like(enc["input_ids"])
+    hidden = base.embeddings(input_ids=enc["input_ids"])
+    extended = base.get_extended_attention_mask(mask, enc["input_ids"].shape)
+    return base.encoder.layer, hidden, extended
+
+
+def forward_probs(model, enc, heads: ExitHeads, observe: bool = True):
+    """Probabilità `(n, n_classi)` e layer eseguiti per esempio.
+
+    `model` è un `RobertaForSequenceClassification` in eval, `enc` l'output
+    del tokenizer (`input_ids`, `attention_mask`) come tensori torch.
+    """
+    import torch
+
+    layers, hidden, extended = _layers_and_mask(model, enc)
+    n = hidden.shape[0]
+    probs = np.empty((n, model.config.num_labels))
+    executed = np.full(n, len(layers), dtype=np.int64)
+    active = torch.arange(n)
+    exits = dict(zip(heads.layers, range(len(heads.layers))))
+    with torch.no_grad():
+        for depth, layer in enumerate(layers, start=1):
+            hidden = layer(hidden, attention_mask=extended)[0]
+            j = exits.get(depth)
+            if j is None or depth == len(layers):
+                continue
+            cls = hidden[:, 0].float().numpy()
+            p = softmax(cls @ heads.weights[j] + heads.biases[j])
+            done = p.max(axis=-1) >= heads.thresholds[j]
+            if done.any():
+                idx = active[torch.from_numpy(done)].numpy()
+                probs[idx] = p[done]
+                executed[idx] = depth
+                keep = torch.from_numpy(~done)
+                active, hidden, extended = active[keep], hidden[keep], extended[keep]
+            if len(active) == 0:
+                break
+        if len(active):
+            logits = model.classifier(hidden)
+            probs[active.numpy()] = softmax(logits.float().numpy())
+    if observe:
+        _observe_layers(executed)
+    return probs, executed
+
+
+def _cls_states(model, enc, layers: list) -> tuple[list, np.ndarray]:
+    """Hidden state `<s>` dei layer richiesti e probabilità del modello completo."""
+    import torch
+
+    with torch.no_grad():
+        out = model(**enc, output_hidden_states=True)
+    states = [out.hidden_states[layer][:, 0].float().numpy() for layer in layers]
+    return states, softmax(out.logits.float().numpy())
+
+
+def _collect(model, tokenizer, texts: list, layers: list, batch_size: int):
+    states, finals = [[] for _ in layers], []
+    for i in range(0, len(texts), batch_size):
+        enc = tokenizer(
+            texts[i : i + batch_size],
+            truncation=True,
+            padding=True,
+            return_tensors="pt",
+        )
+        batch_states, final = _cls_states(model, enc, layers)
+        for acc, s in zip(states, batch_states):
+            acc.append(s)
+        finals.append(final)
+    return [np.concatenate(s) for s in states], np.concatenate(finals)
+
+
+def fit_heads(
+    model, tokenizer, texts: list, layers: list, batch_size: int = 32
+) -> ExitHeads:
+    """Teste lineari che imitano la predizione finale del modello."""
+    from sklearn.linear_model import LogisticRegression
+
+    states, final = _collect(model, tokenizer, texts, layers, batch_size)
+    target = final.argmax(axis=-1)
+    k = final.shape[1]
+    weights, biases = [], []
+    classes = np.unique(target)
+    for x in states:
+        w = np.zeros((x.shape[1], k))
+        b = np.full(k, -1e4)  # classi mai predette dal modello completo
+        if len(classes) == 1:
+            b[classes[0]] = 0.0
+        else:
+            clf = LogisticRegression(max_iter=1000).fit(x, target)
+            coef, intercept = clf.coef_, clf.intercept_
+            if len(classes) == 2:  # forma binaria: softmax su [0, w·x + b]
+                coef = np.vstack([np.zeros_like(coef), coef])
+                intercept = np.array([0.0, intercept[0]])
+            w[:, classes] = coef.T
+            b[classes] = intercept
+        weights.append(w)
+        biases.append(b)
+    return ExitHeads(layers=list(layers), weights=weights, biases=biases)
+
+
+def simulate(head_probs: list, final_probs: np.ndarray, thresholds: list, layers: list):
+    """Predizioni e layer di uscita (-1 = modello completo) con le soglie date,
+    dalle probabilità già calcolate delle teste."""
+    pred = final_probs.argmax(axis=-1)
+    executed = np.full(len(pred), -1, dtype=np.int64)
+    for p, t, layer in zip(head_probs, thresholds, layers):
+        take = (executed < 0) & (p.max(axis=-1) >= t)
+        pred = np.where(take, p.argmax(axis=-1), pred)
+        executed[take] = layer
+    return pred, executed
+
+
+def calibrate(
+    heads: ExitHeads,
+    model,
+    tokenizer,
+    texts: list,
+    labels,
+    max_accuracy_drop: float = 0.01,
+    batch_size: int = 32,
+) -> ExitHeads:
+    """Soglie per layer (in ordine) entro `max_accuracy_drop` sull'holdout."""
+    y = encode_labels(labels)
+    states, final = _collect(model, tokenizer, texts, heads.layers, batch_size)
+    head_probs = [
+        softmax(x @ w + b) for x, w, b in zip(states, heads.weights, heads.biases)
+    ]
+    n_layers = model.config.num_hidden_layers
+    acc_full = float((final.argmax(axis=-1) == y).mean())
+
+    thresholds = [float(_THRESHOLDS[-1])] * len(heads.layers)
+    for j in range(len(heads.layers)):
+        for t in _THRESHOLDS:
+            trial = thresholds[:j] + [float(t)] + thresholds[j + 1 :]
+            pred, _ = simulate(head_probs, final, trial, heads.layers)
+            if acc_full - (pred == y).mean() <= max_accuracy_drop + 1e-12:
+                thresholds = trial
+                break
+
+    pred, executed = simulate(head_probs, final, thresholds, heads.layers)
+    executed = np.where(executed < 0, n_layers, executed)
+    acc_early = float((pred == y).mean())
+    heads.thresholds = thresholds
+    heads.report = {
+        "n": int(len(y)),
+        "num_layers": n_layers,
+        "accuracy_full": round(acc_full, 4),
+        "accuracy_early_exit": round(acc_early, 4),
+        "accuracy_delta": round(acc_early - acc_full, 4),
+        "avg_layers": round(float(executed.mean()), 3),
+        "exit_rate": {
+            str(layer): round(float((executed == layer).mean()), 4)
+            for layer in heads.layers + [n_layers]
+        },
+    }
+    return heads
+
+
+def train(
+    train_csv: str,
+    holdout_csv: str,
+    out: str,
+    layers: list | None = None,
+    max_accuracy_drop: float = 0.01,
+    model=None,
+    tokenizer=None,
+) -> dict:
+    """Addestra e calibra le teste, le salva in `out` e ritorna il report."""
+    import pandas as pd
+
+    if model is None:
+        from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+        from src.models.train_roberta import MODEL_ID
+
+        tokenizer = AutoTokenizer.from_pretrained(MODEL_ID)
+        model = AutoModelForSequenceClassification.from_pretrained(MODEL_ID)
+    model.eval()
+    n_layers = model.config.num_hidden_layers
+    layers = layers or [n_layers // 4, n_layers // 2, 3 * n_layers // 4]
+
+    texts = pd.read_csv(train_csv)["text"].dropna().astype(str).tolist()
+    holdout = pd.read_csv(holdout_csv)
+    heads = fit_heads(model, tokenizer, texts, layers)
+    calibrate(
+        heads,
+        model,
+        tokenizer,
+        holdout["text"].astype(str).tolist(),
+        holdout["label"].to_numpy(),
+        max_accuracy_drop=max_accuracy_drop,
+    )
+    heads.save(out)
+    print(json.dumps({"thresholds": heads.thresholds, **heads.report}, indent=2))
+    return heads.report
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--train_csv", default="data/raw/current.csv")
+    ap.add_argument("--holdout_csv", default="data/holdout.csv")
+    ap.add_argument("--out", default="artifacts/early_exit_heads.npz")
+    ap.add_argument(
+        "--layers", default=None, help="Layer di uscita, es. 3,6,9 (default: 1/4..3/4)"
+    )
+    ap.add_argument("--max_accuracy_drop", type=float, default=0.01)
+    args = ap.parse_args(argv)
+    train(
+        args.train_csv,
+        args.holdout_csv,
+        args.out,
+        layers=[int(x) for x in args.layers.split(",")] if args.layers else None,
+        max_accuracy_drop=args.max_accuracy_drop,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,102 +1,165 @@
 import argparse
 import json
-import mlflow
-import mlflow.pyfunc
-import pandas as pd
-from sklearn.metrics import f1_score, accuracy_score
+import os
 from src.utils.mlflow_utils import (
     get_production_model_uri,
     promote_to_stage,
+    registry,
     REGISTERED_NAME,
 )
-
-_LABEL_MAP = {"LABEL_0": "negative", "LABEL_1": "neutral", "LABEL_2": "positive"}
-
-
-def _normalize(label: str) -> str:
-    if label.startswith("LABEL_"):
-        return _LABEL_MAP.get(label, label)
-    return label.lower()
-
-
-def _predict_df(model, df: pd.DataFrame) -> list[str]:
-    preds = []
-    for text in df["text"].tolist():
-        out = model.predict([text])[0]
-        # out può essere una stringa (sklearn) o un dict con "label" (transformers)
-        if isinstance(out, dict):
-            preds.append(_normalize(out["label"]))
-        else:
-            preds.append(_normalize(out))
-    return preds
+from src.utils.bootstrap import bootstrap_counts
+from src.models.stream_eval import CHUNK_SIZE, evaluate_uris
+from src.monitoring.shadow_report import read_reports
+
+
+def _registered_version(model_uri: str) -> int | None:
+    """Versione di `REGISTERED_NAME` corrispondente a `model_uri`, o `None`
+    (nessuna promozione) se l'URI indica un altro modello registrato o un
+    run/percorso mai registrato come `REGISTERED_NAME`."""
+    if model_uri.startswith("models:/"):
+        name, _, ref = model_uri[len("models:/") :].partition("/")
+        if name != REGISTERED_NAME:
+            return None
+        if ref.isdigit():
+            return int(ref)
+        version = (
+            registry().latest_version(name)
+            if ref == "latest"
+            else registry().stage_version(name, ref)
+        )
+    elif model_uri.startswith("runs:/"):
+        run_id, _, path = model_uri[len("runs:/") :].partition("/")
+        version = registry().run_version(REGISTERED_NAME, run_id, path)
+    else:
+        return None
+    return int(version.version) if version is not None else None
+
+
+def _shadow_gate(
+    summary: dict | None, min_agreement: float, min_samples: int
+) -> tuple[bool, str | None]:
+    """(ok, motivo) del controllo sul confronto online col traffico reale."""
+    if summary is None or summary["samples"] < min_samples:
+        return True, None
+    if summary["agreement_rate"] < min_agreement:
+        return False, (
+            f"agreement online {summary['agreement_rate']:.3f} < {min_agreement}"
+            f" su {summary['samples']} testi"
+        )
+    return True, None
+
+
+def _significance_gate(
+    bootstrap: dict, min_improvement: float
+) -> tuple[bool, str | None]:
+    """(ok, motivo): il miglioramento di macro-F1 deve superare `min_improvement`
+    anche nell'estremo inferiore dell'intervallo bootstrap appaiato."""
+    delta = bootstrap.get("delta_macro_f1")
+    if delta is None:  # nessun Production con cui confrontarsi
+        return True, None
+    low, high = delta["ci"]
+    if low > min_improvement:
+        return True, None
+    return False, (
+        f"delta macro-F1 {delta['value']:+.4f}, IC {1 - bootstrap['alpha']:.0%}"
+        f" [{low:+.4f}, {high:+.4f}] non supera {min_improvement}"
+    )
 
 
 def evaluate_and_maybe_promote(
-    new_model_uri: str, eval_csv: str, min_improvement: float = 0.0
+    new_model_uri: str,
+    eval_csv: str,
+    min_improvement: float = 0.0,
+    shadow_report_dir: str | None = None,
+    min_shadow_agreement: float = 0.0,
+    min_shadow_samples: int = 100,
+    n_bootstrap: int = 2000,
+    alpha: float = 0.05,
+    chunksize: int = CHUNK_SIZE,
+    workers: int = 1,
 ) -> dict:
     """
     Evaluate new model vs production and promote if better.
 
+    L'holdout è letto a chunk di `chunksize` righe (`stream_eval`): candidato
+    e Production aggiornano conteggi di confusione congiunti, quindi la
+    memoria non cresce col numero di righe; con `workers` > 1 gli shard girano
+    in processi separati e i conteggi vengono sommati.
+
+    Le predizioni dei due modelli sull'holdout vengono ricampionate insieme
+    (`paired_bootstrap`, `n_bootstrap` repliche): si promuove solo se
+    l'intervallo `1 - alpha` della differenza di macro-F1 sta tutto sopra
+    `min_improvement`, così un holdout piccolo non fa promuovere rumore.
+
+    Se `shadow_report_dir` contiene report del confronto online per
+    `new_model_uri` (`src/serving/shadow.py`) con almeno `min_shadow_samples`
+    testi, la promozione richiede anche un agreement con Production di almeno
+    `min_shadow_agreement`.
+
     Returns:
         dict with evaluation metrics: {
             "new_f1": float,
             "new_accuracy": float,
             "new_version": int,
-            "promoted": bool
+            "prod_f1": float | None,
+            "per_class": {label: {precision, recall, f1, support}},
+            "bootstrap": dict (intervalli, vedi `paired_bootstrap`),
+            "promoted": bool,
+            "shadow": dict | None
         }
     """
-    df = pd.read_csv(eval_csv)
-    y_true = df["label"].astype(str).str.lower().tolist()
-
-    # Valuta nuovo modello
-    new_model = mlflow.pyfunc.load_model(new_model_uri)
-    new_pred = _predict_df(new_model, df)
-    new_f1 = f1_score(y_true, new_pred, average="macro")
-    new_accuracy = accuracy_score(y_true, new_pred)
-
-    # Valuta production corrente (se esiste)
+    # Valuta nuovo modello e production corrente (se esiste) in un passaggio
     prod_uri = get_production_model_uri(REGISTERED_NAME)
-    if prod_uri:
-        prod_model = mlflow.pyfunc.load_model(prod_uri)
-        prod_pred = _predict_df(prod_model, df)
-        prod_f1 = f1_score(y_true, prod_pred, average="macro")
-    else:
-        prod_f1 = -1.0  # forza promozione alla prima
+    uris = [new_model_uri] + ([prod_uri] if prod_uri else [])
+    counts = evaluate_uris(uris, eval_csv, chunksize=chunksize, workers=workers)
+    new = counts.summary(0)
+    new_f1, new_accuracy = new["macro_f1"], new["accuracy"]
+    prod_f1 = counts.summary(1)["macro_f1"] if prod_uri else None
+
+    # senza Production non c'è delta: la prima versione viene promossa
+    bootstrap = bootstrap_counts(counts, n_resamples=n_bootstrap, alpha=alpha)
+    significant, significance_reason = _significance_gate(bootstrap, min_improvement)
 
     print({"new_f1": new_f1, "new_accuracy": new_accuracy, "prod_f1": prod_f1})
+    print({"bootstrap": bootstrap})
+
+    shadow = (
+        read_reports(shadow_report_dir, candidate_uri=new_model_uri)
+        if shadow_report_dir
+        else None
+    )
+    shadow_ok, shadow_reason = _shadow_gate(
+        shadow, min_shadow_agreement, min_shadow_samples
+    )
 
     promoted = False
-    version = None
-
-    if new_f1 >= prod_f1 + min_improvement:
-        # Estrai version da new_model_uri: runs:/.../model oppure models:/...
-        client = mlflow.tracking.MlflowClient()
-        # Recupera l'ultima versione registrata (quella appena loggata)
-        versions = client.get_latest_versions(REGISTERED_NAME, stages=["None"]) or []
-        if not versions:
-            # fallback: prendi la più recente tra tutte
-            allv = client.search_model_versions(f"name='{REGISTERED_NAME}'")
-            versions = sorted(allv, key=lambda v: int(v.version), reverse=True)
-        version = int(versions[0].version)
+    # Versione del nuovo modello (`models:/<nome>/<n>`, o quella registrata
+    # dal run di `runs:/...`); serve anche senza promozione per il log delle
+    # metriche. Mai l'ultima versione "a caso": un URI di un altro modello non
+    # promuove nulla
+    version = _registered_version(new_model_uri)
+
+    if significant and shadow_ok and version is not None:
         promote_to_stage(REGISTERED_NAME, version, stage="Production")
         promoted = True
         print(f"Promosso {REGISTERED_NAME} v{version} → Production")
     else:
-        print("Nessuna promozione: nuovo modello non migliora.")
-        # Comunque ritorna la versione per il log delle metriche
-        client = mlflow.tracking.MlflowClient()
-        versions = client.get_latest_versions(REGISTERED_NAME, stages=["None"]) or []
-        if not versions:
-            allv = client.search_model_versions(f"name='{REGISTERED_NAME}'")
-            versions = sorted(allv, key=lambda v: int(v.version), reverse=True)
-        if versions:
-            version = int(versions[0].version)
+        reason = (
+            significance_reason
+            or shadow_reason
+            or f"{new_model_uri} non è una versione registrata di {REGISTERED_NAME}"
+        )
+        print(f"Nessuna promozione: {reason}")
 
     return {
         "new_f1": round(new_f1, 4),
         "new_accuracy": round(new_accuracy, 4),
         "new_version": version,
+        "prod_f1": round(prod_f1, 4) if prod_f1 is not None else None,
+        "per_class": new["per_class"],
+        "bootstrap": bootstrap,
         "promoted": promoted,
+        "shadow": shadow,
     }
 
 
@@ -109,6 +172,25 @@ if __name__ == "__main__":
     )
     ap.add_argument("--eval_csv", required=True, help="CSV con colonne: text,label")
     ap.add_argument("--min_improvement", type=float, default=0.0)
+    ap.add_argument(
+        "--shadow_report_dir",
+        default=None,
+        help="Directory dei report shadow della serving app (opzionale)",
+    )
+    ap.add_argument(
+        "--min_shadow_agreement",
+        type=float,
+        default=float(os.getenv("MIN_SHADOW_AGREEMENT", "0")),
+    )
+    ap.add_argument("--min_shadow_samples", type=int, default=100)
+    ap.add_argument("--n_bootstrap", type=int, default=2000)
+    ap.add_argument(
+        "--alpha", type=float, default=0.05, help="1 - livello di confidenza"
+    )
+    ap.add_argument("--chunksize", type=int, default=CHUNK_SIZE)
+    ap.add_argument(
+        "--workers", type=int, default=1, help="Processi di valutazione (shard)"
+    )
     ap.add_argument(
         "--metrics_output",
         default=None,
@@ -117,7 +199,16 @@ if __name__ == "__main__":
     args = ap.parse_args()
 
     metrics = evaluate_and_maybe_promote(
-        args.new_model_uri, args.eval_csv, args.min_improvement
+        args.new_model_uri,
+        args.eval_csv,
+        args.min_improvement,
+        shadow_report_dir=args.shadow_report_dir,
+        min_shadow_agreement=args.min_shadow_agreement,
+        min_shadow_samples=args.min_shadow_samples,
+        n_bootstrap=args.n_bootstrap,
+        alpha=args.alpha,
+        chunksize=args.chunksize,
+        workers=args.workers,
     )
 
     # Stampa le metriche in JSON per cattura dal DAG
@@ -0,0 +1,172 @@
+"""
+Valutazione out-of-core: il set etichettato (CSV, Parquet o JSONL con colonne
+`text,label`) viene letto a chunk e ogni chunk aggiorna i conteggi congiunti
+(`ConfusionCounts`) di vero e predizioni dei modelli; la memoria dipende dalla
+dimensione del chunk, non dal numero di righe. Macro-F1, accuracy, metriche per
+classe e bootstrap appaiato derivano dai conteggi.
+
+Sharding: lo shard `i` di `n` valuta i chunk con indice `% n == i`. Con
+`--workers N` gli shard girano in N processi sulla stessa macchina e i conteggi
+parziali vengono sommati; con `--shard/--num_shards --out` ogni job (anche su
+macchine diverse) salva i suoi conteggi e `--merge` li unisce.
+
+Usage:
+    python -m src.models.stream_eval --model_uri models:/Sentiment/Production \\
+        --eval_csv data/holdout.csv --workers 4
+    python -m src.models.stream_eval --model_uri ... --eval_csv ... \\
+        --shard 0 --num_shards 8 --out counts-0.npy
+    python -m src.models.stream_eval --merge counts-*.npy
+"""
+
+from __future__ import annotations
+
+import argparse
+import glob
+import json
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import mlflow
+import mlflow.pyfunc
+import numpy as np
+
+from src.utils.bootstrap import ConfusionCounts, bootstrap_counts
+from src.utils.chunks import CHUNK_SIZE, iter_chunks
+from src.utils.labels import encode_labels, labels_from_outputs
+from src.utils.tokenization import token_cache
+
+
+def predict_codes(model, texts: list[str]) -> np.ndarray:
+    """Predice i testi in una chiamata e ritorna i codici etichetta."""
+    # gli output possono essere stringhe (sklearn) o dict con "label" (transformers)
+    return labels_from_outputs(model.predict(texts))
+
+
+def evaluate_stream(
+    models: list,
+    path: str,
+    chunksize: int = CHUNK_SIZE,
+    shard: int = 0,
+    num_shards: int = 1,
+) -> ConfusionCounts:
+    """Conteggi congiunti di `models` (pyfunc già caricati) sullo shard."""
+    counts = ConfusionCounts(len(models))
+    for chunk in iter_chunks(path, chunksize, shard, num_shards):
+        texts = chunk["text"].fillna("").astype(str).tolist()
+        y_true = encode_labels(chunk["label"].to_numpy())
+        counts.update(y_true, *(predict_codes(m, texts) for m in models))
+    return counts
+
+
+def _run_shard(
+    model_uris: list[str],
+    path: str,
+    chunksize: int,
+    shard: int,
+    num_shards: int,
+    tracking_uri: str | None = None,
+) -> np.ndarray:
+    if tracking_uri:
+        mlflow.set_tracking_uri(tracking_uri)
+    models = [mlflow.pyfunc.load_model(uri) for uri in model_uris]
+    # token id da `<path>.tokens/`: i modelli con lo stesso tokenizer (e i run
+    # successivi) non ritokenizzano il set. Uno shard legge solo 1/n dei chunk:
+    # usa lo store se esiste già, ma non tokenizza l'intero file per crearlo
+    token_cache.attach(path, build=num_shards == 1)
+    try:
+        return evaluate_stream(models, path, chunksize, shard, num_shards).counts
+    finally:
+        token_cache.detach(path)
+
+
+def evaluate_uris(
+    model_uris: list[str],
+    path: str,
+    chunksize: int = CHUNK_SIZE,
+    workers: int = 1,
+) -> ConfusionCounts:
+    """Carica i modelli e valuta `path`, in `workers` processi se > 1."""
+    tracking_uri = mlflow.get_tracking_uri()
+    if workers <= 1:
+        counts = _run_shard(model_uris, path, chunksize, 0, 1, tracking_uri)
+        return ConfusionCounts(len(model_uris), counts)
+    total = ConfusionCounts(len(model_uris))
+    # spawn: torch e i thread del tokenizer non sopravvivono bene a fork
+    with ProcessPoolExecutor(workers, mp_context=get_context("spawn")) as pool:
+        parts = [
+            pool.submit(
+                _run_shard, model_uris, path, chunksize, i, workers, tracking_uri
+            )
+            for i in range(workers)
+        ]
+        for part in parts:
+            total.merge(ConfusionCounts(len(model_uris), part.result()))
+    return total
+
+
+def report(counts: ConfusionCounts, n_bootstrap: int = 0, alpha: float = 0.05):
+    """Metriche per modello e, con `n_bootstrap`, intervalli (il secondo
+    modello fa da riferimento)."""
+    out = {"n": counts.n}
+    if not counts.n:  # shard vuoto
+        return out
+    out["models"] = [counts.summary(m) for m in range(counts.n_models)]
+    if n_bootstrap and counts.n_models <= 2:
+        out["bootstrap"] = bootstrap_counts(counts, n_bootstrap, alpha)
+    return out
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument(
+        "--model_uri",
+        action="append",
+        default=None,
+        help="Modello da valutare (ripetibile; il secondo è il riferimento)",
+    )
+    ap.add_argument("--eval_csv", default="data/holdout.csv", help="CSV o Parquet")
+    ap.add_argument("--chunksize", type=int, default=CHUNK_SIZE)
+    ap.add_argument("--workers", type=int, default=1)
+    ap.add_argument("--shard", type=int, default=None)
+    ap.add_argument("--num_shards", type=int, default=1)
+    ap.add_argument("--out", default=None, help="Salva i conteggi (.npy)")
+    ap.add_argument(
+        "--merge", nargs="+", default=None, help="Unisce conteggi salvati (glob)"
+    )
+    ap.add_argument("--n_bootstrap", type=int, default=0)
+    ap.add_argument("--alpha", type=float, default=0.05)
+    args = ap.parse_args(argv)
+
+    if args.merge:
+        paths = sorted(p for pattern in args.merge for p in glob.glob(pattern))
+        if not paths:
+            ap.error(f"nessun file di conteggi in {args.merge}")
+        counts = ConfusionCounts.load(paths[0])
+        for path in paths[1:]:
+            counts.merge(ConfusionCounts.load(path))
+    elif not args.model_uri:
+        ap.error("serve --model_uri (o --merge)")
+    elif args.shard is not None:
+        counts = ConfusionCounts(
+            len(args.model_uri),
+            _run_shard(
+                args.model_uri,
+                args.eval_csv,
+                args.chunksize,
+                args.shard,
+                args.num_shards,
+            ),
+        )
+    else:
+        counts = evaluate_uris(
+            args.model_uri, args.eval_csv, args.chunksize, args.workers
+        )
+
+    if args.out:
+        counts.save(args.out)
+    print(json.dumps(report(counts, args.n_bootstrap, args.alpha), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -2,15 +2,14 @@ import argparse
 import mlflow
 import mlflow.pyfunc
 import mlflow.sklearn
+import numpy as np
 import pandas as pd
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.linear_model import LogisticRegression
-from transformers import (
-    AutoTokenizer,
-    AutoModelForSequenceClassification,
-    TextClassificationPipeline,
-)
 import src.utils.mlflow_utils as mlflow_utils
+from src.utils.labels import LABELS, decode_labels, softmax
+from src.utils.text_length import LengthPolicy, estimate_tokens, predict_texts
+from src.utils.tokenization import token_cache
 
 MODEL_ID = "cardiffnlp/twitter-roberta-base-sentiment-latest"
 
@@ -27,22 +26,61 @@ def get_or_create_experiment(name: str) -> str:
 
 
 class HFTextClassifier(mlflow.pyfunc.PythonModel):
+    batch_size = 32
+
     def load_context(self, context):
+        # transformers/torch servono solo quando il modello viene caricato,
+        # non per loggarlo/registrarlo
+        from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
         self.tokenizer = AutoTokenizer.from_pretrained(MODEL_ID)
         self.model = AutoModelForSequenceClassification.from_pretrained(MODEL_ID)
-        self.pipe = TextClassificationPipeline(
-            model=self.model, tokenizer=self.tokenizer, return_all_scores=False
-        )
+        self.model.eval()
 
     def predict(self, context, model_input):
-        outputs = []
-        for text in model_input:
-            res = self.pipe(text, truncation=True)
-            first = res[0] if isinstance(res, list) else res
-            if isinstance(first, list):
-                first = first[0]
-            outputs.append({"label": first["label"], "score": float(first["score"])})
-        return outputs
+        texts = [str(t) for t in model_input]
+        # troncamento o finestre per i testi lunghi secondo LONG_TEXT_POLICY
+        results = predict_texts(self._predict_batch, texts, LengthPolicy.from_env())
+        return [{"label": label, "score": score} for label, score in results]
+
+    def _predict_batch(self, texts, timings=None):
+        probs = self.predict_proba(texts, early_exit=True)
+        codes = probs.argmax(axis=-1)
+        labels = decode_labels(codes)
+        scores = probs[np.arange(len(texts)), codes]
+        return list(zip(labels.tolist(), scores.tolist()))
+
+    def predict_proba(
+        self, texts, temperature: float = 1.0, early_exit: bool = False
+    ) -> np.ndarray:
+        """Probabilità `(n, n_classi)` nell'ordine di `LABELS`.
+
+        Con `temperature` > 1 le distribuzioni si ammorbidiscono (soft label
+        per la distillazione, `src/models/distill.py`); con `early_exit` e
+        `EARLY_EXIT_HEADS` impostato si usano le teste intermedie
+        (`src/models/early_exit.py`).
+        """
+        import torch
+
+        from src.models import early_exit as ee
+
+        heads = ee.heads_from_env() if early_exit else None
+
+        # batch formati per lunghezza stimata: i testi lunghi non gonfiano il
+        # padding di quelli corti
+        order = np.argsort([estimate_tokens(t) for t in texts], kind="stable")
+        probs = np.empty((len(texts), len(LABELS)))
+        for i in range(0, len(texts), self.batch_size):
+            idx = order[i : i + self.batch_size]
+            enc, _ = token_cache.encode(self.tokenizer, [texts[j] for j in idx])
+            if heads is not None:
+                probs[idx] = ee.forward_probs(self.model, enc, heads)[0]
+                continue
+            with torch.no_grad():
+                logits = self.model(**enc).logits
+            # softmax sull'intero batch
+            probs[idx] = softmax(logits.float().numpy() / temperature)
+        return probs
 
 
 def _train_sklearn_model(csv_path: str):
@@ -54,7 +92,8 @@ def _train_sklearn_model(csv_path: str):
     vec = TfidfVectorizer(max_features=2048)
     X = vec.fit_transform(texts)
     clf = LogisticRegression(max_iter=1000)
-    clf.fit(X, y)
+    # batch deduplicati in ingest: `weight` = occorrenze del testo nel batch
+    clf.fit(X, y, sample_weight=df["weight"].to_numpy() if "weight" in df else None)
     metrics = {
         "train_size": len(df),
         "classes": len(set(y)),
@@ -62,7 +101,13 @@ def _train_sklearn_model(csv_path: str):
     return clf, vec, metrics
 
 
-def main(experiment: str = "sentiment", train_csv: str | None = None) -> int:
+def train(experiment: str = "sentiment", train_csv: str | None = None) -> dict:
+    """Logga e registra una nuova versione del modello.
+
+    Ritorna un dict con `run_id`, `model_name`, `version` e `model_uri` (questi
+    ultimi `None` se il registry non restituisce la versione): è l'entry point
+    in-process usato dal DAG al posto di `python -m src.models.train_roberta`.
+    """
     # If a train CSV is given, run the small training loop (sklearn)
     sklearn_model = None
     vectorizer = None
@@ -82,7 +127,7 @@ def main(experiment: str = "sentiment", train_csv: str | None = None) -> int:
             # registra la versione sklearn per testing e debug
             if sklearn_model:
                 mlflow.sklearn.log_model(sklearn_model, artifact_path="sklearn_model")
-        mlflow.pyfunc.log_model(
+        info = mlflow.pyfunc.log_model(
             artifact_path="model",
             python_model=HFTextClassifier(),
             registered_model_name=mlflow_utils.REGISTERED_NAME,
@@ -91,6 +136,25 @@ def main(experiment: str = "sentiment", train_csv: str | None = None) -> int:
         for k, v in metrics.items():
             mlflow.log_metric(k, float(v))
         print(f"Run logged: {run.info.run_id}")
+    # nuova versione: la "latest" in cache nel registry non vale più
+    mlflow_utils.registry().invalidate(mlflow_utils.REGISTERED_NAME)
+
+    version = getattr(info, "registered_model_version", None)
+    return {
+        "run_id": run.info.run_id,
+        "model_name": mlflow_utils.REGISTERED_NAME,
+        "version": int(version) if version is not None else None,
+        "model_uri": (
+            f"models:/{mlflow_utils.REGISTERED_NAME}/{int(version)}"
+            if version is not None
+            else None
+        ),
+        "metrics": metrics,
+    }
+
+
+def main(experiment: str = "sentiment", train_csv: str | None = None) -> int:
+    train(experiment, train_csv)
     return 0
 
 
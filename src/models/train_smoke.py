@@ -25,7 +25,7 @@ from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.linear_model import LogisticRegression
 from sklearn.pipeline import Pipeline
 
-from src.utils.mlflow_utils import get_or_create_experiment, REGISTERED_NAME
+from src.utils.mlflow_utils import get_or_create_experiment, registry, REGISTERED_NAME
 
 
 def _train_sklearn_model(csv_path: str) -> Tuple[object, dict]:
@@ -39,17 +39,22 @@ def _train_sklearn_model(csv_path: str) -> Tuple[object, dict]:
     # Crea un pipeline che include sia il vettorizzatore che il classificatore
     pipeline = Pipeline([("tfidf", vec), ("clf", clf)])
     X = texts
-    pipeline.fit(X, y)
+    # batch deduplicati in ingest: `weight` = occorrenze del testo nel batch
+    fit_params = (
+        {"clf__sample_weight": df["weight"].to_numpy()} if "weight" in df else {}
+    )
+    pipeline.fit(X, y, **fit_params)
     metrics = {"train_size": len(df), "classes": len(set(y))}
     return pipeline, metrics
 
 
-def main(
+def train(
     experiment: str = "sentiment",
     train_csv: str | None = None,
     n_samples: int = 1,
     dev_suffix: str = "-dev",
-) -> int:
+) -> dict:
+    """Addestra e registra il modello dev; ritorna run, nome e versione registrata."""
     # exp_id = get_or_create_experiment(experiment)
     get_or_create_experiment(experiment)
     mlflow.set_experiment(experiment)
@@ -82,7 +87,7 @@ def main(
         with mlflow.start_run() as run:
             mlflow.log_param("train_csv", train_csv)
             mlflow.log_param("n_samples", n_samples)
-            mlflow.sklearn.log_model(
+            info = mlflow.sklearn.log_model(
                 sklearn_model,
                 artifact_path="sklearn_model",
                 registered_model_name=target_model_name,
@@ -91,6 +96,7 @@ def main(
                 mlflow.log_metric(k, float(v))
             print(f"Run logged: {run.info.run_id}")
             print(f"Registered model: {target_model_name}")
+            registry().invalidate(target_model_name)
             print(f"Used train csv: {tmp.name}")
     finally:
         try:
@@ -98,6 +104,27 @@ def main(
         except Exception:
             pass
 
+    version = getattr(info, "registered_model_version", None)
+    return {
+        "run_id": run.info.run_id,
+        "model_name": target_model_name,
+        "version": int(version) if version is not None else None,
+        "model_uri": (
+            f"models:/{target_model_name}/{int(version)}"
+            if version is not None
+            else None
+        ),
+        "metrics": metrics,
+    }
+
+
+def main(
+    experiment: str = "sentiment",
+    train_csv: str | None = None,
+    n_samples: int = 1,
+    dev_suffix: str = "-dev",
+) -> int:
+    train(experiment, train_csv, n_samples, dev_suffix)
     return 0
 
 
@@ -18,22 +18,27 @@ from typing import Iterable
 import numpy as np
 import pandas as pd
 
-from src.serving.load_model import get_pipeline, _normalize_label  # type: ignore
+from src.utils.labels import (
+    UNKNOWN,
+    class_distribution,
+    encode_labels,
+)
 
 LENGTH_SHIFT_THRESHOLD = 0.35  # 35% median-length shift
 CLASS_DRIFT_THRESHOLD = 0.25  # TV distance on label distribution
 
 
 def _class_distribution(labels: Iterable[str]) -> dict[str, float]:
-    dist: dict[str, float] = {}
-    total = 0
-    for lab in labels:
-        lab_norm = str(lab).strip().lower()
-        dist[lab_norm] = dist.get(lab_norm, 0) + 1
-        total += 1
-    if total == 0:
-        return {}
-    return {k: v / total for k, v in dist.items()}
+    values = np.asarray(labels if hasattr(labels, "__len__") else list(labels))
+    codes = encode_labels(values)
+    dist = class_distribution(codes)
+    unknown = codes == UNKNOWN
+    if unknown.any():
+        # etichette fuori schema: restano nella distribuzione con il loro nome
+        raw = np.char.lower(np.char.strip(values[unknown].astype(str)))
+        keys, counts = np.unique(raw, return_counts=True)
+        dist.update(zip(keys.tolist(), (counts / len(codes)).tolist()))
+    return dist
 
 
 def _tv_distance(p: dict[str, float], q: dict[str, float]) -> float:
@@ -41,27 +46,36 @@ def _tv_distance(p: dict[str, float], q: dict[str, float]) -> float:
     return 0.5 * sum(abs(p.get(k, 0.0) - q.get(k, 0.0)) for k in keys)
 
 
-def _predict_labels(texts: pd.Series) -> list[str]:
+def _predict_labels(texts: pd.Series, batch_size: int = 32) -> list[str]:
     """Predict sentiment labels using the serving pipeline or its stub."""
 
-    pipe = get_pipeline()
+    # import differito: serve solo se il CSV non ha la colonna `label`
+    from src.serving.load_model import predict_pipeline_batch
+    from src.utils.text_length import LengthPolicy, predict_texts
+
+    policy = LengthPolicy.from_env()
+    values = texts.tolist()
     outputs = []
-    for txt in texts.tolist():
-        res = pipe(txt, truncation=True)
-        first = res[0] if isinstance(res, list) else res
-        if isinstance(first, list):
-            first = first[0]
-        outputs.append(_normalize_label(first["label"]))  # type: ignore[index]
+    for i in range(0, len(values), batch_size):
+        results = predict_texts(
+            predict_pipeline_batch, values[i : i + batch_size], policy
+        )
+        outputs.extend(label for label, _ in results)
     return outputs
 
 
-def _pick_labels(df: pd.DataFrame) -> list[str]:
+def _pick_labels(df: pd.DataFrame) -> np.ndarray:
     if "label" in df.columns:
-        return df["label"].astype(str).str.lower().tolist()
-    return _predict_labels(df["text"])
+        return df["label"].to_numpy()
+    return np.asarray(_predict_labels(df["text"]))
 
 
-def main(ref_csv: str, cur_csv: str, out_dir: str = "artifacts") -> int:
+def run(ref_csv: str, cur_csv: str, out_dir: str = "artifacts") -> dict:
+    """Calcola il drift e scrive i report; ritorna il summary (con `drift_flag`).
+
+    Entry point in-process usato dal DAG: il summary viaggia via XCom senza
+    dover rileggere `drift_report.json`.
+    """
     os.makedirs(out_dir, exist_ok=True)
     ref = pd.read_csv(ref_csv).dropna(subset=["text"]).copy()
     cur = pd.read_csv(cur_csv).dropna(subset=["text"]).copy()
@@ -107,7 +121,11 @@ def main(ref_csv: str, cur_csv: str, out_dir: str = "artifacts") -> int:
             )
         )
 
-    return drift_flag
+    return summary
+
+
+def main(ref_csv: str, cur_csv: str, out_dir: str = "artifacts") -> int:
+    return run(ref_csv, cur_csv, out_dir)["drift_flag"]
 
 
 if __name__ == "__main__":
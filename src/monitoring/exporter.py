@@ -0,0 +1,217 @@
+# src/monitoring/exporter.py
+"""Exporter bufferizzato verso il Pushgateway.
+
+I task registrano i gauge con `MetricsExporter.set`; `flush` li invia tutti
+con un'unica POST (semantica pushadd: i gauge non presenti nel push restano
+sul gateway), con timeout e retry a backoff esponenziale. Se il gateway non
+risponde il push viene salvato in `spool_dir/pending/` e rinviato, dal più
+vecchio, al flush successivo (o con `python -m src.monitoring.exporter`)
+prima dei dati nuovi, così un valore vecchio non sovrascrive mai uno più
+recente.
+
+`for_run(run_id)` accumula il buffer in un file JSONL per run: i task del DAG
+girano in processi diversi e l'ultimo task fa un solo flush.
+
+Modulo leggero: il rendering usa solo `prometheus_client`.
+"""
+
+import argparse
+import base64
+import glob
+import json
+import logging
+import os
+import re
+import time
+import urllib.error
+import urllib.request
+
+from prometheus_client import CollectorRegistry, generate_latest
+from prometheus_client.exposition import CONTENT_TYPE_LATEST
+from prometheus_client.metrics_core import Metric
+
+logger = logging.getLogger(__name__)
+
+METRICS_SPOOL_DIR = os.getenv("METRICS_SPOOL_DIR", "artifacts/metrics_spool")
+PUSH_TIMEOUT_SECONDS = float(os.getenv("PUSH_TIMEOUT_SECONDS", "5"))
+PUSH_RETRIES = int(os.getenv("PUSH_RETRIES", "3"))
+PUSH_BACKOFF_SECONDS = float(os.getenv("PUSH_BACKOFF_SECONDS", "1"))
+
+
+def _grouping_path(job: str, grouping_key: dict) -> str:
+    # stessa codifica di prometheus_client: base64 per i valori con "/"
+    parts = [("job", job), *grouping_key.items()]
+    path = ""
+    for key, value in parts:
+        value = str(value)
+        if "/" in value or not value:
+            value = base64.urlsafe_b64encode(value.encode()).decode()
+            key = f"{key}@base64"
+        path += f"/{key}/{urllib.request.quote(value, safe='=')}"
+    return path
+
+
+class _BufferCollector:
+    def __init__(self, samples: list[dict]):
+        self.samples = samples
+
+    def collect(self):
+        families = {}
+        for s in self.samples:
+            if s["name"] not in families:
+                families[s["name"]] = Metric(s["name"], s["documentation"], "gauge")
+            families[s["name"]].add_sample(s["name"], s["labels"], s["value"])
+        return list(families.values())
+
+
+class MetricsExporter:
+    def __init__(
+        self,
+        gateway: str,
+        job: str,
+        grouping_key: dict | None = None,
+        spool_dir: str = METRICS_SPOOL_DIR,
+        timeout: float = PUSH_TIMEOUT_SECONDS,
+        retries: int = PUSH_RETRIES,
+        backoff: float = PUSH_BACKOFF_SECONDS,
+        buffer_path: str | None = None,
+    ):
+        if "://" not in gateway:
+            gateway = f"http://{gateway}"
+        self.gateway = gateway.rstrip("/")
+        self.path = "/metrics" + _grouping_path(job, grouping_key or {})
+        self.spool_dir = spool_dir
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.buffer_path = buffer_path
+        self._buffer: list[dict] = []
+
+    @classmethod
+    def for_run(cls, run_id: str, **kwargs) -> "MetricsExporter":
+        """Exporter il cui buffer persiste su file per tutto il run `run_id`."""
+        spool_dir = kwargs.get("spool_dir", METRICS_SPOOL_DIR)
+        name = re.sub(r"[^\w.-]", "_", run_id)
+        path = os.path.join(spool_dir, "runs", f"{name}.jsonl")
+        return cls(buffer_path=path, **kwargs)
+
+    def set(self, name: str, value: float, documentation: str = "", **labels):
+        sample = {
+            "name": name,
+            "documentation": documentation or name,
+            "labels": {k: str(v) for k, v in labels.items()},
+            "value": float(value),
+        }
+        if self.buffer_path is None:
+            self._buffer.append(sample)
+            return
+        os.makedirs(os.path.dirname(self.buffer_path), exist_ok=True)
+        # una riga per append: task concorrenti non si sovrascrivono
+        with open(self.buffer_path, "a") as f:
+            f.write(json.dumps(sample) + "\n")
+
+    def samples(self) -> list[dict]:
+        """Buffer con l'ultimo valore per ogni (nome, label)."""
+        samples = list(self._buffer)
+        if self.buffer_path and os.path.exists(self.buffer_path):
+            with open(self.buffer_path) as f:
+                samples += [json.loads(line) for line in f if line.strip()]
+        latest = {}
+        for s in samples:
+            latest[(s["name"], tuple(sorted(s["labels"].items())))] = s
+        return list(latest.values())
+
+    def registry(self, samples: list[dict] | None = None) -> CollectorRegistry:
+        reg = CollectorRegistry()
+        reg.register(_BufferCollector(self.samples() if samples is None else samples))
+        return reg
+
+    def _send(self, push: dict) -> bool:
+        """POST con retry; False se il gateway resta irraggiungibile."""
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            request = urllib.request.Request(
+                self.gateway + push["path"],
+                data=push["body"].encode(),
+                method="POST",
+                headers={"Content-Type": push["content_type"]},
+            )
+            try:
+                with urllib.request.urlopen(request, timeout=self.timeout):
+                    return True
+            except urllib.error.HTTPError as e:
+                if e.code < 500:
+                    # body rifiutato: ritentarlo non serve, e in spool
+                    # bloccherebbe il replay
+                    logger.error(f"[exporter] push scartato ({e.code}): {e.reason}")
+                    return True
+                error = e
+            except OSError as e:  # connessione rifiutata, timeout, DNS
+                error = e
+            logger.warning(f"[exporter] tentativo {attempt + 1} fallito: {error}")
+        return False
+
+    def _spool(self, push: dict) -> str:
+        pending = os.path.join(self.spool_dir, "pending")
+        os.makedirs(pending, exist_ok=True)
+        path = os.path.join(pending, f"{time.time_ns():020d}-{os.getpid()}.json")
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(push, f)
+        os.replace(f"{path}.tmp", path)
+        return path
+
+    def replay(self) -> int:
+        """Rinvia i push in spool dal più vecchio; si ferma al primo errore."""
+        sent = 0
+        for path in sorted(
+            glob.glob(os.path.join(self.spool_dir, "pending", "*.json"))
+        ):
+            with open(path) as f:
+                push = json.load(f)
+            if not self._send(push):
+                break
+            os.remove(path)
+            sent += 1
+        return sent
+
+    def pending(self) -> int:
+        return len(glob.glob(os.path.join(self.spool_dir, "pending", "*.json")))
+
+    def flush(self) -> bool:
+        """Un solo push per tutto il buffer; False se è finito in spool."""
+        samples = self.samples()
+        replayed = self.replay()
+        if replayed:
+            logger.info(f"[exporter] rinviati {replayed} push dallo spool")
+        pushed = True
+        if samples:
+            push = {
+                "path": self.path,
+                "body": generate_latest(self.registry(samples)).decode(),
+                "content_type": CONTENT_TYPE_LATEST,
+            }
+            # con push ancora in spool il nuovo va in coda, non davanti
+            pushed = self.pending() == 0 and self._send(push)
+            if not pushed:
+                path = self._spool(push)
+                logger.warning(f"[exporter] gateway irraggiungibile, spool: {path}")
+        self._buffer = []
+        if self.buffer_path and os.path.exists(self.buffer_path):
+            os.remove(self.buffer_path)
+        return pushed
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Rinvia i push rimasti in spool")
+    ap.add_argument("--gateway", default="http://pushgateway:9091")
+    ap.add_argument("--spool_dir", default=METRICS_SPOOL_DIR)
+    args = ap.parse_args(argv)
+    exporter = MetricsExporter(args.gateway, "replay", spool_dir=args.spool_dir)
+    sent = exporter.replay()
+    print(f"[exporter] rinviati {sent} push, {exporter.pending()} ancora in spool")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,88 @@
+# src/monitoring/incoming.py
+"""Rilevamento dei nuovi batch in `data/incoming` per il trigger a eventi.
+
+`IncomingWatch` confronta i file della directory con lo stato dei file già
+ingeriti (`{path: mtime}` in un JSON, riscritto in modo atomico): un file
+nuovo o riscritto (mtime diversa) è in attesa. Il debounce raccoglie le
+raffiche di file: il batch è pronto quando nessun file in attesa è stato
+modificato negli ultimi `quiet_seconds` (anche un file ancora in scrittura
+ha mtime recente), oppure quando il più vecchio aspetta da `max_wait_seconds`
+(una raffica continua non rimanda il retraining all'infinito).
+
+Modulo leggero: solo libreria standard, importabile dal sensore del DAG.
+"""
+
+import glob
+import json
+import os
+import time
+
+INCOMING_QUIET_SECONDS = float(os.getenv("INCOMING_QUIET_SECONDS", "120"))
+INCOMING_MAX_WAIT_SECONDS = float(os.getenv("INCOMING_MAX_WAIT_SECONDS", "900"))
+
+
+class IncomingWatch:
+    def __init__(self, directory: str, state_path: str, pattern: str = "*.csv"):
+        self.directory = directory
+        self.state_path = state_path
+        self.pattern = pattern
+
+    def _state(self) -> dict:
+        try:
+            with open(self.state_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def pending(self) -> list[dict]:
+        """File non ancora ingeriti, dal più vecchio."""
+        state = self._state()
+        files = []
+        for path in glob.glob(os.path.join(self.directory, self.pattern)):
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:  # rimosso durante la scansione
+                continue
+            if state.get(path) != st.st_mtime:
+                files.append({"path": path, "mtime": st.st_mtime, "size": st.st_size})
+        return sorted(files, key=lambda f: (f["mtime"], f["path"]))
+
+    def ready(
+        self,
+        quiet_seconds: float = INCOMING_QUIET_SECONDS,
+        max_wait_seconds: float = INCOMING_MAX_WAIT_SECONDS,
+        now: float | None = None,
+    ) -> dict | None:
+        """Batch da ingerire dopo il debounce, altrimenti `None`.
+
+        `lag_seconds` è l'età del file più vecchio del batch: il ritardo tra
+        l'arrivo dei dati e il loro rilevamento.
+        """
+        files = self.pending()
+        if not files:
+            return None
+        now = time.time() if now is None else now
+        oldest, newest = files[0]["mtime"], files[-1]["mtime"]
+        if now - newest < quiet_seconds and now - oldest < max_wait_seconds:
+            return None
+        return {
+            "files": [f["path"] for f in files],
+            "mtimes": [f["mtime"] for f in files],
+            "oldest_mtime": oldest,
+            "lag_seconds": round(now - oldest, 3),
+        }
+
+    def mark_processed(self, files: list[str], mtimes: list[float]) -> None:
+        """Registra i file ingeriti; le voci dei file rimossi vengono scartate."""
+        state = {p: m for p, m in self._state().items() if os.path.exists(p)}
+        state.update(zip(files, mtimes))
+        os.makedirs(os.path.dirname(os.path.abspath(self.state_path)), exist_ok=True)
+        tmp = f"{self.state_path}.tmp-{os.getpid()}"
+        with open(tmp, "w") as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp, self.state_path)
+
+
+def freshness_lag(oldest_mtime: float, now: float | None = None) -> float:
+    """Secondi trascorsi dall'arrivo del file più vecchio del batch."""
+    return (time.time() if now is None else now) - oldest_mtime
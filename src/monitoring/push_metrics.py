@@ -1,25 +1,40 @@
 # src/monitoring/push_metrics.py
 import argparse
-from prometheus_client import CollectorRegistry, Gauge, push_to_gateway
 
+from src.monitoring.exporter import MetricsExporter
 
-def main(gateway: str, job: str, instance: str, drift: int):
+
+def record_drift(exporter: MetricsExporter, drift: int):
+    """Gauge `data_drift_flag` = 1 (drift) / 0 (no drift)."""
+    exporter.set("data_drift_flag", float(drift), "1 if drift detected else 0")
+
+
+def record_freshness(exporter: MetricsExporter, stage: str, lag: float):
+    """
+    Gauge `data_freshness_lag_seconds{stage}`: secondi tra l'arrivo del batch
+    più vecchio in `data/incoming` e la fase `stage` del DAG (`detected`
+    quando il sensore scatta, `train_start` all'avvio del retraining).
+    """
+    exporter.set(
+        "data_freshness_lag_seconds",
+        lag,
+        "Seconds from batch arrival in data/incoming to the DAG stage",
+        stage=stage,
+    )
+
+
+def main(gateway: str, job: str, instance: str, drift: int) -> bool:
     """
     Invia al Pushgateway una metrica di tipo Gauge:
     data_drift_flag = 1 (drift) / 0 (no drift)
 
     Sarà poi Prometheus a scrappare il Pushgateway e Grafana
-    leggerà la metrica data_drift_flag.
+    leggerà la metrica data_drift_flag. Se il gateway non risponde il push
+    resta in spool (vedi `src.monitoring.exporter`).
     """
-    reg = CollectorRegistry()
-    g = Gauge("data_drift_flag", "1 if drift detected else 0", registry=reg)
-    g.set(float(drift))
-    push_to_gateway(
-        gateway,
-        job=job,
-        grouping_key={"instance": instance},
-        registry=reg,
-    )
+    exporter = MetricsExporter(gateway, job, {"instance": instance})
+    record_drift(exporter, drift)
+    return exporter.flush()
 
 
 if __name__ == "__main__":
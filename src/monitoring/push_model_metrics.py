@@ -1,6 +1,9 @@
 """
 Push model performance metrics (F1, accuracy) from MLflow to Prometheus Pushgateway.
 
+Con le metriche complete di `src.models.evaluate` (`--metrics_json`) vengono
+pushati anche F1 per classe e gli estremi degli intervalli bootstrap.
+
 Usage:
     python -m src.monitoring.push_model_metrics \
         --model_uri models:/Sentiment/Production \
@@ -9,12 +12,61 @@ Usage:
 """
 
 import argparse
+import json
 import logging
-from prometheus_client import CollectorRegistry, Gauge, push_to_gateway
+
+from src.monitoring.exporter import MetricsExporter
 
 logger = logging.getLogger(__name__)
 
 
+def record_model_metrics(
+    exporter: MetricsExporter,
+    model_name: str,
+    model_version: str,
+    f1_score: float,
+    accuracy: float,
+    per_class: dict | None = None,
+    bootstrap: dict | None = None,
+):
+    """
+    Registra le metriche del modello nel buffer di `exporter`.
+
+    Args:
+        model_name: Model name (e.g., "Sentiment")
+        model_version: Model version number (e.g., "3")
+        f1_score: F1 macro score (0.0-1.0)
+        accuracy: Accuracy score (0.0-1.0)
+        per_class: {label: {"f1": ..., ...}} (opzionale)
+        bootstrap: intervalli di `paired_bootstrap` (opzionale)
+    """
+    labels = {"model_name": model_name, "model_version": model_version}
+    exporter.set("model_f1_score", f1_score, "Model macro F1 score", **labels)
+    exporter.set("model_accuracy", accuracy, "Model accuracy", **labels)
+
+    for label, values in (per_class or {}).items():
+        exporter.set(
+            "model_class_f1_score",
+            values["f1"],
+            "Model F1 score per class",
+            sentiment_label=label,
+            **labels,
+        )
+
+    for metric in ("macro_f1", "accuracy", "delta_macro_f1", "delta_accuracy"):
+        if not bootstrap or metric not in bootstrap:
+            continue
+        for bound, value in zip(("lower", "upper"), bootstrap[metric]["ci"]):
+            exporter.set(
+                "model_metric_ci",
+                value,
+                "Bootstrap confidence interval bounds of model metrics",
+                metric=metric,
+                bound=bound,
+                **labels,
+            )
+
+
 def push_metrics(
     gateway: str,
     job: str,
@@ -23,7 +75,9 @@ def push_metrics(
     model_version: str,
     f1_score: float,
     accuracy: float,
-):
+    per_class: dict | None = None,
+    bootstrap: dict | None = None,
+) -> bool:
     """
     Push model performance metrics to Pushgateway.
 
@@ -31,42 +85,20 @@ def push_metrics(
         gateway: Pushgateway URL (e.g., "http://pushgateway:9091")
         job: Job name (e.g., "model_performance")
         instance: Instance label (e.g., "airflow")
-        model_name: Model name (e.g., "Sentiment")
-        model_version: Model version number (e.g., "3")
-        f1_score: F1 macro score (0.0-1.0)
-        accuracy: Accuracy score (0.0-1.0)
-    """
-    reg = CollectorRegistry()
-
-    # Create gauges for model metrics
-    f1_gauge = Gauge(
-        "model_f1_score",
-        "Model macro F1 score",
-        ["model_name", "model_version"],
-        registry=reg,
-    )
-    acc_gauge = Gauge(
-        "model_accuracy",
-        "Model accuracy",
-        ["model_name", "model_version"],
-        registry=reg,
-    )
-
-    # Set values
-    f1_gauge.labels(model_name=model_name, model_version=model_version).set(f1_score)
-    acc_gauge.labels(model_name=model_name, model_version=model_version).set(accuracy)
 
-    # Push to gateway
-    push_to_gateway(
-        gateway,
-        job=job,
-        grouping_key={"instance": instance},
-        registry=reg,
+    Gli altri argomenti come `record_model_metrics`. Restituisce False se il
+    gateway non risponde e il push resta in spool.
+    """
+    exporter = MetricsExporter(gateway, job, {"instance": instance})
+    record_model_metrics(
+        exporter, model_name, model_version, f1_score, accuracy, per_class, bootstrap
     )
-
+    pushed = exporter.flush()
     logger.info(
-        f"[push_model_metrics] Pushed to {gateway}: F1={f1_score:.4f}, Accuracy={accuracy:.4f}"
+        f"[push_model_metrics] {'Pushed' if pushed else 'Spooled'} to {gateway}: "
+        f"F1={f1_score:.4f}, Accuracy={accuracy:.4f}"
     )
+    return pushed
 
 
 def main():
@@ -93,35 +125,54 @@ def main():
         default="Sentiment",
         help="Model name",
     )
+    ap.add_argument(
+        "--metrics_json",
+        default=None,
+        help="JSON scritto da src.models.evaluate --metrics_output",
+    )
     ap.add_argument(
         "--model_version",
         type=str,
-        required=True,
-        help="Model version",
+        default=None,
+        help="Model version (default: new_version di --metrics_json)",
     )
     ap.add_argument(
         "--f1_score",
         type=float,
-        required=True,
+        default=None,
         help="F1 macro score (0.0-1.0)",
     )
     ap.add_argument(
         "--accuracy",
         type=float,
-        required=True,
+        default=None,
         help="Accuracy score (0.0-1.0)",
     )
 
     args = ap.parse_args()
 
+    metrics = {}
+    if args.metrics_json:
+        with open(args.metrics_json) as f:
+            metrics = json.load(f)
+    version = args.model_version or metrics.get("new_version")
+    f1_score = args.f1_score if args.f1_score is not None else metrics.get("new_f1")
+    accuracy = (
+        args.accuracy if args.accuracy is not None else metrics.get("new_accuracy")
+    )
+    if version is None or f1_score is None or accuracy is None:
+        ap.error("servono --metrics_json oppure --model_version/--f1_score/--accuracy")
+
     push_metrics(
         gateway=args.gateway,
         job=args.job,
         instance=args.instance,
         model_name=args.model_name,
-        model_version=args.model_version,
-        f1_score=args.f1_score,
-        accuracy=args.accuracy,
+        model_version=str(version),
+        f1_score=f1_score,
+        accuracy=accuracy,
+        per_class=metrics.get("per_class"),
+        bootstrap=metrics.get("bootstrap"),
     )
 
 
@@ -0,0 +1,108 @@
+# src/monitoring/shadow_report.py
+"""Statistiche del confronto online Production vs candidato (shadow traffic).
+
+La serving app (`src/serving/shadow.py`) accumula per processo i contatori in
+uno `ShadowStats` e li salva come `shadow_report-<pid>.json` in
+`SHADOW_REPORT_DIR`; `read_reports` unisce i file di tutti i worker e lo step
+di promozione (`src/models/evaluate.py`) legge il riepilogo da lì.
+
+Il riepilogo contiene:
+- `agreement_rate`: quota di testi con la stessa etichetta;
+- `mean_score_divergence`: differenza assoluta media dello score top-1, sui
+  soli testi in cui le etichette coincidono;
+- `prod_latency_ms` / `candidate_latency_ms` / `latency_ratio`: latenza media
+  per testo (il candidato gira a batch, Production come servito);
+- `confusion`: conteggi etichetta Production -> etichetta candidato.
+"""
+
+import glob
+import json
+import os
+from dataclasses import asdict, dataclass, field
+
+REPORT_PREFIX = "shadow_report-"
+
+
+@dataclass
+class ShadowStats:
+    candidate_uri: str | None = None
+    samples: int = 0
+    agreements: int = 0
+    score_divergence_sum: float = 0.0
+    prod_latency_sum: float = 0.0
+    candidate_latency_sum: float = 0.0
+    confusion: dict = field(default_factory=dict)
+
+    def add(
+        self,
+        prod: tuple,
+        candidate: tuple,
+        prod_latency: float,
+        candidate_latency: float,
+    ) -> None:
+        (prod_label, prod_score), (cand_label, cand_score) = prod, candidate
+        self.samples += 1
+        if prod_label == cand_label:
+            self.agreements += 1
+            self.score_divergence_sum += abs(prod_score - cand_score)
+        row = self.confusion.setdefault(prod_label, {})
+        row[cand_label] = row.get(cand_label, 0) + 1
+        self.prod_latency_sum += prod_latency
+        self.candidate_latency_sum += candidate_latency
+
+    def merge(self, other: "ShadowStats") -> None:
+        self.candidate_uri = self.candidate_uri or other.candidate_uri
+        self.samples += other.samples
+        self.agreements += other.agreements
+        self.score_divergence_sum += other.score_divergence_sum
+        self.prod_latency_sum += other.prod_latency_sum
+        self.candidate_latency_sum += other.candidate_latency_sum
+        for prod_label, row in other.confusion.items():
+            mine = self.confusion.setdefault(prod_label, {})
+            for cand_label, n in row.items():
+                mine[cand_label] = mine.get(cand_label, 0) + n
+
+    def summary(self) -> dict:
+        n = self.samples
+        prod_ms = self.prod_latency_sum / n * 1000 if n else None
+        cand_ms = self.candidate_latency_sum / n * 1000 if n else None
+        return {
+            "candidate_uri": self.candidate_uri,
+            "samples": n,
+            "agreement_rate": self.agreements / n if n else None,
+            "mean_score_divergence": (
+                self.score_divergence_sum / self.agreements if self.agreements else None
+            ),
+            "prod_latency_ms": prod_ms,
+            "candidate_latency_ms": cand_ms,
+            "latency_ratio": cand_ms / prod_ms if prod_ms else None,
+            "confusion": self.confusion,
+        }
+
+
+def write_report(stats: ShadowStats, report_dir: str, pid: int | None = None) -> str:
+    """Scrive (in modo atomico) il report del processo corrente."""
+    os.makedirs(report_dir, exist_ok=True)
+    path = os.path.join(report_dir, f"{REPORT_PREFIX}{pid or os.getpid()}.json")
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump({"stats": asdict(stats), "summary": stats.summary()}, f, indent=2)
+    os.replace(tmp, path)
+    return path
+
+
+def read_reports(report_dir: str, candidate_uri: str | None = None) -> dict | None:
+    """Riepilogo unito dei report di tutti i worker (`None` se non ce ne sono).
+
+    Con `candidate_uri` si considerano solo i report di quel candidato.
+    """
+    merged = None
+    for path in sorted(glob.glob(os.path.join(report_dir, f"{REPORT_PREFIX}*.json"))):
+        with open(path) as f:
+            stats = ShadowStats(**json.load(f)["stats"])
+        if candidate_uri is not None and stats.candidate_uri != candidate_uri:
+            continue
+        if merged is None:
+            merged = ShadowStats()
+        merged.merge(stats)
+    return merged.summary() if merged is not None else None
@@ -1,17 +1,21 @@
-from fastapi import FastAPI
-from fastapi.responses import Response
+from fastapi import FastAPI, Header, Response
 from pydantic import BaseModel
+from typing import Literal
+import os
 import time
 
-from prometheus_client import (
-    Counter,
-    Histogram,
-    Gauge,
-    generate_latest,
-    CONTENT_TYPE_LATEST,
+from src.features.preprocess import normalize_text
+from src.serving.batching import DEFAULT_PRIORITY, PRIORITIES, DeadlineExceeded
+from src.serving.coalesce import SingleFlight
+from src.serving.metrics import (
+    DRIFT_FLAG,
+    MetricsMiddleware,
+    mark_process_dead,
+    observe_topology,
+    router as metrics_router,
 )
-
-from src.serving.load_model import predict_fn
+from src.serving import internal_api, models, profiling, runtime
+from src.utils.text_length import estimate_tokens, length_bucket
 
 
 # ====================================================
@@ -20,21 +24,13 @@ from src.serving.load_model import predict_fn
 app = FastAPI()
 
 # ====================================================
-# 2) Poi si definiscono le metriche
+# 2) Poi si monta la strumentazione (metriche in src/serving/metrics.py)
 # ====================================================
-REQUEST_COUNT = Counter("app_requests_total", "Total prediction requests")
-
-ERROR_COUNT = Counter("app_errors_total", "Total prediction errors")
-
-REQUEST_LATENCY = Histogram("app_request_latency_seconds", "Prediction latency")
-
-SENTIMENT_PREDICTIONS = Counter(
-    "app_sentiment_predictions_total",
-    "Total sentiment predictions by label",
-    ["sentiment_label"],
-)
-
-DRIFT_FLAG = Gauge("data_drift_flag", "1 if drift detected else 0")
+app.add_middleware(MetricsMiddleware)
+app.include_router(metrics_router)
+app.include_router(profiling.router)
+app.include_router(internal_api.router)
+app.include_router(models.router)
 
 
 # ====================================================
@@ -43,28 +39,118 @@ DRIFT_FLAG = Gauge("data_drift_flag", "1 if drift detected else 0")
 @app.on_event("startup")
 def startup_event():
     DRIFT_FLAG.set(0)
+    # thread torch/tokenizers e pinning dei core, prima di caricare il modello
+    observe_topology(runtime.configure_worker())
+
+
+@app.on_event("shutdown")
+def shutdown_event():
+    mark_process_dead()
 
 
 # ====================================================
 # API
 # ====================================================
+# richieste concorrenti con lo stesso testo normalizzato condividono
+# un'unica inferenza in volo
+COALESCE_REQUESTS = os.getenv("COALESCE_REQUESTS", "1") == "1"
+_inflight = SingleFlight()
+
+
 class Item(BaseModel):
     text: str
+    # alternativi agli header X-Priority / X-Deadline-Ms (il campo vince)
+    priority: Literal["high", "normal", "low"] | None = None
+    deadline_ms: float | None = None
+    # alias o "<nome>/<versione>" (src/serving/models.py), alternativo a X-Model
+    model: str | None = None
+
+
+def _score(
+    handle: models.ModelHandle,
+    text: str,
+    priority: str,
+    deadline: float | None,
+    n_tokens: int,
+    timings: dict,
+):
+    """Ritorna `((label, score), shared)`; `shared` è True per le richieste
+    che hanno atteso l'inferenza di un'altra (i tempi per stage in `timings`
+    sono allora quelli del leader)."""
+
+    led = False
+
+    def run():
+        nonlocal led
+        led = True
+        with models.manager.acquire(handle):
+            result = handle.scheduler.predict(
+                text, priority, deadline, timings, n_tokens
+            )
+        # i follower ricevono anche i tempi per stage dell'inferenza condivisa
+        return result, dict(timings)
+
+    if not COALESCE_REQUESTS:
+        return run()[0], False
+    key = (handle.name, priority, normalize_text(text))
+    try:
+        (result, leader_timings), shared = _inflight.do(key, run)
+    except DeadlineExceeded:
+        if led:
+            raise
+        # scartata per la deadline del leader, non per la propria: il
+        # follower riprova da solo con la sua deadline
+        return run()[0], False
+    if shared:
+        handle.scheduler.metrics.coalesced.inc()
+        timings.update(leader_timings)
+    return result, shared
 
 
 @app.post("/predict")
-def predict(item: Item):
-    start = time.time()
+def predict(
+    item: Item,
+    response: Response,
+    x_priority: str | None = Header(None),
+    x_deadline_ms: float | None = Header(None),
+    x_model: str | None = Header(None),
+):
+    start = time.perf_counter()
+    timings = {}
+    priority = item.priority or x_priority or DEFAULT_PRIORITY
+    if priority not in PRIORITIES:
+        response.status_code = 400
+        return {"error": f"priority must be one of {list(PRIORITIES)}"}
+    try:
+        handle = models.manager.resolve(item.model or x_model)
+    except KeyError as e:
+        response.status_code = 404
+        return {"error": f"unknown model {e}"}
+    metrics = handle.scheduler.metrics
+    budget_ms = item.deadline_ms if item.deadline_ms is not None else x_deadline_ms
+    deadline = start + budget_ms / 1000.0 if budget_ms is not None else None
+    n_tokens = estimate_tokens(item.text)
     try:
-        label, score = predict_fn(item.text)
-        REQUEST_COUNT.inc()
-        SENTIMENT_PREDICTIONS.labels(sentiment_label=label).inc()
+        with profiling.profiler.maybe_sample():
+            (label, score), shared = _score(
+                handle, item.text, priority, deadline, n_tokens, timings
+            )
+        metrics.prediction(label, timings)
+        if profiling.STAGE_TIMINGS_HEADER:
+            response.headers["Server-Timing"] = profiling.server_timing(
+                timings, time.perf_counter() - start, coalesced=shared
+            )
         return {"label": label, "score": score}
+    except DeadlineExceeded as e:
+        # scartata senza tempo modello: il client può ritentare
+        response.status_code = 503
+        return {"error": str(e)}
     except Exception as e:
-        ERROR_COUNT.inc()
+        metrics.errors.inc()
         return {"error": str(e)}
     finally:
-        REQUEST_LATENCY.observe(time.time() - start)
+        models.manager.release(handle)
+        metrics.request_latency(time.perf_counter() - start, length_bucket(n_tokens))
 
 
 @app.get("/")
@@ -75,9 +161,3 @@ def root():
 @app.get("/health")
 def health():
     return {"status": "ok"}
-
-
-@app.get("/metrics")
-def metrics():
-    data = generate_latest()
-    return Response(content=data, media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,166 @@
+# src/serving/autotune.py
+"""Autotuning di `max_batch_size` e attesa di flush dello scheduler (AIMD).
+
+Con `BATCH_AUTOTUNE=1` ogni `BatchScheduler` riporta qui, dopo ogni batch, la
+dimensione (con il limite della sua corsia), il tempo di inferenza e l'attesa
+in coda delle sue richieste. Ogni
+`BATCH_AUTOTUNE_INTERVAL` batch il controller confronta la p99 della latenza
+(coda + inferenza) osservata con l'obiettivo `BATCH_SLO_P99_MS`:
+
+- p99 oltre l'SLO: se i batch sono pieni la latenza viene dalla coda e la
+  dimensione massima cresce (più throughput); altrimenti decremento
+  moltiplicativo di dimensione massima e attesa;
+- p99 sotto `HEADROOM` x SLO: se i batch si riempiono la dimensione massima
+  cresce di `BATCH_SIZE_STEP` (se il tempo stimato del batch più grande resta
+  entro metà SLO), altrimenti cresce l'attesa di `BATCH_WAIT_STEP_MS` per
+  raccogliere più richieste per batch (latenza in più, ma entro l'SLO);
+- altrimenti i valori restano invariati.
+
+I valori restano tra `BATCH_MIN_SIZE`..`BATCH_SIZE_LIMIT` e
+0..`BATCH_WAIT_LIMIT_MS`; valori correnti e decisioni sono esposti come
+metriche (`app_batch_autotune_*`).
+"""
+
+import math
+import os
+import threading
+
+from src.serving.metrics import observe_autotune
+
+BATCH_AUTOTUNE = os.getenv("BATCH_AUTOTUNE", "0") == "1"
+BATCH_SLO_P99_MS = float(os.getenv("BATCH_SLO_P99_MS", "200"))
+BATCH_MIN_SIZE = int(os.getenv("BATCH_MIN_SIZE", "1"))
+BATCH_SIZE_LIMIT = int(os.getenv("BATCH_SIZE_LIMIT", "64"))
+BATCH_WAIT_LIMIT_MS = float(os.getenv("BATCH_WAIT_LIMIT_MS", "20"))
+BATCH_SIZE_STEP = int(os.getenv("BATCH_SIZE_STEP", "2"))
+BATCH_WAIT_STEP_MS = float(os.getenv("BATCH_WAIT_STEP_MS", "1"))
+BATCH_AUTOTUNE_INTERVAL = int(os.getenv("BATCH_AUTOTUNE_INTERVAL", "20"))
+
+HEADROOM = 0.8
+DECREASE = 0.5
+# quota di riempimento oltre cui i batch si considerano pieni
+FULL = 0.9
+# peso dell'ultima osservazione nella media mobile del tempo per batch
+_EWMA = 0.2
+
+
+def _p99(values: list) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, math.ceil(0.99 * len(ordered)) - 1)]
+
+
+class BatchAutotuner:
+    def __init__(
+        self,
+        scheduler,
+        model: str,
+        slo_p99_ms: float = BATCH_SLO_P99_MS,
+        min_size: int = BATCH_MIN_SIZE,
+        size_limit: int = BATCH_SIZE_LIMIT,
+        wait_limit_ms: float = BATCH_WAIT_LIMIT_MS,
+        size_step: int = BATCH_SIZE_STEP,
+        wait_step_ms: float = BATCH_WAIT_STEP_MS,
+        interval: int = BATCH_AUTOTUNE_INTERVAL,
+    ):
+        self.scheduler = scheduler
+        self.model = model
+        self.slo = slo_p99_ms / 1000.0
+        self.min_size = max(1, min_size)
+        self.size_limit = max(self.min_size, size_limit)
+        self.wait_limit = wait_limit_ms / 1000.0
+        self.size_step = max(1, size_step)
+        self.wait_step = wait_step_ms / 1000.0
+        self.interval = max(1, interval)
+        self._lock = threading.Lock()
+        self._latencies: list = []
+        # riempimento di ogni batch rispetto al limite della sua corsia
+        self._fills: list = []
+        # tempo medio di inferenza per dimensione di batch
+        self.batch_seconds: dict = {}
+        self.last_p99 = None
+        scheduler.max_batch_size = min(
+            max(scheduler.max_batch_size, self.min_size), self.size_limit
+        )
+        scheduler.max_wait = min(scheduler.max_wait, self.wait_limit)
+        observe_autotune(self.model, self.settings())
+
+    def settings(self) -> dict:
+        return {
+            "max_batch_size": self.scheduler.max_batch_size,
+            "max_wait_ms": self.scheduler.max_wait * 1000.0,
+        }
+
+    def observe(
+        self,
+        batch_size: int,
+        inference_s: float,
+        waits: list,
+        limit: int | None = None,
+    ) -> None:
+        """Un batch completato: `waits` sono le attese in coda delle richieste,
+        `limit` la dimensione massima usata per quel batch (la corsia lunga ha
+        `long_batch_size`; default `max_batch_size`)."""
+        limit = limit or self.scheduler.max_batch_size
+        with self._lock:
+            prev = self.batch_seconds.get(batch_size)
+            self.batch_seconds[batch_size] = (
+                inference_s if prev is None else prev + _EWMA * (inference_s - prev)
+            )
+            self._latencies.extend(w + inference_s for w in waits)
+            self._fills.append(batch_size / limit)
+            if len(self._fills) < self.interval:
+                return
+            latencies, fills = self._latencies, self._fills
+            self._latencies, self._fills = [], []
+        self._decide(latencies, fills)
+
+    def estimate_batch_seconds(self, size: int) -> float | None:
+        """Tempo stimato di un batch da `size` testi (scala lineare dal batch
+        osservato più vicino, stima prudente: ignora l'overhead fisso)."""
+        if not self.batch_seconds:
+            return None
+        nearest = min(self.batch_seconds, key=lambda s: abs(s - size))
+        return self.batch_seconds[nearest] * size / nearest
+
+    def _grow(self) -> bool:
+        """Incremento additivo della dimensione, se il batch stimato sta entro
+        metà SLO."""
+        s = self.scheduler
+        if s.max_batch_size >= self.size_limit:
+            return False
+        size = min(self.size_limit, s.max_batch_size + self.size_step)
+        estimate = self.estimate_batch_seconds(size)
+        if estimate is not None and estimate > self.slo / 2:
+            return False
+        s.max_batch_size = size
+        return True
+
+    def _decide(self, latencies: list, fills: list) -> str:
+        s = self.scheduler
+        p99 = self.last_p99 = _p99(latencies) if latencies else None
+        fill = sum(fills) / len(fills)
+        decision = "hold"
+        if p99 is None:
+            pass
+        elif p99 > self.slo:
+            # batch pieni: la latenza è coda, serve throughput; altrimenti pesa
+            # il batch stesso (o l'attesa di flush) e si riduce
+            if fill >= FULL and self._grow():
+                decision = "increase_size"
+            else:
+                size = max(self.min_size, int(s.max_batch_size * DECREASE))
+                wait = s.max_wait * DECREASE
+                if wait < self.wait_step:
+                    wait = 0.0
+                if (size, wait) != (s.max_batch_size, s.max_wait):
+                    s.max_batch_size, s.max_wait = size, wait
+                    decision = "decrease"
+        elif p99 < HEADROOM * self.slo:
+            if fill >= FULL:
+                if self._grow():
+                    decision = "increase_size"
+            elif s.max_wait < self.wait_limit:
+                s.max_wait = min(self.wait_limit, s.max_wait + self.wait_step)
+                decision = "increase_wait"
+        observe_autotune(self.model, self.settings(), decision, p99)
+        return decision
@@ -0,0 +1,246 @@
+# src/serving/batching.py
+"""Scheduler dei batch di inferenza con priorità e deadline.
+
+Le richieste `/predict` vengono accodate in una corsia per classe di priorità
+(`high`, `normal`, `low`). I batch si formano pescando prima dalle corsie a
+priorità più alta, fino a `BATCH_MAX_SIZE` testi; le richieste la cui deadline
+è già scaduta vengono scartate (shed) prima di spendere tempo modello.
+
+Non c'è un thread dedicato: il primo thread in attesa diventa "runner" ed
+esegue i batch per tutti (group commit) finché la sua richiesta non è servita,
+poi cede il ruolo a un altro thread in attesa. Così il lavoro resta sui thread
+delle richieste e non serve gestire il ciclo di vita di un worker. Per il
+profiling (`src/serving/profiling.py`) il lavoro del modello è attribuito al
+thread runner, anche per i testi delle altre richieste del batch; lo stack di
+un thread che attende il runner è solo un `Condition.wait`.
+
+I testi lunghi (token stimati oltre `LONG_TEXT_THRESHOLD`, vedi
+`src/utils/text_length.py`) hanno corsie proprie: non finiscono mai nello
+stesso batch dei testi corti, di cui gonfierebbero il padding, e formano batch
+più piccoli (`LONG_BATCH_MAX_SIZE`). La `LengthPolicy` decide anche se
+troncarli o dividerli in finestre.
+
+Variabili d'ambiente: `BATCH_MAX_SIZE` (default 16), `LONG_BATCH_MAX_SIZE`
+(default 4), `BATCH_MAX_WAIT_MS` (default 0: si prende ciò che è già in coda,
+senza attendere altri arrivi). Con `BATCH_AUTOTUNE=1` dimensione massima e
+attesa diventano i valori iniziali di un controller AIMD guidato dalla p99
+(`src/serving/autotune.py`).
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+
+from src.serving import load_model
+from src.serving.autotune import BATCH_AUTOTUNE, BatchAutotuner
+from src.serving.shadow import shadow
+from src.serving.metrics import DEFAULT_MODEL, PRIORITIES, model_metrics
+from src.utils.text_length import LengthPolicy, estimate_tokens, predict_texts
+
+DEFAULT_PRIORITY = "normal"
+
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "16"))
+LONG_BATCH_MAX_SIZE = int(os.getenv("LONG_BATCH_MAX_SIZE", "4"))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "0"))
+
+
+class DeadlineExceeded(Exception):
+    """La deadline della richiesta è scaduta prima dell'inferenza."""
+
+
+@dataclass
+class _Job:
+    text: str
+    priority: str
+    deadline: float | None
+    long: bool = False
+    enqueued: float = field(default_factory=time.perf_counter)
+    waited: float = 0.0
+    timings: dict = field(default_factory=dict)
+    future: Future = field(default_factory=Future)
+
+
+class BatchScheduler:
+    def __init__(
+        self,
+        predict_batch=None,
+        max_batch_size: int = BATCH_MAX_SIZE,
+        max_wait_ms: float = BATCH_MAX_WAIT_MS,
+        long_batch_size: int = LONG_BATCH_MAX_SIZE,
+        policy: LengthPolicy | None = None,
+        model: str = DEFAULT_MODEL,
+        mirror: bool = True,
+        autotune: bool = BATCH_AUTOTUNE,
+    ):
+        self._predict_batch = predict_batch
+        self.metrics = model_metrics(model)
+        # solo il modello di default (Production) viene copiato sullo shadow
+        self.mirror = mirror
+        self.max_batch_size = max(1, max_batch_size)
+        self.long_batch_size = max(1, long_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self.policy = policy or LengthPolicy.from_env()
+        self._cond = threading.Condition()
+        # corsie (priorità, testo lungo) in ordine di servizio
+        self._order = [(p, long) for p in PRIORITIES for long in (False, True)]
+        self._lanes = {key: deque() for key in self._order}
+        self._pending = 0
+        self._running = False
+        self.autotuner = BatchAutotuner(self, model) if autotune else None
+
+    def predict(
+        self,
+        text: str,
+        priority: str = DEFAULT_PRIORITY,
+        deadline: float | None = None,
+        timings: dict | None = None,
+        n_tokens: int | None = None,
+    ):
+        """Ritorna `(label, score)`; `deadline` è un istante `time.perf_counter()`.
+
+        Solleva `DeadlineExceeded` se la richiesta viene scartata.
+        """
+        job = self._job(text, priority, deadline, n_tokens)
+        self._wait([job])
+        result = job.future.result()
+        if timings is not None:
+            timings["queue"] = job.waited
+            timings.update(job.timings)
+        return result
+
+    def predict_many(
+        self,
+        texts: list,
+        priority: str = DEFAULT_PRIORITY,
+        deadline=None,
+    ) -> list:
+        """Accoda tutti i testi insieme e attende; ritorna un `Future` per testo
+        (già completato), così gli errori restano per elemento.
+
+        `deadline` è un istante unico o una lista allineata a `texts`.
+        """
+        if deadline is None or isinstance(deadline, (int, float)):
+            deadline = [deadline] * len(texts)
+        jobs = [
+            self._job(text, priority, d, None, raise_expired=False)
+            for text, d in zip(texts, deadline)
+        ]
+        self._wait(jobs)
+        return [job.future for job in jobs]
+
+    def _job(self, text, priority, deadline, n_tokens, raise_expired=True) -> _Job:
+        if priority not in PRIORITIES:
+            raise ValueError(f"priority must be one of {PRIORITIES}, got {priority!r}")
+        if n_tokens is None:
+            n_tokens = estimate_tokens(text)
+        job = _Job(text, priority, deadline, self.policy.is_long(n_tokens))
+        if deadline is not None and job.enqueued >= deadline:
+            self.metrics.shed[priority].inc()
+            exc = DeadlineExceeded("deadline exceeded before queueing")
+            if raise_expired:
+                raise exc
+            job.future.set_exception(exc)
+        return job
+
+    def _wait(self, jobs: list) -> None:
+        jobs = [job for job in jobs if not job.future.done()]
+
+        def done():
+            return all(job.future.done() for job in jobs)
+
+        with self._cond:
+            for job in jobs:
+                self._lanes[(job.priority, job.long)].append(job)
+            self._pending += len(jobs)
+            self._cond.notify_all()
+            while self._running and not done():
+                self._cond.wait()
+            runner = not done()
+            if runner:
+                self._running = True
+        if runner:
+            try:
+                while not done():
+                    self._run_once()
+            finally:
+                with self._cond:
+                    self._running = False
+                    self._cond.notify_all()
+
+    def pending(self) -> dict:
+        with self._cond:
+            return {
+                p: len(self._lanes[(p, False)]) + len(self._lanes[(p, True)])
+                for p in PRIORITIES
+            }
+
+    def _take_locked(self) -> tuple[list, list, int]:
+        now = time.perf_counter()
+        batch, expired = [], []
+        # la corsia non vuota più prioritaria decide se il batch è corto o lungo
+        head = next((key for key in self._order if self._lanes[key]), None)
+        if head is None:
+            return batch, expired, self.max_batch_size
+        long = head[1]
+        limit = self.long_batch_size if long else self.max_batch_size
+        for priority in PRIORITIES:
+            lane = self._lanes[(priority, long)]
+            while lane and len(batch) < limit:
+                job = lane.popleft()
+                self._pending -= 1
+                job.waited = now - job.enqueued
+                self.metrics.queue_wait[priority].observe(job.waited)
+                if job.deadline is not None and now >= job.deadline:
+                    expired.append(job)
+                else:
+                    batch.append(job)
+        return batch, expired, limit
+
+    def _run_once(self) -> None:
+        with self._cond:
+            if self.max_wait > 0 and self._pending < self.max_batch_size:
+                self._cond.wait_for(
+                    lambda: self._pending >= self.max_batch_size, self.max_wait
+                )
+            batch, expired, limit = self._take_locked()
+        for job in expired:
+            self.metrics.shed[job.priority].inc()
+            job.future.set_exception(DeadlineExceeded("deadline exceeded in queue"))
+        if batch:
+            self._run_batch(batch, limit)
+        with self._cond:
+            self._cond.notify_all()
+
+    def _run_batch(self, batch: list, limit: int) -> None:
+        predict_batch = self._predict_batch or load_model.predict_batch
+        timings: dict = {}
+        self.metrics.batch_size.observe(len(batch))
+        start = time.perf_counter()
+        try:
+            results = predict_texts(
+                predict_batch, [job.text for job in batch], self.policy, timings
+            )
+        except Exception as exc:
+            for job in batch:
+                job.future.set_exception(exc)
+            return
+        elapsed = time.perf_counter() - start
+        for job, result in zip(batch, results):
+            job.timings = timings
+            job.future.set_result(result)
+        if self.autotuner is not None:
+            # dopo i risultati: la decisione non pesa sulla latenza del batch
+            self.autotuner.observe(
+                len(batch), elapsed, [job.waited for job in batch], limit
+            )
+        if self.mirror:
+            # copia asincrona verso il candidato (no-op senza SHADOW_MODEL_URI)
+            shadow.mirror(
+                [job.text for job in batch], results, sum(timings.values()) / len(batch)
+            )
+
+
+scheduler = BatchScheduler()
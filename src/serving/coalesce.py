@@ -0,0 +1,48 @@
+# src/serving/coalesce.py
+"""Single-flight: richieste concorrenti con la stessa chiave condividono
+un'unica esecuzione.
+
+Il primo chiamante per una chiave (leader) esegue la funzione; chi arriva
+mentre è ancora in corso attende lo stesso `Future` e riceve lo stesso
+risultato (o la stessa eccezione). A esecuzione conclusa la chiave viene
+rilasciata: non è una cache, copre solo la finestra in cui la richiesta è
+in volo (es. burst di retweet identici durante eventi virali).
+"""
+
+import threading
+from concurrent.futures import Future
+from typing import Callable, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight: dict[Hashable, Future] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], T]) -> tuple[T, bool]:
+        """Ritorna `(risultato, shared)`; `shared` è True per chi non ha
+        eseguito `fn` ma ha atteso il leader."""
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+        if not leader:
+            return future.result(), True
+        try:
+            result = fn()
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def inflight(self) -> int:
+        with self._lock:
+            return len(self._inflight)
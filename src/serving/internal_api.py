@@ -0,0 +1,257 @@
+# src/serving/internal_api.py
+"""Interfaccia di inferenza ad alto throughput per il traffico interno.
+
+Affianca `/predict` (JSON + pydantic) riusando lo stesso scheduler dei batch
+(`src/serving/batching.py`) e quindi lo stesso caricamento del modello:
+
+- `POST /v1/predict/batch`: body `{"texts": [...]}` (o direttamente la lista),
+  risposta `{"predictions": [{"label", "score"} | {"error"}, ...]}`. Niente
+  modello pydantic: (de)serializzazione con orjson, se installato.
+- `WS /v1/predict/stream`: stream bidirezionale su WebSocket. Ogni messaggio
+  è `{"id": ..., "text": "..."}` oppure `{"id": ..., "texts": [...]}` (con
+  `deadline_ms` opzionale); la risposta arriva con lo stesso `id`, nell'ordine
+  dei messaggi. I messaggi in arrivo mentre un batch è in corso vengono
+  raggruppati nel batch successivo (fino a `STREAM_CHUNK_SIZE` messaggi).
+
+Al più `MAX_BATCH_TEXTS` testi per richiesta (413) o per messaggio (errore
+sul messaggio, lo stream resta aperto).
+
+Priorità, deadline e modello come per `/predict`: header `X-Priority` /
+`X-Deadline-Ms` / `X-Model` o campi `priority` / `deadline_ms` / `model` (per lo
+stream solo header, validi per tutta la connessione).
+"""
+
+import asyncio
+import math
+import os
+import time
+
+from fastapi import Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.routing import APIRouter
+from starlette.concurrency import run_in_threadpool
+
+from src.serving import batching, models
+
+try:
+    import orjson
+
+    _dumps = orjson.dumps
+    _loads = orjson.loads
+except ImportError:  # pragma: no cover - fallback senza orjson
+    import json
+
+    def _dumps(obj) -> bytes:
+        return json.dumps(obj, separators=(",", ":")).encode()
+
+    _loads = json.loads
+
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", str(batching.BATCH_MAX_SIZE)))
+# testi massimi per richiesta batch o messaggio dello stream: una sola chiamata
+# non può riempire le code condivise e tenere occupato il runner
+MAX_BATCH_TEXTS = int(os.getenv("MAX_BATCH_TEXTS", "256"))
+
+router = APIRouter()
+
+
+def _json(obj, status_code: int = 200) -> Response:
+    return Response(_dumps(obj), status_code=status_code, media_type="application/json")
+
+
+def _budget(value) -> float | None:
+    """`deadline_ms` (campo JSON o header) -> millisecondi; ValueError se non
+    è un numero finito."""
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError("deadline_ms must be a number")
+    try:
+        budget = float(value)
+    except ValueError:
+        raise ValueError("deadline_ms must be a number") from None
+    if not math.isfinite(budget):
+        raise ValueError("deadline_ms must be a number")
+    return budget
+
+
+def _deadline(received: float, budget_ms: float | None) -> float | None:
+    return received + budget_ms / 1000.0 if budget_ms is not None else None
+
+
+def _predict_many(handle: models.ModelHandle, texts, priority, deadline) -> list:
+    with models.manager.acquire(handle):
+        return handle.scheduler.predict_many(texts, priority, deadline)
+
+
+def _outcomes(handle: models.ModelHandle, futures) -> list:
+    metrics = handle.scheduler.metrics
+    out = []
+    for future in futures:
+        exc = future.exception()
+        if exc is not None:
+            metrics.errors.inc()
+            out.append({"error": str(exc)})
+            continue
+        label, score = future.result()
+        metrics.prediction(label)
+        out.append({"label": label, "score": score})
+    return out
+
+
+def _valid_texts(texts) -> bool:
+    return isinstance(texts, list) and all(isinstance(t, str) for t in texts)
+
+
+@router.post("/v1/predict/batch")
+async def predict_batch(request: Request):
+    received = time.perf_counter()
+    try:
+        payload = _loads(await request.body())
+    except ValueError:
+        return _json({"error": "invalid JSON body"}, 400)
+    options = payload if isinstance(payload, dict) else {}
+    texts = options.get("texts") if isinstance(payload, dict) else payload
+    if not _valid_texts(texts):
+        return _json({"error": "texts must be a list of strings"}, 422)
+    if len(texts) > MAX_BATCH_TEXTS:
+        return _json({"error": f"at most {MAX_BATCH_TEXTS} texts per request"}, 413)
+    priority = (
+        options.get("priority")
+        or request.headers.get("x-priority")
+        or batching.DEFAULT_PRIORITY
+    )
+    if priority not in batching.PRIORITIES:
+        return _json(
+            {"error": f"priority must be one of {list(batching.PRIORITIES)}"}, 400
+        )
+    try:
+        budget = _budget(
+            options.get("deadline_ms", request.headers.get("x-deadline-ms"))
+        )
+    except ValueError as e:
+        return _json({"error": str(e)}, 400)
+    model = options.get("model") or request.headers.get("x-model")
+    if model is not None and not isinstance(model, str):
+        return _json({"error": "model must be a string"}, 422)
+    try:
+        handle = models.manager.resolve(model)
+    except KeyError as e:
+        return _json({"error": f"unknown model {e}"}, 404)
+    try:
+        futures = await run_in_threadpool(
+            _predict_many, handle, texts, priority, _deadline(received, budget)
+        )
+        return _json({"predictions": _outcomes(handle, futures)})
+    finally:
+        models.manager.release(handle)
+
+
+def _parse_message(data, received: float, default_budget) -> dict:
+    """Messaggio dello stream -> `{"id", "texts", "deadline", "single"}` o `{"id", "error"}`."""
+    try:
+        msg = _loads(data)
+    except ValueError:
+        return {"id": None, "error": "invalid JSON message"}
+    if not isinstance(msg, dict):
+        return {"id": None, "error": "message must be an object"}
+    single = "text" in msg
+    texts = [msg["text"]] if single else msg.get("texts")
+    if not _valid_texts(texts):
+        return {"id": msg.get("id"), "error": "text/texts must be strings"}
+    if len(texts) > MAX_BATCH_TEXTS:
+        return {
+            "id": msg.get("id"),
+            "error": f"at most {MAX_BATCH_TEXTS} texts per message",
+        }
+    try:
+        budget = _budget(msg.get("deadline_ms", default_budget))
+    except ValueError as e:
+        return {"id": msg.get("id"), "error": str(e)}
+    return {
+        "id": msg.get("id"),
+        "texts": texts,
+        "deadline": _deadline(received, budget),
+        "single": single,
+    }
+
+
+@router.websocket("/v1/predict/stream")
+async def predict_stream(ws: WebSocket):
+    await ws.accept()
+    priority = ws.headers.get("x-priority") or batching.DEFAULT_PRIORITY
+    if priority not in batching.PRIORITIES:
+        await ws.close(code=1008, reason="invalid priority")
+        return
+    default_budget = ws.headers.get("x-deadline-ms")
+    try:
+        _budget(default_budget)
+    except ValueError:
+        await ws.close(code=1008, reason="invalid X-Deadline-Ms")
+        return
+    try:
+        handle = models.manager.resolve(ws.headers.get("x-model"))
+    except KeyError:
+        await ws.close(code=1008, reason="unknown model")
+        return
+    inbox: asyncio.Queue = asyncio.Queue()
+
+    async def reader():
+        try:
+            while True:
+                message = await ws.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                data = message.get("bytes") or message.get("text") or ""
+                inbox.put_nowait((data, isinstance(data, bytes), time.perf_counter()))
+        except WebSocketDisconnect:
+            pass
+        finally:
+            inbox.put_nowait(None)
+
+    task = asyncio.create_task(reader())
+    try:
+        closing = False
+        while not closing:
+            item = await inbox.get()
+            if item is None:
+                break
+            group = [item]
+            # messaggi già arrivati: stesso batch, fino a STREAM_CHUNK_SIZE
+            while not inbox.empty() and len(group) < STREAM_CHUNK_SIZE:
+                nxt = inbox.get_nowait()
+                if nxt is None:
+                    closing = True
+                    break
+                group.append(nxt)
+            parsed = [_parse_message(d, t, default_budget) for d, _, t in group]
+            texts, deadlines = [], []
+            for msg in parsed:
+                for text in msg.get("texts", ()):
+                    texts.append(text)
+                    deadlines.append(msg["deadline"])
+            futures = await run_in_threadpool(
+                _predict_many, handle, texts, priority, deadlines
+            )
+            outcomes = iter(_outcomes(handle, futures))
+            for (_, binary, _), msg in zip(group, parsed):
+                if "error" in msg:
+                    reply = msg
+                else:
+                    preds = [next(outcomes) for _ in msg["texts"]]
+                    reply = (
+                        {"id": msg["id"], **preds[0]}
+                        if msg["single"]
+                        else {
+                            "id": msg["id"],
+                            "predictions": preds,
+                        }
+                    )
+                body = _dumps(reply)
+                if binary:
+                    await ws.send_bytes(body)
+                else:
+                    await ws.send_text(body.decode())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        task.cancel()
+        models.manager.release(handle)
@@ -1,16 +1,14 @@
 import logging
 import os
+import time
 
-import mlflow
-import mlflow.pyfunc
-from transformers import (
-    AutoModelForSequenceClassification,
-    AutoTokenizer,
-    TextClassificationPipeline,
-)
+from src.models import early_exit
+from src.utils.labels import from_logits, normalize_label as _normalize_label
+from src.utils.tokenization import token_cache
 
+# mlflow e transformers (quindi torch) vengono importati solo al primo uso:
+# importare l'app o questo modulo non deve costare il caricamento del backend.
 MODEL_ID = "cardiffnlp/twitter-roberta-base-sentiment-latest"
-_label_map = {0: "negative", 1: "neutral", 2: "positive"}
 
 MODEL_URI = os.getenv("MODEL_URI")  # es. models:/Sentiment/Production
 STRICT_REGISTRY = os.getenv("STRICT_REGISTRY", "0") == "1"
@@ -23,14 +21,18 @@ class _FallbackPipeline:
     """Fallback pipeline usata quando il download HF non è disponibile."""
 
     def __call__(self, text, truncation=True):  # type: ignore[override]
-        return [{"label": "neutral", "score": 0.0}]
+        n = len(text) if isinstance(text, list) else 1
+        return [{"label": "neutral", "score": 0.0} for _ in range(n)]
 
 
-def _normalize_label(raw_label: str) -> str:
-    if isinstance(raw_label, str) and raw_label.startswith("LABEL_"):
-        idx = int(raw_label.split("_")[-1])
-        return _label_map.get(idx, raw_label)
-    return str(raw_label).lower()
+def _configure_threads():
+    # numero di thread torch secondo la topologia del worker (src.serving.runtime)
+    from src.serving.runtime import configure_torch, current_topology
+
+    try:
+        configure_torch(current_topology())
+    except ImportError:
+        pass
 
 
 def get_pipeline():
@@ -39,6 +41,13 @@ def get_pipeline():
     global _pipeline, _tokenizer, _model
     if _pipeline is None:
         try:
+            from transformers import (
+                AutoModelForSequenceClassification,
+                AutoTokenizer,
+                TextClassificationPipeline,
+            )
+
+            _configure_threads()
             _tokenizer = AutoTokenizer.from_pretrained(MODEL_ID)
             _model = AutoModelForSequenceClassification.from_pretrained(MODEL_ID)
             _pipeline = TextClassificationPipeline(
@@ -56,6 +65,9 @@ def _try_get_mlflow_model():
     global _mlflow_model
     if MODEL_URI and _mlflow_model is None:
         try:
+            import mlflow.pyfunc
+
+            _configure_threads()
             _mlflow_model = mlflow.pyfunc.load_model(MODEL_URI)
         except Exception as e:
             logger.warning("Could not load model from URI '%s': %s", MODEL_URI, e)
@@ -66,19 +78,80 @@ def _try_get_mlflow_model():
     return _mlflow_model
 
 
-def predict_fn(text: str):
+def _record(timings: dict | None, stage: str, start: float) -> float:
+    now = time.perf_counter()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + (now - start)
+    return now
+
+
+def parse_output(out) -> tuple[str, float]:
+    if isinstance(out, list):  # top-k: si prende la prima classe
+        out = out[0]
+    if isinstance(out, dict):
+        return _normalize_label(out["label"]), float(out["score"])
+    # modelli che ritornano solo l'etichetta (es. sklearn)
+    return _normalize_label(out), 1.0
+
+
+def predict_batch(texts: list[str], timings: dict | None = None) -> list:
+    """Versione batch di `predict_fn`: una sola chiamata al modello per tutti
+    i testi, ritorna una lista di `(label, score)` nello stesso ordine."""
     m = _try_get_mlflow_model()
     if m is not None:
-        out = m.predict([text])[0]
-        label = _normalize_label(out["label"])  # type: ignore[index]
-        score = float(out["score"])  # type: ignore[index]
-        return label, score
-    # fallback HF
+        return predict_pyfunc_batch(m, texts, timings)
+    return predict_pipeline_batch(texts, timings)
+
+
+def predict_pyfunc_batch(model, texts: list[str], timings: dict | None = None) -> list:
+    """`predict_batch` per un modello MLflow pyfunc già caricato."""
+    t = time.perf_counter()
+    outputs = model.predict(list(texts))
+    t = _record(timings, "inference", t)
+    results = [parse_output(out) for out in outputs]
+    _record(timings, "postprocessing", t)
+    return results
+
+
+def predict_pipeline_batch(texts: list[str], timings: dict | None = None) -> list:
+    """Come `predict_batch`, ma sempre con la pipeline HF (o lo stub)."""
+    t = time.perf_counter()
     pipe = get_pipeline()
-    res = pipe(text, truncation=True)
-    first = res[0] if isinstance(res, list) else res
-    if isinstance(first, list):
-        first = first[0]
-    label = _normalize_label(first["label"])  # type: ignore[index]
-    score = float(first["score"])  # type: ignore[index]
-    return label, score
+    tokenizer = getattr(pipe, "tokenizer", None)
+    model = getattr(pipe, "model", None)
+    if tokenizer is not None and model is not None:
+        # pipeline HF reale: stage separati invece della chiamata monolitica
+        import torch
+
+        # id in cache per i testi già visti (retweet, duplicati)
+        enc, _ = token_cache.encode(tokenizer, list(texts))
+        t = _record(timings, "tokenization", t)
+        heads = early_exit.heads_from_env()
+        if heads is not None:
+            # EARLY_EXIT_HEADS: gli esempi facili escono dai layer intermedi
+            probs, _ = early_exit.forward_probs(model, enc, heads)
+            codes = probs.argmax(axis=-1)
+            scores = probs[range(len(codes)), codes]
+        else:
+            with torch.no_grad():
+                logits = model(**enc).logits
+            codes, scores = from_logits(logits.float().numpy())
+        t = _record(timings, "inference", t)
+        id2label = model.config.id2label
+        results = [
+            (_normalize_label(id2label.get(int(c), f"LABEL_{int(c)}")), float(p))
+            for c, p in zip(codes, scores)
+        ]
+        _record(timings, "postprocessing", t)
+        return results
+    outputs = pipe(list(texts), truncation=True)
+    t = _record(timings, "inference", t)
+    results = [parse_output(out) for out in outputs]
+    _record(timings, "postprocessing", t)
+    return results
+
+
+def predict_fn(text: str, timings: dict | None = None):
+    """Ritorna `(label, score)`; se `timings` è un dict vi accumula i secondi
+    spesi per stage (`tokenization`, `inference`, `postprocessing`)."""
+    return predict_batch([text], timings)[0]
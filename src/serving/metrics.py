@@ -1,15 +1,363 @@
 # src/serving/metrics.py
+"""Strumentazione Prometheus della serving app.
+
+- Metriche applicative (`app_*`) e HTTP (`api_*`, via `MetricsMiddleware`)
+  definite in un unico punto.
+- I figli delle metriche con label noti a priori (etichetta di sentiment,
+  stage di inferenza, route) sono pre-istanziati: sul path caldo si chiama
+  direttamente `.inc()`/`.observe()` senza il lookup di `.labels(...)`.
+- Con `PROMETHEUS_MULTIPROC_DIR` impostato (uvicorn/gunicorn con più worker)
+  `/metrics` aggrega i valori di tutti i processi (`MultiProcessCollector`).
+- L'esposizione (`generate_latest`) gira nel threadpool, fuori dall'event loop.
+"""
+
+import os
 import time
+
+from fastapi import Response
+from fastapi.routing import APIRouter
 from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
     Counter,
-    Histogram,
     Gauge,
+    Histogram,
     generate_latest,
-    CONTENT_TYPE_LATEST,
 )
-from fastapi import Response
-from fastapi.routing import APIRouter
+from starlette.concurrency import run_in_threadpool
+
+from src.utils.labels import LABELS
+from src.utils.text_length import LENGTH_BUCKETS
+
+STAGES = ("tokenization", "inference", "postprocessing")
+# corsie di priorità dello scheduler dei batch (src/serving/batching.py)
+PRIORITIES = ("high", "normal", "low")
+
+# ====================================================
+# Metriche applicative (/predict), tutte con label `model`
+# ====================================================
+# nome del modello servito quando la richiesta non ne sceglie uno
+DEFAULT_MODEL = "default"
+
+_LATENCY_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+)
 
+REQUEST_COUNT = Counter("app_requests_total", "Total prediction requests", ["model"])
+
+ERROR_COUNT = Counter("app_errors_total", "Total prediction errors", ["model"])
+
+REQUEST_LATENCY = Histogram(
+    "app_request_latency_seconds", "Prediction latency", ["model"]
+)
+
+LENGTH_LATENCY = Histogram(
+    "app_request_latency_by_length_seconds",
+    "Prediction latency by input length bucket (estimated tokens, upper bound)",
+    ["model", "length_bucket"],
+)
+
+STAGE_LATENCY = Histogram(
+    "app_inference_stage_seconds",
+    "Prediction latency split by inference stage",
+    ["model", "stage"],
+    buckets=_LATENCY_BUCKETS,
+)
+
+COALESCED_REQUESTS = Counter(
+    "app_coalesced_requests_total",
+    "Prediction requests served by an identical in-flight inference "
+    "(model calls saved)",
+    ["model"],
+)
+
+QUEUE_WAIT = Histogram(
+    "app_queue_wait_seconds",
+    "Time spent queued before batch formation, by priority lane",
+    ["model", "priority"],
+    buckets=_LATENCY_BUCKETS,
+)
+
+SHED_REQUESTS = Counter(
+    "app_shed_requests_total",
+    "Requests dropped because their deadline expired before inference",
+    ["model", "priority"],
+)
+
+BATCH_SIZE = Histogram(
+    "app_batch_size",
+    "Number of texts per inference batch",
+    ["model"],
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+
+SENTIMENT_PREDICTIONS = Counter(
+    "app_sentiment_predictions_total",
+    "Total sentiment predictions by label",
+    ["model", "sentiment_label"],
+)
+
+MODEL_LOADS = Counter(
+    "app_model_loads_total", "Models loaded by the model manager", ["model"]
+)
+
+MODEL_EVICTIONS = Counter(
+    "app_model_evictions_total",
+    "Models evicted by the model manager to stay within the memory budget",
+    ["model"],
+)
+
+MODEL_MEMORY = Gauge(
+    "app_model_memory_bytes",
+    "Estimated resident memory of each loaded model (0 once evicted)",
+    ["model"],
+    multiprocess_mode="liveall",
+)
+
+SHADOW_COMPARISONS = Counter(
+    "app_shadow_comparisons_total",
+    "Live texts re-scored by the shadow candidate, by label agreement",
+    ["outcome"],
+)
+
+SHADOW_DROPPED = Counter(
+    "app_shadow_dropped_total", "Shadow samples dropped because the queue was full"
+)
+
+SHADOW_SCORE_DIVERGENCE = Histogram(
+    "app_shadow_score_divergence",
+    "Absolute top-1 score difference production vs candidate (agreeing labels)",
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 1.0),
+)
+
+SHADOW_LATENCY = Histogram(
+    "app_shadow_latency_seconds",
+    "Per-text model latency of production and shadow candidate",
+    ["model"],
+    buckets=_LATENCY_BUCKETS,
+)
+
+AUTOTUNE_SETTING = Gauge(
+    "app_batch_autotune_setting",
+    "Current batch scheduler settings chosen by the autotuner",
+    ["model", "setting"],
+    multiprocess_mode="liveall",
+)
+
+AUTOTUNE_DECISIONS = Counter(
+    "app_batch_autotune_decisions_total",
+    "Autotuner decisions (increase_size, increase_wait, decrease, hold)",
+    ["model", "decision"],
+)
+
+AUTOTUNE_P99 = Gauge(
+    "app_batch_autotune_p99_seconds",
+    "p99 request latency (queue + inference) seen at the last autotuner decision",
+    ["model"],
+    multiprocess_mode="liveall",
+)
+
+EARLY_EXIT_LAYERS = Histogram(
+    "app_early_exit_layers",
+    "Encoder layers executed per text with early exit enabled",
+    buckets=(1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 24),
+)
+
+EARLY_EXIT_CALIBRATION = Gauge(
+    "app_early_exit_calibration",
+    "Holdout calibration of the early-exit heads (accuracy_delta, avg_layers)",
+    ["stat"],
+    multiprocess_mode="max",
+)
+
+DRIFT_FLAG = Gauge(
+    "data_drift_flag", "1 if drift detected else 0", multiprocess_mode="max"
+)
+
+RUNTIME_TOPOLOGY = Gauge(
+    "app_runtime_topology",
+    "Serving runtime topology (cpus, workers, torch intra/inter-op threads)",
+    ["setting"],
+    multiprocess_mode="max",
+)
+
+_SHADOW_OUTCOME = {
+    agree: SHADOW_COMPARISONS.labels(outcome="agree" if agree else "disagree")
+    for agree in (True, False)
+}
+_SHADOW_LATENCY = {
+    m: SHADOW_LATENCY.labels(model=m) for m in ("production", "candidate")
+}
+
+
+class ModelMetrics:
+    """Figli pre-istanziati delle metriche `app_*` di un modello."""
+
+    __slots__ = (
+        "model",
+        "requests",
+        "errors",
+        "latency",
+        "coalesced",
+        "batch_size",
+        "predictions",
+        "stages",
+        "length_latency",
+        "queue_wait",
+        "shed",
+    )
+
+    def __init__(self, model: str):
+        self.model = model
+        self.requests = REQUEST_COUNT.labels(model=model)
+        self.errors = ERROR_COUNT.labels(model=model)
+        self.latency = REQUEST_LATENCY.labels(model=model)
+        self.coalesced = COALESCED_REQUESTS.labels(model=model)
+        self.batch_size = BATCH_SIZE.labels(model=model)
+        self.predictions = {
+            label: SENTIMENT_PREDICTIONS.labels(model=model, sentiment_label=label)
+            for label in LABELS
+        }
+        self.stages = {
+            stage: STAGE_LATENCY.labels(model=model, stage=stage) for stage in STAGES
+        }
+        self.length_latency = {
+            bucket: LENGTH_LATENCY.labels(model=model, length_bucket=bucket)
+            for bucket in [str(bound) for bound in LENGTH_BUCKETS] + ["inf"]
+        }
+        self.queue_wait = {
+            p: QUEUE_WAIT.labels(model=model, priority=p) for p in PRIORITIES
+        }
+        self.shed = {
+            p: SHED_REQUESTS.labels(model=model, priority=p) for p in PRIORITIES
+        }
+
+    def prediction(self, label: str, timings: dict | None = None) -> None:
+        """Registra una predizione riuscita ed eventuali tempi per stage."""
+        self.requests.inc()
+        child = self.predictions.get(label)
+        if child is None:
+            child = SENTIMENT_PREDICTIONS.labels(
+                model=self.model, sentiment_label=label
+            )
+        child.inc()
+        if timings:
+            for stage, seconds in timings.items():
+                hist = self.stages.get(stage)
+                if hist is not None:
+                    hist.observe(seconds)
+
+    def request_latency(self, seconds: float, bucket: str) -> None:
+        self.latency.observe(seconds)
+        self.length_latency[bucket].observe(seconds)
+
+
+_model_metrics: dict[str, ModelMetrics] = {}
+
+
+def model_metrics(model: str = DEFAULT_MODEL) -> ModelMetrics:
+    bound = _model_metrics.get(model)
+    if bound is None:
+        bound = _model_metrics[model] = ModelMetrics(model)
+    return bound
+
+
+# metriche con il label `model` di un handle del model manager
+_MODEL_LABELLED = (
+    REQUEST_COUNT,
+    ERROR_COUNT,
+    REQUEST_LATENCY,
+    LENGTH_LATENCY,
+    STAGE_LATENCY,
+    COALESCED_REQUESTS,
+    QUEUE_WAIT,
+    SHED_REQUESTS,
+    BATCH_SIZE,
+    SENTIMENT_PREDICTIONS,
+    MODEL_LOADS,
+    MODEL_EVICTIONS,
+    MODEL_MEMORY,
+    AUTOTUNE_SETTING,
+    AUTOTUNE_DECISIONS,
+    AUTOTUNE_P99,
+)
+
+
+def forget_model_metrics(model: str) -> None:
+    """Rimuove le serie con `model=<model>` di un handle scartato, così le
+    versioni ad-hoc richieste dai client non restano esposte per sempre."""
+    _model_metrics.pop(model, None)
+    for metric in _MODEL_LABELLED:
+        index = metric._labelnames.index("model")
+        with metric._lock:
+            keys = [key for key in metric._metrics if key[index] == model]
+        for key in keys:
+            metric.remove(*key)
+
+
+def observe_prediction(
+    label: str, timings: dict | None = None, model: str = DEFAULT_MODEL
+) -> None:
+    model_metrics(model).prediction(label, timings)
+
+
+def observe_shadow(
+    prod: tuple, candidate: tuple, prod_latency: float, candidate_latency: float
+) -> None:
+    agree = prod[0] == candidate[0]
+    _SHADOW_OUTCOME[agree].inc()
+    if agree:
+        SHADOW_SCORE_DIVERGENCE.observe(abs(prod[1] - candidate[1]))
+    _SHADOW_LATENCY["production"].observe(prod_latency)
+    _SHADOW_LATENCY["candidate"].observe(candidate_latency)
+
+
+def observe_shadow_dropped() -> None:
+    SHADOW_DROPPED.inc()
+
+
+def observe_autotune(
+    model: str, settings: dict, decision: str | None = None, p99: float | None = None
+) -> None:
+    for setting, value in settings.items():
+        AUTOTUNE_SETTING.labels(model=model, setting=setting).set(value)
+    if decision is not None:
+        AUTOTUNE_DECISIONS.labels(model=model, decision=decision).inc()
+    if p99 is not None:
+        AUTOTUNE_P99.labels(model=model).set(p99)
+
+
+def observe_early_exit(layers) -> None:
+    for n in layers:
+        EARLY_EXIT_LAYERS.observe(n)
+
+
+def observe_early_exit_calibration(report: dict) -> None:
+    for stat in ("accuracy_delta", "avg_layers", "num_layers"):
+        if stat in report:
+            EARLY_EXIT_CALIBRATION.labels(stat=stat).set(report[stat])
+
+
+def observe_topology(report: dict) -> None:
+    for setting in ("cpus", "workers", "intra_op_threads", "inter_op_threads"):
+        RUNTIME_TOPOLOGY.labels(setting=setting).set(report[setting])
+
+
+# ====================================================
+# Metriche HTTP (middleware)
+# ====================================================
 REQUESTS = Counter("api_requests_total", "Total API requests", ["path", "method"])
 RESPONSES = Counter(
     "api_responses_total", "Total API responses", ["path", "method", "status"]
@@ -17,15 +365,43 @@ RESPONSES = Counter(
 LATENCY = Histogram(
     "api_request_latency_seconds", "Request latency", ["path", "method"]
 )
-INFLIGHT = Gauge("api_inflight_requests", "Inflight requests")
+INFLIGHT = Gauge(
+    "api_inflight_requests", "Inflight requests", multiprocess_mode="livesum"
+)
 
-router = APIRouter()
+# path non riconosciuti da nessuna route finiscono tutti sotto questo valore,
+# così scanner e 404 non fanno esplodere la cardinalità
+UNMATCHED_PATH = "unmatched"
 
 
-@router.get("/metrics")
-def metrics_endpoint():
-    data = generate_latest()
-    return Response(content=data, media_type=CONTENT_TYPE_LATEST)
+class _RouteMetrics:
+    __slots__ = ("requests", "latency", "responses", "path", "method")
+
+    def __init__(self, path: str, method: str):
+        self.path, self.method = path, method
+        self.requests = REQUESTS.labels(path=path, method=method)
+        self.latency = LATENCY.labels(path=path, method=method)
+        self.responses = {}
+
+    def response(self, status: int):
+        child = self.responses.get(status)
+        if child is None:
+            child = RESPONSES.labels(
+                path=self.path, method=self.method, status=str(status)
+            )
+            self.responses[status] = child
+        return child
+
+
+_route_metrics: dict[tuple[str, str], _RouteMetrics] = {}
+
+
+def _metrics_for(path: str, method: str) -> _RouteMetrics:
+    key = (path, method)
+    bound = _route_metrics.get(key)
+    if bound is None:
+        bound = _route_metrics[key] = _RouteMetrics(path, method)
+    return bound
 
 
 class MetricsMiddleware:
@@ -35,26 +411,60 @@ class MetricsMiddleware:
     async def __call__(self, scope, receive, send):
         if scope["type"] != "http":
             return await self.app(scope, receive, send)
-        path = scope.get("path", "")
-        method = scope.get("method", "GET")
-        REQUESTS.labels(path=path, method=method).inc()
         start = time.perf_counter()
         INFLIGHT.inc()
 
-        status_holder = {"status": "200"}
+        status_holder = [500]
 
         async def send_wrapper(message):
             if message["type"] == "http.response.start":
-                status_holder["status"] = str(message["status"])
+                status_holder[0] = message["status"]
             await send(message)
 
         try:
             await self.app(scope, receive, send_wrapper)
         finally:
-            LATENCY.labels(path=path, method=method).observe(
-                time.perf_counter() - start
-            )
-            RESPONSES.labels(
-                path=path, method=method, status=status_holder["status"]
-            ).inc()
+            # il template della route (es. "/predict") è noto solo dopo il
+            # routing: il router lo scrive nello scope
+            route = scope.get("route")
+            path = getattr(route, "path", UNMATCHED_PATH)
+            bound = _metrics_for(path, scope.get("method", "GET"))
+            bound.requests.inc()
+            bound.latency.observe(time.perf_counter() - start)
+            bound.response(status_holder[0]).inc()
             INFLIGHT.dec()
+
+
+# ====================================================
+# Esposizione
+# ====================================================
+def multiprocess_enabled() -> bool:
+    return bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+
+def collect_registry() -> CollectorRegistry:
+    """Registry da esporre: quello di processo o l'aggregato multiprocesso."""
+    if not multiprocess_enabled():
+        return REGISTRY
+    from prometheus_client import multiprocess
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def mark_process_dead() -> None:
+    """Da chiamare allo shutdown del worker in modalità multiprocesso."""
+    if multiprocess_enabled():
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(os.getpid())
+
+
+router = APIRouter()
+
+
+@router.get("/metrics")
+async def metrics_endpoint():
+    data = await run_in_threadpool(lambda: generate_latest(collect_registry()))
+    return Response(content=data, media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,260 @@
+# src/serving/models.py
+"""Model manager: più modelli registrati (o versioni) sullo stesso nodo.
+
+- `SERVING_MODELS` elenca gli alias servibili, es.
+  `production=models:/Sentiment/Production,dev=models:/Sentiment-dev/latest`.
+  L'alias `default` resta il modello di sempre (`MODEL_URI` o la pipeline HF
+  di `load_model`), con lo scheduler `batching.scheduler`.
+- La richiesta sceglie il modello con il campo `model` o l'header `X-Model`:
+  un alias, oppure `<nome>/<versione|stage>` di un modello registrato che
+  compare già tra gli alias (es. `Sentiment/12`); la versione dev'essere un
+  numero o uno stage MLflow. Questi handle ad-hoc sono al massimo
+  `MAX_ADHOC_MODELS` (LRU): quello scartato, o il cui caricamento fallisce,
+  perde anche le sue serie `app_*`, così i client non possono far crescere
+  senza limite la cardinalità del label `model`. `resolve` marca l'handle
+  come in uso finché il chiamante non chiama `release`: un handle appena
+  risolto non può essere scartato da una `resolve` concorrente.
+- I modelli si caricano al primo uso. Con `MODEL_MEMORY_BUDGET_MB` > 0, prima
+  e dopo ogni caricamento si scaricano i modelli usati meno di recente (LRU)
+  che non stanno servendo richieste; la memoria di un modello è stimata come
+  crescita dell'RSS durante il caricamento.
+- Ogni modello ha il proprio `BatchScheduler` (code separate) e le metriche
+  `app_*` con il label `model`.
+"""
+
+import gc
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from fastapi.routing import APIRouter
+
+from src.serving import batching, load_model
+from src.serving.metrics import (
+    DEFAULT_MODEL,
+    MODEL_EVICTIONS,
+    MODEL_LOADS,
+    MODEL_MEMORY,
+    forget_model_metrics,
+)
+
+MODEL_MEMORY_BUDGET_MB = float(os.getenv("MODEL_MEMORY_BUDGET_MB", "0"))
+MAX_ADHOC_MODELS = int(os.getenv("MAX_ADHOC_MODELS", "4"))
+MODEL_STAGES = ("Production", "Staging", "Archived", "latest")
+
+_PAGE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def parse_models(spec: str | None) -> dict:
+    """`"alias=uri,alias=uri"` -> `{alias: uri}`."""
+    models = {}
+    for item in (spec or "").split(","):
+        alias, _, uri = item.strip().partition("=")
+        if alias and uri:
+            models[alias.strip()] = uri.strip()
+    return models
+
+
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE
+    except (OSError, IndexError, ValueError):
+        return 0
+
+
+def _load_pyfunc(uri: str):
+    import mlflow.pyfunc
+
+    model = mlflow.pyfunc.load_model(uri)
+
+    def predict_batch(texts, timings=None):
+        return load_model.predict_pyfunc_batch(model, texts, timings)
+
+    return predict_batch
+
+
+class ModelHandle:
+    def __init__(self, name: str, uri: str | None, scheduler=None):
+        self.name = name
+        self.uri = uri
+        self.predict_batch = None
+        self.size_bytes = 0
+        self.last_used = 0.0
+        self.active = 0
+        # richieste/connessioni che l'hanno risolto e non ancora rilasciato
+        self.refs = 0
+        self.pinned = False
+        self.adhoc = False
+        self.load_lock = threading.Lock()
+        self.scheduler = scheduler or batching.BatchScheduler(
+            self._predict, model=name, mirror=False
+        )
+
+    @property
+    def loaded(self) -> bool:
+        return self.predict_batch is not None
+
+    def _predict(self, texts, timings=None):
+        return self.predict_batch(texts, timings)
+
+    def status(self) -> dict:
+        return {
+            "model": self.name,
+            "uri": self.uri,
+            "loaded": self.loaded,
+            "pinned": self.pinned,
+            "size_mb": round(self.size_bytes / 2**20, 1),
+            "active_requests": self.active,
+            "idle_s": (
+                round(time.monotonic() - self.last_used, 1) if self.last_used else None
+            ),
+        }
+
+
+class ModelManager:
+    def __init__(
+        self,
+        models: dict | None = None,
+        budget_mb: float = MODEL_MEMORY_BUDGET_MB,
+        loader=_load_pyfunc,
+        memory=_rss_bytes,
+        max_adhoc: int = MAX_ADHOC_MODELS,
+    ):
+        self.budget_bytes = budget_mb * 2**20
+        self.max_adhoc = max_adhoc
+        self._loader = loader
+        self._memory = memory
+        self._lock = threading.Lock()
+        self._sizes: dict = {}
+        # il default resta sempre caricato e usa lo scheduler storico
+        default = ModelHandle(DEFAULT_MODEL, load_model.MODEL_URI, batching.scheduler)
+        default.predict_batch = lambda texts, timings=None: load_model.predict_batch(
+            texts, timings
+        )
+        default.pinned = True
+        self._handles = {DEFAULT_MODEL: default}
+        self._registered = set()
+        for alias, uri in (models or {}).items():
+            self._handles[alias] = ModelHandle(alias, uri)
+            if uri.startswith("models:/"):
+                self._registered.add(uri[len("models:/") :].split("/")[0])
+
+    def resolve(self, key: str | None) -> ModelHandle:
+        """Handle per un alias o `<nome>/<versione>`; `KeyError` se sconosciuto.
+
+        L'handle resta in uso (non scartabile) fino a `release(handle)`."""
+        if key is not None and not isinstance(key, str):
+            raise KeyError(key)
+        key = key or DEFAULT_MODEL
+        dropped = None
+        with self._lock:
+            handle = self._handles.get(key)
+            if handle is None:
+                name, _, version = key.partition("/")
+                valid = version.isdigit() or version in MODEL_STAGES
+                if not valid or name not in self._registered:
+                    raise KeyError(key)
+                adhoc = [h for h in self._handles.values() if h.adhoc]
+                if len(adhoc) >= self.max_adhoc:
+                    idle = [h for h in adhoc if not h.active and not h.refs]
+                    if not idle:
+                        raise KeyError(key)
+                    dropped = min(idle, key=lambda h: h.last_used)
+                    del self._handles[dropped.name]
+                handle = self._handles[key] = ModelHandle(key, f"models:/{key}")
+                handle.adhoc = True
+            handle.refs += 1
+            handle.last_used = time.monotonic()
+        if dropped is not None:
+            self._forget(dropped)
+        return handle
+
+    def release(self, handle: ModelHandle) -> None:
+        """Fine dell'uso iniziato con `resolve`."""
+        with self._lock:
+            handle.refs = max(0, handle.refs - 1)
+
+    def _forget(self, handle: ModelHandle) -> None:
+        handle.predict_batch = None
+        forget_model_metrics(handle.name)
+        gc.collect()
+
+    @contextmanager
+    def acquire(self, handle: ModelHandle):
+        """Tiene `handle` caricato (e non evictable) per la durata del blocco."""
+        with self._lock:
+            handle.active += 1
+            handle.last_used = time.monotonic()
+        try:
+            self._ensure_loaded(handle)
+            yield handle
+        finally:
+            with self._lock:
+                handle.active -= 1
+
+    def _ensure_loaded(self, handle: ModelHandle) -> None:
+        if handle.loaded:
+            return
+        with handle.load_lock:
+            if handle.loaded:
+                return
+            with self._lock:
+                if self._handles.get(handle.name) is not handle:
+                    # handle ad-hoc già scartato: caricarlo lo renderebbe
+                    # orfano (fuori budget, serie `app_*` mai rimosse)
+                    raise KeyError(handle.name)
+            # spazio per il modello in arrivo, se lo si è già visto caricare
+            self._evict(incoming=self._sizes.get(handle.uri, 0))
+            before = self._memory()
+            try:
+                predict_batch = self._loader(handle.uri)
+            except Exception:
+                if handle.adhoc:
+                    # versione inesistente o non caricabile: niente handle
+                    with self._lock:
+                        if self._handles.get(handle.name) is handle:
+                            del self._handles[handle.name]
+                    self._forget(handle)
+                raise
+            handle.size_bytes = max(0, self._memory() - before)
+            self._sizes[handle.uri] = handle.size_bytes
+            handle.predict_batch = predict_batch
+            MODEL_LOADS.labels(model=handle.name).inc()
+            MODEL_MEMORY.labels(model=handle.name).set(handle.size_bytes)
+        self._evict()
+
+    def _evict(self, incoming: int = 0) -> None:
+        if self.budget_bytes <= 0:
+            return
+        evicted = False
+        with self._lock:
+            loaded = [h for h in self._handles.values() if h.loaded and not h.pinned]
+            total = sum(h.size_bytes for h in loaded)
+            for handle in sorted(loaded, key=lambda h: h.last_used):
+                if total + incoming <= self.budget_bytes:
+                    break
+                if handle.active:
+                    continue
+                handle.predict_batch = None
+                total -= handle.size_bytes
+                evicted = True
+                MODEL_EVICTIONS.labels(model=handle.name).inc()
+                MODEL_MEMORY.labels(model=handle.name).set(0)
+        if evicted:
+            gc.collect()
+
+    def status(self) -> list:
+        with self._lock:
+            return [h.status() for h in self._handles.values()]
+
+
+manager = ModelManager(parse_models(os.getenv("SERVING_MODELS")))
+
+router = APIRouter()
+
+
+@router.get("/admin/models")
+def models_status():
+    return {"budget_mb": manager.budget_bytes / 2**20, "models": manager.status()}
@@ -0,0 +1,206 @@
+# src/serving/profiling.py
+"""Profiling opt-in delle richieste `/predict`.
+
+Una frazione configurabile delle richieste (`PROFILE_SAMPLE_RATE`, default 0 =
+disattivo) viene campionata da un profiler statistico a basso overhead: un
+thread daemon legge lo stack del thread che serve la richiesta ogni
+`PROFILE_INTERVAL_MS` millisecondi (`sys._current_frames`) e aggrega gli stack
+in memoria. Il risultato si scarica da `/admin/profile` come collapsed stacks
+(input di flamegraph.pl / speedscope) o come JSON speedscope.
+
+Con lo scheduler dei batch lo stack campionato è quello del thread della
+richiesta: se quel thread fa da runner contiene anche l'inferenza del batch
+(di tutte le richieste del batch), altrimenti solo l'attesa su
+`Condition.wait`. Il profilo è quindi rappresentativo in aggregato, non
+per singola richiesta.
+
+Con `STAGE_TIMINGS_HEADER=1` la risposta di `/predict` include l'header
+standard `Server-Timing` con i tempi per stage (tokenization, inference, ...).
+"""
+
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+
+from fastapi import HTTPException, Response
+from fastapi.routing import APIRouter
+
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "2"))
+STAGE_TIMINGS_HEADER = os.getenv("STAGE_TIMINGS_HEADER", "0") == "1"
+
+SPEEDSCOPE_SCHEMA = "https://www.speedscope.app/file-format-schema.json"
+
+
+def _frame_name(code) -> str:
+    path = code.co_filename
+    marker = path.rfind("site-packages/")
+    if marker >= 0:
+        path = path[marker + len("site-packages/") :]
+    elif path.startswith(os.getcwd()):
+        path = os.path.relpath(path)
+    return f"{code.co_name} ({path}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Campiona periodicamente gli stack dei thread registrati con `track()`."""
+
+    def __init__(self, interval: float = 0.002, max_depth: int = 128):
+        self.interval = interval
+        self.max_depth = max_depth
+        self._tracked: Counter = Counter()
+        self._stacks: Counter = Counter()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    @contextmanager
+    def track(self):
+        ident = threading.get_ident()
+        with self._lock:
+            self._tracked[ident] += 1
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="stack-sampler", daemon=True
+                )
+                self._thread.start()
+        self._wake.set()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._tracked[ident] -= 1
+                if self._tracked[ident] <= 0:
+                    del self._tracked[ident]
+
+    def _collapse(self, frame) -> str:
+        names = []
+        while frame is not None and len(names) < self.max_depth:
+            names.append(_frame_name(frame.f_code))
+            frame = frame.f_back
+        return ";".join(reversed(names))
+
+    def _run(self):
+        while True:
+            with self._lock:
+                idle = not self._tracked
+            if idle:
+                # nessuna richiesta campionata: il thread dorme
+                self._wake.wait(timeout=1.0)
+                self._wake.clear()
+                continue
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                for ident in self._tracked:
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        self._stacks[self._collapse(frame)] += 1
+
+    def stacks(self) -> Counter:
+        with self._lock:
+            return Counter(self._stacks)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stacks.clear()
+
+    def collapsed(self) -> str:
+        """Formato "collapsed stacks": `frame;frame;frame conteggio` per riga."""
+        return "".join(f"{s} {n}\n" for s, n in self.stacks().most_common())
+
+    def speedscope(self, name: str = "predict") -> dict:
+        """Profilo `sampled` nel formato file di speedscope."""
+        frames: list[dict] = []
+        index: dict[str, int] = {}
+        samples, weights = [], []
+        for stack, count in self.stacks().most_common():
+            sample = []
+            for frame in stack.split(";"):
+                if frame not in index:
+                    index[frame] = len(frames)
+                    frames.append({"name": frame})
+                sample.append(index[frame])
+            samples.append(sample)
+            weights.append(count)
+        return {
+            "$schema": SPEEDSCOPE_SCHEMA,
+            "shared": {"frames": frames},
+            "profiles": [
+                {
+                    "type": "sampled",
+                    "name": name,
+                    "unit": "none",
+                    "startValue": 0,
+                    "endValue": sum(weights),
+                    "samples": samples,
+                    "weights": weights,
+                }
+            ],
+        }
+
+
+class RequestProfiler:
+    """Decide quali richieste campionare e le registra sul `StackSampler`."""
+
+    def __init__(self, sample_rate: float, interval_ms: float):
+        self.sample_rate = sample_rate
+        self.sampler = StackSampler(interval=interval_ms / 1000.0)
+        self.sampled_requests = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0
+
+    def maybe_sample(self):
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return nullcontext()
+        with self._lock:  # chiamato dai thread delle richieste
+            self.sampled_requests += 1
+        return self.sampler.track()
+
+
+profiler = RequestProfiler(PROFILE_SAMPLE_RATE, PROFILE_INTERVAL_MS)
+
+
+def server_timing(
+    timings: dict, total: float | None = None, coalesced: bool = False
+) -> str:
+    """Valore dell'header `Server-Timing` (durate in millisecondi).
+
+    `coalesced` aggiunge la metrica `coalesced`: gli stage sono quelli
+    dell'inferenza condivisa con un'altra richiesta.
+    """
+    parts = [f"{stage};dur={seconds * 1000:.3f}" for stage, seconds in timings.items()]
+    if coalesced:
+        parts.append("coalesced")
+    if total is not None:
+        parts.append(f"total;dur={total * 1000:.3f}")
+    return ", ".join(parts)
+
+
+router = APIRouter()
+
+
+@router.get("/admin/profile")
+def profile(format: str = "collapsed"):
+    if not profiler.enabled:
+        raise HTTPException(status_code=404, detail="profiling disabled")
+    if format == "speedscope":
+        return profiler.sampler.speedscope()
+    if format != "collapsed":
+        raise HTTPException(status_code=400, detail="format: collapsed|speedscope")
+    return Response(content=profiler.sampler.collapsed(), media_type="text/plain")
+
+
+@router.delete("/admin/profile")
+def reset_profile():
+    if not profiler.enabled:
+        raise HTTPException(status_code=404, detail="profiling disabled")
+    profiler.sampler.reset()
+    return {"status": "reset"}
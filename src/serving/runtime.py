@@ -0,0 +1,248 @@
+# src/serving/runtime.py
+"""Topologia di thread/core per l'inference.
+
+Senza configurazione torch, tokenizers (parallelismo Rust) e uvicorn scelgono
+ognuno il proprio numero di thread partendo dai core *fisici* del nodo, non
+dalla quota CPU del container: su nodi con molti core il risultato è
+oversubscription e latenza irregolare. Questo modulo:
+
+- rileva le CPU effettivamente disponibili (affinity + quota cgroup v1/v2);
+- sceglie worker uvicorn e thread torch intra/inter-op in modo che
+  `workers * intra_op <= cpu`, disattivando `TOKENIZERS_PARALLELISM` quando
+  ci sono più worker;
+- opzionalmente pinna ogni worker a un blocco di core dedicato;
+- logga la topologia scelta all'avvio e la espone come metrica.
+
+Variabili d'ambiente (tutte opzionali, i default sono calcolati):
+`SERVING_WORKERS`, `TORCH_NUM_THREADS`, `TORCH_INTEROP_THREADS`,
+`SERVING_PIN_CORES` (1 = pinning), `SERVING_SLOT_DIR`.
+
+Usage:
+    python -m src.serving.runtime report   # stampa la topologia calcolata
+    python -m src.serving.runtime serve    # avvia uvicorn con la topologia
+"""
+
+import argparse
+import json
+import logging
+import math
+import os
+import sys
+import tempfile
+from dataclasses import asdict, dataclass
+
+logger = logging.getLogger(__name__)
+
+# oltre questa soglia i thread intra-op per worker rendono poco sulla latenza
+# di un singolo forward pass: meglio aggiungere worker
+MAX_THREADS_PER_WORKER = 4
+
+_CGROUP_V2 = "/sys/fs/cgroup/cpu.max"
+_CGROUP_V1_QUOTA = "/sys/fs/cgroup/cpu/cpu.cfs_quota_us"
+_CGROUP_V1_PERIOD = "/sys/fs/cgroup/cpu/cpu.cfs_period_us"
+
+
+@dataclass
+class Topology:
+    cpus: int
+    workers: int
+    intra_op_threads: int
+    inter_op_threads: int
+    tokenizers_parallelism: bool
+    pin_cores: bool
+
+
+def _read(path: str) -> str | None:
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def cgroup_cpu_quota() -> float | None:
+    """Quota CPU del cgroup (in numero di CPU), `None` se non limitata."""
+    v2 = _read(_CGROUP_V2)
+    if v2:
+        quota, _, period = v2.partition(" ")
+        if quota != "max" and period:
+            return int(quota) / int(period)
+        return None
+    quota, period = _read(_CGROUP_V1_QUOTA), _read(_CGROUP_V1_PERIOD)
+    if quota and period and int(quota) > 0:
+        return int(quota) / int(period)
+    return None
+
+
+def affinity_cpus() -> list[int]:
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def available_cpus() -> int:
+    """CPU utilizzabili: minimo tra affinity e quota cgroup (almeno 1)."""
+    cpus = len(affinity_cpus())
+    quota = cgroup_cpu_quota()
+    if quota is not None:
+        cpus = min(cpus, math.floor(quota))
+    return max(1, cpus)
+
+
+def _env_int(name: str) -> int | None:
+    value = os.getenv(name)
+    return int(value) if value else None
+
+
+def plan_topology(
+    cpus: int | None = None,
+    workers: int | None = None,
+    threads: int | None = None,
+) -> Topology:
+    """Sceglie worker e thread; i valori espliciti (argomenti o env) vincono."""
+    cpus = cpus or available_cpus()
+    workers = workers or _env_int("SERVING_WORKERS")
+    threads = threads or _env_int("TORCH_NUM_THREADS")
+    if workers is None:
+        per_worker = threads or min(MAX_THREADS_PER_WORKER, cpus)
+        workers = max(1, cpus // per_worker)
+    if threads is None:
+        threads = max(1, cpus // workers)
+    return Topology(
+        cpus=cpus,
+        workers=workers,
+        intra_op_threads=threads,
+        inter_op_threads=_env_int("TORCH_INTEROP_THREADS") or 1,
+        tokenizers_parallelism=workers == 1 and threads > 1,
+        pin_cores=os.getenv("SERVING_PIN_CORES", "0") == "1",
+    )
+
+
+def candidate_splits(cpus: int | None = None) -> list[tuple[int, int]]:
+    """Coppie (worker, thread per worker) che usano tutte le CPU senza
+    oversubscription: solo i `w` divisori di `cpus`, così nessun core resta
+    inattivo (su 8 CPU: (1, 8), (2, 4), (4, 2), (8, 1))."""
+    cpus = cpus or available_cpus()
+    return [(w, cpus // w) for w in range(1, cpus + 1) if cpus % w == 0]
+
+
+def apply_env(topology: Topology) -> None:
+    """Imposta le variabili lette da torch/OpenMP/tokenizers (se non già fissate)."""
+    threads = str(topology.intra_op_threads)
+    os.environ.setdefault("OMP_NUM_THREADS", threads)
+    os.environ.setdefault("MKL_NUM_THREADS", threads)
+    os.environ.setdefault(
+        "TOKENIZERS_PARALLELISM", str(topology.tokenizers_parallelism).lower()
+    )
+
+
+def configure_torch(topology: Topology) -> None:
+    """Da chiamare dopo l'import di torch, prima del primo forward pass."""
+    import torch
+
+    torch.set_num_threads(topology.intra_op_threads)
+    try:
+        torch.set_num_interop_threads(topology.inter_op_threads)
+    except RuntimeError:
+        # già fissato: torch lo consente solo prima di qualsiasi lavoro parallelo
+        pass
+
+
+def claim_worker_slot(workers: int, slot_dir: str | None = None) -> int | None:
+    """Assegna al processo un indice di worker univoco (file creato con O_EXCL)."""
+    slot_dir = (
+        slot_dir
+        or os.getenv("SERVING_SLOT_DIR")
+        or os.path.join(tempfile.gettempdir(), f"serving-slots-{os.getppid()}")
+    )
+    os.makedirs(slot_dir, exist_ok=True)
+    for slot in range(workers):
+        path = os.path.join(slot_dir, f"slot-{slot}")
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            # slot di un worker morto: si recupera se il pid non esiste più
+            owner = _read(path)
+            if owner and owner.isdigit() and not _pid_alive(int(owner)):
+                os.unlink(path)
+                return claim_worker_slot(workers, slot_dir)
+            continue
+        with os.fdopen(fd, "w") as f:
+            f.write(str(os.getpid()))
+        return slot
+    return None
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def pin_worker(topology: Topology, slot: int) -> list[int]:
+    """Pinna il processo al blocco di core dello slot; ritorna i core scelti."""
+    cpus = affinity_cpus()
+    per_worker = max(1, len(cpus) // topology.workers)
+    cores = cpus[slot * per_worker : (slot + 1) * per_worker] or cpus
+    os.sched_setaffinity(0, cores)
+    return cores
+
+
+_topology: Topology | None = None
+
+
+def current_topology() -> Topology:
+    global _topology
+    if _topology is None:
+        _topology = plan_topology()
+    return _topology
+
+
+def configure_worker() -> dict:
+    """Configura il worker corrente (env, pinning) e ritorna il report di avvio."""
+    topology = current_topology()
+    apply_env(topology)
+    report = asdict(topology)
+    report["pid"] = os.getpid()
+    if topology.pin_cores and hasattr(os, "sched_setaffinity"):
+        slot = claim_worker_slot(topology.workers)
+        if slot is not None:
+            report["slot"] = slot
+            report["cores"] = pin_worker(topology, slot)
+    logger.info("Serving runtime topology: %s", json.dumps(report))
+    return report
+
+
+def _serve(host: str, port: int) -> None:
+    topology = current_topology()
+    apply_env(topology)
+    if topology.workers > 1 and not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="prom-")
+    if "SERVING_SLOT_DIR" not in os.environ:
+        os.environ["SERVING_SLOT_DIR"] = tempfile.mkdtemp(prefix="serving-slots-")
+    os.environ["SERVING_WORKERS"] = str(topology.workers)
+    os.environ["TORCH_NUM_THREADS"] = str(topology.intra_op_threads)
+    print(f"[runtime] {json.dumps(asdict(topology))}", flush=True)
+    args = ["uvicorn", "src.serving.app:app", "--host", host, "--port", str(port)]
+    args += ["--workers", str(topology.workers)]
+    os.execvp(sys.executable, [sys.executable, "-m", *args])
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("command", choices=["report", "serve"])
+    ap.add_argument("--host", default="0.0.0.0")
+    ap.add_argument("--port", type=int, default=8000)
+    args = ap.parse_args()
+    if args.command == "report":
+        report = asdict(current_topology())
+        report["affinity_cpus"] = affinity_cpus()
+        report["cgroup_quota"] = cgroup_cpu_quota()
+        report["candidate_splits"] = candidate_splits()
+        print(json.dumps(report, indent=2))
+    else:
+        _serve(args.host, args.port)
@@ -0,0 +1,127 @@
+# src/serving/shadow.py
+"""Shadow traffic: confronto online tra Production e un modello candidato.
+
+Con `SHADOW_MODEL_URI` impostato, una frazione `SHADOW_SAMPLE_RATE` dei testi
+serviti viene copiata (con l'esito di Production) in una coda limitata; un
+thread daemon la svuota a batch (`SHADOW_BATCH_SIZE`), fa predire il
+candidato e aggiorna metriche Prometheus e report JSON
+(`src/monitoring/shadow_report.py`). Tutto avviene fuori dal path della
+risposta: se la coda è piena il campione viene scartato
+(`app_shadow_dropped_total`), la richiesta non attende mai il candidato.
+"""
+
+import logging
+import os
+import queue
+import random
+import threading
+import time
+
+from src.monitoring.shadow_report import ShadowStats, write_report
+from src.serving.metrics import observe_shadow, observe_shadow_dropped
+
+logger = logging.getLogger(__name__)
+
+SHADOW_MODEL_URI = os.getenv("SHADOW_MODEL_URI")
+SHADOW_SAMPLE_RATE = float(os.getenv("SHADOW_SAMPLE_RATE", "0.1"))
+SHADOW_BATCH_SIZE = int(os.getenv("SHADOW_BATCH_SIZE", "32"))
+SHADOW_QUEUE_SIZE = int(os.getenv("SHADOW_QUEUE_SIZE", "1000"))
+SHADOW_REPORT_DIR = os.getenv("SHADOW_REPORT_DIR", "artifacts/shadow")
+
+
+class ShadowComparator:
+    def __init__(
+        self,
+        model_uri: str | None = SHADOW_MODEL_URI,
+        sample_rate: float = SHADOW_SAMPLE_RATE,
+        batch_size: int = SHADOW_BATCH_SIZE,
+        queue_size: int = SHADOW_QUEUE_SIZE,
+        report_dir: str | None = SHADOW_REPORT_DIR,
+        predict_batch=None,
+        flush_interval: float = 1.0,
+    ):
+        self.model_uri = model_uri
+        self.sample_rate = sample_rate
+        self.batch_size = max(1, batch_size)
+        self.report_dir = report_dir
+        self.flush_interval = flush_interval
+        self.stats = ShadowStats(candidate_uri=model_uri)
+        self._predict_batch = predict_batch
+        self._model = None
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._thread = None
+        self.enabled = bool(model_uri or predict_batch) and sample_rate > 0
+
+    def mirror(self, texts: list, results: list, seconds_per_text: float) -> None:
+        """Campiona testi già serviti da Production; non blocca mai."""
+        if not self.enabled:
+            return
+        for text, result in zip(texts, results):
+            if random.random() >= self.sample_rate:
+                continue
+            try:
+                self._queue.put_nowait((text, result, seconds_per_text))
+            except queue.Full:
+                observe_shadow_dropped()
+        self._ensure_thread()
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._run, name="shadow-compare", daemon=True
+                    )
+                    self._thread.start()
+
+    def _run(self) -> None:
+        while self.enabled:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self.compare(batch)
+            except Exception as exc:  # pragma: no cover - il candidato non deve
+                # mai far cadere il worker
+                logger.warning("Shadow comparison failed: %s", exc)
+
+    def _candidate_predict(self, texts: list) -> list:
+        if self._predict_batch is not None:
+            return self._predict_batch(texts)
+        if self._model is None:
+            import mlflow.pyfunc
+
+            try:
+                self._model = mlflow.pyfunc.load_model(self.model_uri)
+            except Exception as exc:
+                logger.warning(
+                    "Shadow disabled, cannot load '%s': %s", self.model_uri, exc
+                )
+                self.enabled = False
+                raise
+        from src.serving.load_model import parse_output
+
+        return [parse_output(out) for out in self._model.predict(list(texts))]
+
+    def compare(self, batch: list) -> None:
+        """Predice il batch con il candidato e aggiorna metriche e report."""
+        texts = [text for text, _, _ in batch]
+        start = time.perf_counter()
+        candidate = self._candidate_predict(texts)
+        per_text = (time.perf_counter() - start) / len(texts)
+        for (_, prod, prod_latency), cand in zip(batch, candidate):
+            self.stats.add(prod, cand, prod_latency, per_text)
+            observe_shadow(prod, cand, prod_latency, per_text)
+        if self.report_dir:
+            write_report(self.stats, self.report_dir)
+
+
+shadow = ShadowComparator()
@@ -0,0 +1,273 @@
+"""Intervalli di confidenza bootstrap (appaiati) per macro-F1 e accuracy.
+
+Le metriche si calcolano dalle matrici di confusione, quindi un ricampionamento
+costa un `bincount`: con gli indici di tutti i ricampionamenti in una matrice
+`(n_resamples, n)` migliaia di repliche richiedono pochi millisecondi, senza
+cicli Python e senza ripredire nulla (si lavora sugli array di predizioni già
+calcolati). Il bootstrap è *appaiato*: candidato e riferimento sono valutati
+sugli stessi indici, così l'intervallo della differenza tiene conto della
+correlazione tra i due modelli sugli stessi testi.
+
+Per valutazioni che non stanno in memoria `ConfusionCounts` accumula a chunk
+i conteggi congiunti (vero, predizioni dei modelli) e si somma tra shard;
+`bootstrap_counts` ricampiona direttamente quelle celle (multinomiale, stessa
+distribuzione del ricampionamento delle righe), senza gli array per testo.
+
+Modulo leggero come `labels`: dipende solo da NumPy.
+"""
+
+import numpy as np
+
+from src.utils.labels import LABELS
+
+# classi canoniche + una colonna per `UNKNOWN` (come fa sklearn con label -1)
+_K = len(LABELS) + 1
+# elementi massimi della matrice di indici per blocco di ricampionamenti
+_CHUNK_ELEMENTS = 2**22
+
+
+def _codes(codes) -> np.ndarray:
+    codes = np.asarray(codes, dtype=np.int64)
+    return np.where((codes < 0) | (codes >= _K - 1), _K - 1, codes)
+
+
+def _joint(y_true, y_pred) -> np.ndarray:
+    """Coppie (vero, predetto) -> indice piatto della matrice di confusione."""
+    return _codes(y_true) * _K + _codes(y_pred)
+
+
+def _confusions(joint: np.ndarray, idx: np.ndarray) -> np.ndarray:
+    """Matrici di confusione `(len(idx), K, K)` per ogni riga di indici."""
+    rows = np.arange(len(idx))[:, None] * _K * _K
+    counts = np.bincount((rows + joint[idx]).ravel(), minlength=len(idx) * _K * _K)
+    return counts.reshape(len(idx), _K, _K)
+
+
+def _present(joint: np.ndarray) -> np.ndarray:
+    """Classi presenti in etichette vere o predette (le stesse di sklearn).
+
+    La maschera è per modello, come in `f1_score(y, pred)`: così la stima
+    puntuale del bootstrap coincide con la macro-F1 riportata per quel modello.
+    """
+    mask = np.zeros(_K, dtype=bool)
+    mask[joint // _K] = True
+    mask[joint % _K] = True
+    return mask
+
+
+def _macro_f1(conf: np.ndarray, present: np.ndarray) -> np.ndarray:
+    tp = np.diagonal(conf, axis1=-2, axis2=-1)
+    denom = conf.sum(axis=-1) + conf.sum(axis=-2)
+    f1 = np.divide(2 * tp, denom, out=np.zeros(tp.shape), where=denom > 0)
+    return f1[..., present].mean(axis=-1)
+
+
+def _accuracy(conf: np.ndarray) -> np.ndarray:
+    tp = np.diagonal(conf, axis1=-2, axis2=-1).sum(axis=-1)
+    return tp / conf.sum(axis=(-2, -1))
+
+
+def per_class_metrics(y_true, y_pred) -> dict:
+    """Precision, recall, F1 e support per etichetta canonica."""
+    conf = _confusions(_joint(y_true, y_pred), np.arange(len(y_true))[None])[0]
+    return _per_class(conf)
+
+
+def _per_class(conf: np.ndarray) -> dict:
+    out = {}
+    for i, label in enumerate(LABELS):
+        tp, true, pred = int(conf[i, i]), int(conf[i].sum()), int(conf[:, i].sum())
+        out[label] = {
+            "precision": round(tp / pred, 4) if pred else 0.0,
+            "recall": round(tp / true, 4) if true else 0.0,
+            "f1": round(2 * tp / (true + pred), 4) if true + pred else 0.0,
+            "support": true,
+        }
+    return out
+
+
+def _interval(values: np.ndarray, alpha: float) -> list:
+    lo, hi = np.quantile(values, [alpha / 2, 1 - alpha / 2])
+    return [round(float(lo), 4), round(float(hi), 4)]
+
+
+def paired_bootstrap(
+    y_true,
+    y_pred,
+    y_ref=None,
+    n_resamples: int = 2000,
+    alpha: float = 0.05,
+    seed: int = 0,
+) -> dict:
+    """Stime puntuali e intervalli `1 - alpha` di macro-F1 e accuracy.
+
+    Con `y_ref` (predizioni del modello di riferimento, es. Production sugli
+    stessi testi) aggiunge `delta_macro_f1` / `delta_accuracy` = candidato -
+    riferimento, con intervallo e `p_value` one-sided (quota di repliche in
+    cui il candidato non migliora).
+    """
+    n = len(y_true)
+    if n == 0:
+        raise ValueError("bootstrap su un set di valutazione vuoto")
+    joints = [_joint(y_true, y_pred)]
+    if y_ref is not None:
+        joints.append(_joint(y_true, y_ref))
+    present = [_present(joint) for joint in joints]
+
+    rng = np.random.default_rng(seed)
+    samples = [[] for _ in joints]
+    step = max(1, _CHUNK_ELEMENTS // n)
+    for start in range(0, n_resamples, step):
+        idx = rng.integers(0, n, size=(min(step, n_resamples - start), n))
+        for out, joint, mask in zip(samples, joints, present):
+            conf = _confusions(joint, idx)
+            out.append((_macro_f1(conf, mask), _accuracy(conf)))
+
+    full = np.arange(n)[None]
+    stats = []
+    for joint, out, mask in zip(joints, samples, present):
+        conf = _confusions(joint, full)
+        point = (_macro_f1(conf, mask)[0], _accuracy(conf)[0])
+        boot = tuple(np.concatenate([s[m] for s in out]) for m in range(2))
+        stats.append((point, boot))
+    return _result(n, n_resamples, alpha, stats)
+
+
+def _result(n: int, n_resamples: int, alpha: float, stats: list) -> dict:
+    """`stats`: per modello ((macro-F1, accuracy), (repliche F1, repliche acc))."""
+    result = {"n": n, "n_resamples": n_resamples, "alpha": alpha}
+    (f1, acc), (f1_boot, acc_boot) = stats[0]
+    result["macro_f1"] = {"value": round(float(f1), 4), "ci": _interval(f1_boot, alpha)}
+    result["accuracy"] = {
+        "value": round(float(acc), 4),
+        "ci": _interval(acc_boot, alpha),
+    }
+    if len(stats) > 1:
+        (ref_f1, ref_acc), (ref_f1_boot, ref_acc_boot) = stats[1]
+        for name, value, diff in (
+            ("delta_macro_f1", f1 - ref_f1, f1_boot - ref_f1_boot),
+            ("delta_accuracy", acc - ref_acc, acc_boot - ref_acc_boot),
+        ):
+            result[name] = {
+                "value": round(float(value), 4),
+                "ci": _interval(diff, alpha),
+                "p_value": round(float((diff <= 0).mean()), 4),
+            }
+    return result
+
+
+def _model_confusion(counts: np.ndarray, n_models: int, model: int) -> np.ndarray:
+    """Matrice di confusione di `model` dai conteggi congiunti (anche con
+    dimensioni iniziali di batch): somma sugli assi degli altri modelli."""
+    axes = tuple(-n_models + i for i in range(n_models) if i != model)
+    return counts.sum(axis=axes) if axes else counts
+
+
+class ConfusionCounts:
+    """Conteggi congiunti `(vero, predetto dal modello 0, dal modello 1, ...)`.
+
+    Tensore intero `(K,) * (1 + n_models)`, aggiornabile a chunk e sommabile
+    tra shard (`merge`): le matrici di confusione dei singoli modelli sono i
+    suoi marginali, il bootstrap appaiato ne ricampiona le celle.
+    """
+
+    def __init__(self, n_models: int = 1, counts=None):
+        shape = (_K,) * (1 + n_models)
+        if counts is None:
+            counts = np.zeros(shape, dtype=np.int64)
+        self.counts = np.asarray(counts, dtype=np.int64)
+        if self.counts.shape != shape:
+            raise ValueError(f"conteggi {self.counts.shape}, attesi {shape}")
+
+    @property
+    def n_models(self) -> int:
+        return self.counts.ndim - 1
+
+    @property
+    def n(self) -> int:
+        return int(self.counts.sum())
+
+    def update(self, y_true, *y_preds) -> "ConfusionCounts":
+        """Aggiunge un chunk: codici veri e predizioni di ogni modello."""
+        if len(y_preds) != self.n_models:
+            raise ValueError(f"attese predizioni di {self.n_models} modelli")
+        flat = np.ravel_multi_index(
+            [_codes(y) for y in (y_true, *y_preds)], self.counts.shape
+        )
+        self.counts += np.bincount(flat, minlength=self.counts.size).reshape(
+            self.counts.shape
+        )
+        return self
+
+    def merge(self, other: "ConfusionCounts") -> "ConfusionCounts":
+        if other.counts.shape != self.counts.shape:
+            raise ValueError("conteggi di shard con modelli diversi")
+        self.counts += other.counts
+        return self
+
+    def confusion(self, model: int = 0) -> np.ndarray:
+        return _model_confusion(self.counts, self.n_models, model)
+
+    def summary(self, model: int = 0) -> dict:
+        """Macro-F1, accuracy e metriche per classe di `model`."""
+        conf = self.confusion(model)
+        if not conf.sum():
+            raise ValueError("nessun esempio valutato")
+        present = (conf.sum(axis=0) + conf.sum(axis=1)) > 0
+        return {
+            "n": self.n,
+            "macro_f1": float(_macro_f1(conf, present)),
+            "accuracy": float(_accuracy(conf)),
+            "per_class": _per_class(conf),
+        }
+
+    def save(self, path: str) -> str:
+        np.save(path, self.counts)
+        return path
+
+    @classmethod
+    def load(cls, path: str) -> "ConfusionCounts":
+        counts = np.load(path)
+        return cls(counts.ndim - 1, counts)
+
+
+def bootstrap_counts(
+    counts: ConfusionCounts,
+    n_resamples: int = 2000,
+    alpha: float = 0.05,
+    seed: int = 0,
+) -> dict:
+    """Come `paired_bootstrap`, dai conteggi congiunti di uno o due modelli
+    (il secondo è il riferimento): ogni replica è un campione multinomiale di
+    `n` righe sulle celle, costo indipendente dal numero di testi."""
+    if counts.n_models not in (1, 2):
+        raise ValueError("bootstrap su uno o due modelli")
+    n = counts.n
+    if n == 0:
+        raise ValueError("bootstrap su un set di valutazione vuoto")
+    m = counts.n_models
+
+    rng = np.random.default_rng(seed)
+    p = counts.counts.ravel() / n
+    step = max(1, _CHUNK_ELEMENTS // counts.counts.size)
+    boot = np.concatenate(
+        [
+            rng.multinomial(n, p, size=min(step, n_resamples - start))
+            for start in range(0, n_resamples, step)
+        ]
+    ).reshape((n_resamples,) + counts.counts.shape)
+
+    stats = []
+    for model in range(m):
+        conf = counts.confusion(model)
+        # stessa maschera di `summary(model)`: punto e delta coincidono con
+        # le macro-F1 riportate per ciascun modello
+        present = (conf.sum(axis=0) + conf.sum(axis=1)) > 0
+        boot_conf = _model_confusion(boot, m, model)
+        stats.append(
+            (
+                (_macro_f1(conf, present), _accuracy(conf)),
+                (_macro_f1(boot_conf, present), _accuracy(boot_conf)),
+            )
+        )
+    return _result(n, n_resamples, alpha, stats)
@@ -0,0 +1,39 @@
+"""Lettura a chunk dei dataset offline (CSV, Parquet, JSONL).
+
+Modulo leggero: dipende solo da pandas (pyarrow solo per il Parquet), così
+ingestione, valutazione e scoring condividono lo stesso reader senza
+importare mlflow o transformers.
+"""
+
+import pandas as pd
+
+CHUNK_SIZE = 10000
+
+
+def iter_chunks(
+    path: str,
+    chunksize: int = CHUNK_SIZE,
+    shard: int = 0,
+    num_shards: int = 1,
+    columns: tuple | None = ("text", "label"),
+):
+    """DataFrame di `chunksize` righe (CSV, Parquet o JSONL), solo quelli dello
+    shard; `columns=None` tiene tutte le colonne."""
+    columns = list(columns) if columns is not None else None
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        batches = pq.ParquetFile(path).iter_batches(
+            batch_size=chunksize, columns=columns
+        )
+        reader = (batch.to_pandas() for batch in batches)
+    elif path.endswith(".jsonl"):
+        reader = (
+            chunk if columns is None else chunk[columns]
+            for chunk in pd.read_json(path, lines=True, chunksize=chunksize)
+        )
+    else:
+        reader = pd.read_csv(path, chunksize=chunksize, usecols=columns)
+    for i, chunk in enumerate(reader):
+        if i % num_shards == shard:
+            yield chunk
@@ -0,0 +1,99 @@
+"""Schema delle etichette di sentiment condiviso da serving, valutazione e drift.
+
+Le etichette canoniche sono codificate come interi (`int8`) nell'ordine di
+`LABELS`, lo stesso degli id del modello cardiffnlp (`LABEL_0` = negative, ...);
+`UNKNOWN` (-1) marca valori fuori schema. Le funzioni lavorano su array interi
+(batch) con NumPy, così metriche e distribuzioni non ciclano in Python.
+Modulo leggero: dipende solo da NumPy, non da mlflow/transformers.
+"""
+
+from typing import Iterable
+
+import numpy as np
+
+LABELS = ("negative", "neutral", "positive")
+UNKNOWN = -1
+_label_map = dict(enumerate(LABELS))
+
+# alias (già in minuscolo) -> codice; ordinati per la ricerca con searchsorted
+_ALIASES = {name: i for i, name in enumerate(LABELS)}
+_ALIASES.update({f"label_{i}": i for i in range(len(LABELS))})
+_ALIAS_KEYS = np.array(sorted(_ALIASES))
+_ALIAS_CODES = np.array([_ALIASES[k] for k in _ALIAS_KEYS], dtype=np.int8)
+_DECODE = np.array(LABELS + ("unknown",), dtype=object)
+
+
+def normalize_label(raw_label) -> str:
+    """`LABEL_<i>` -> etichetta canonica; altrimenti stringa in minuscolo."""
+    if isinstance(raw_label, str) and raw_label.startswith("LABEL_"):
+        idx = int(raw_label.split("_")[-1])
+        return _label_map.get(idx, raw_label)
+    return str(raw_label).lower()
+
+
+def _as_str_array(values) -> np.ndarray:
+    arr = np.asarray(values)
+    if arr.dtype.kind != "U":
+        arr = arr.astype(str)
+    return np.char.lower(np.char.strip(arr))
+
+
+def encode_labels(values: Iterable) -> np.ndarray:
+    """Etichette grezze (stringhe o id interi) -> codici `int8`.
+
+    Accetta nomi canonici in qualsiasi case, `LABEL_<i>` e id numerici;
+    tutto il resto diventa `UNKNOWN`.
+    """
+    arr = np.asarray(values if hasattr(values, "__len__") else list(values))
+    if arr.size == 0:
+        return np.empty(0, dtype=np.int8)
+    if arr.dtype.kind in "iu":
+        valid = (arr >= 0) & (arr < len(LABELS))
+        return np.where(valid, arr, UNKNOWN).astype(np.int8)
+    keys = _as_str_array(arr)
+    idx = np.searchsorted(_ALIAS_KEYS, keys).clip(max=len(_ALIAS_KEYS) - 1)
+    hit = _ALIAS_KEYS[idx] == keys
+    return np.where(hit, _ALIAS_CODES[idx], UNKNOWN).astype(np.int8)
+
+
+def decode_labels(codes: np.ndarray) -> np.ndarray:
+    """Codici -> array di etichette canoniche (`"unknown"` per `UNKNOWN`)."""
+    return _DECODE[np.asarray(codes, dtype=np.int64)]
+
+
+def softmax(logits: np.ndarray, axis: int = -1) -> np.ndarray:
+    z = np.asarray(logits, dtype=np.float64)
+    z = z - z.max(axis=axis, keepdims=True)
+    e = np.exp(z)
+    return e / e.sum(axis=axis, keepdims=True)
+
+
+def from_logits(logits: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Logits `(n, n_classi)` -> (codici `int8`, score della classe scelta)."""
+    probs = softmax(logits)
+    codes = probs.argmax(axis=-1)
+    scores = np.take_along_axis(probs, codes[:, None], axis=-1)[:, 0]
+    return codes.astype(np.int8), scores
+
+
+def labels_from_outputs(outputs) -> np.ndarray:
+    """Output di un modello pyfunc (dict con `label` o etichette) -> codici."""
+    if isinstance(outputs, np.ndarray) and outputs.dtype.kind != "O":
+        return encode_labels(outputs)  # es. sklearn: array di etichette
+    values = [o["label"] if isinstance(o, dict) else o for o in outputs]
+    return encode_labels(values)
+
+
+def class_counts(codes: np.ndarray) -> np.ndarray:
+    """Conteggi per classe canonica (gli `UNKNOWN` sono esclusi)."""
+    codes = np.asarray(codes)
+    return np.bincount(codes[codes >= 0], minlength=len(LABELS))
+
+
+def class_distribution(codes: np.ndarray) -> dict[str, float]:
+    """Frequenze relative delle classi presenti, sul totale delle righe."""
+    total = len(codes)
+    if total == 0:
+        return {}
+    counts = class_counts(codes)
+    return {LABELS[i]: c / total for i, c in enumerate(counts.tolist()) if c}
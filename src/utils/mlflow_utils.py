@@ -1,11 +1,17 @@
 import os
+import threading
+import time
+
 import mlflow
+from mlflow.exceptions import MlflowException
 
 # Imposta tracking URI (default locale)
 MLFLOW_URI = os.getenv("MLFLOW_TRACKING_URI", "http://localhost:5000")
 mlflow.set_tracking_uri(MLFLOW_URI)
 
 REGISTERED_NAME = os.getenv("REGISTERED_MODEL_NAME", "Sentiment")
+# Durata della cache dei metadati del registry (secondi, 0 = disattivata)
+REGISTRY_CACHE_TTL = float(os.getenv("REGISTRY_CACHE_TTL", "30"))
 
 
 def get_or_create_experiment(name: str) -> str:
@@ -18,16 +24,133 @@ def get_or_create_experiment(name: str) -> str:
         return f"fake-experiment-{name}"
 
 
+class RegistryClient:
+    """Accesso al Model Registry con un solo `MlflowClient` e cache TTL.
+
+    Le letture dei metadati (ultima versione, versione di uno stage) restano
+    in cache per `ttl` secondi, così chi interroga il registry più volte per
+    run (evaluate, task del DAG, polling della serving app) non rifà le
+    stesse richieste; le transizioni di stage invalidano la cache del modello.
+    """
+
+    def __init__(
+        self, tracking_uri: str | None = None, ttl: float = REGISTRY_CACHE_TTL
+    ):
+        self.client = mlflow.tracking.MlflowClient(tracking_uri=tracking_uri)
+        self.ttl = ttl
+        self.requests = 0  # chiamate effettive al registry
+        self._cache: dict[tuple, tuple[float, object]] = {}
+        self._lock = threading.Lock()
+
+    def _cached(self, key: tuple, fetch):
+        now = time.monotonic()
+        with self._lock:
+            hit = self._cache.get(key)
+            if hit is not None and hit[0] > now:
+                return hit[1]
+        value = fetch()
+        self.requests += 1
+        if self.ttl > 0:
+            with self._lock:
+                self._cache[key] = (now + self.ttl, value)
+        return value
+
+    def invalidate(self, model_name: str | None = None) -> None:
+        with self._lock:
+            if model_name is None:
+                self._cache.clear()
+            else:
+                for key in [k for k in self._cache if k[1] == model_name]:
+                    del self._cache[key]
+
+    def _fetch_latest(self, model_name: str):
+        query = f"name='{model_name}'"
+        try:
+            # una sola versione, ordinata lato registry
+            versions = self.client.search_model_versions(
+                query, max_results=1, order_by=["version_number DESC"]
+            )
+            return versions[0] if versions else None
+        except MlflowException:
+            pass
+        # registry senza order_by su version_number: scansione a pagine
+        latest, token = None, None
+        while True:
+            page = self.client.search_model_versions(
+                query, max_results=1000, page_token=token
+            )
+            for v in page:
+                if latest is None or int(v.version) > int(latest.version):
+                    latest = v
+            token = page.token
+            if not token:
+                return latest
+
+    def latest_version(self, model_name: str = REGISTERED_NAME):
+        """Versione registrata più recente (`ModelVersion`) o `None`."""
+        return self._cached(
+            ("latest", model_name), lambda: self._fetch_latest(model_name)
+        )
+
+    def run_version(self, model_name: str, run_id: str, artifact_path: str = ""):
+        """Versione più recente di `model_name` registrata dal run `run_id`
+        (preferendo quella con sorgente `artifact_path`) o `None`. Non in
+        cache: il run può essere registrato subito dopo la prima lettura."""
+        self.requests += 1
+        versions = sorted(
+            self.client.search_model_versions(
+                f"name='{model_name}' and run_id='{run_id}'"
+            ),
+            key=lambda v: int(v.version),
+            reverse=True,
+        )
+        path = artifact_path.strip("/")
+        matching = [v for v in versions if path and v.source.endswith(f"/{path}")]
+        return (matching or versions or [None])[0]
+
+    def stage_version(
+        self, model_name: str = REGISTERED_NAME, stage: str = "Production"
+    ):
+        """Versione più recente nello stage `stage` o `None`."""
+
+        def fetch():
+            versions = self.client.get_latest_versions(model_name, stages=[stage])
+            return versions[0] if versions else None
+
+        return self._cached(("stage", model_name, stage), fetch)
+
+    def transition(self, model_name: str, version: int, stage: str) -> None:
+        self.client.transition_model_version_stage(
+            name=model_name,
+            version=version,
+            stage=stage,
+            archive_existing_versions=True,
+        )
+        self.invalidate(model_name)
+
+
+_registries: dict[str, RegistryClient] = {}
+
+
+def registry() -> RegistryClient:
+    """`RegistryClient` condiviso per la tracking URI corrente."""
+    uri = mlflow.get_tracking_uri()
+    if uri not in _registries:
+        _registries[uri] = RegistryClient(uri)
+    return _registries[uri]
+
+
+def latest_version_uri(model_name: str = REGISTERED_NAME) -> str | None:
+    version = registry().latest_version(model_name)
+    return f"models:/{model_name}/{int(version.version)}" if version else None
+
+
 def promote_to_stage(model_name: str, version: int, stage: str = "Production") -> None:
-    client = mlflow.tracking.MlflowClient()
-    client.transition_model_version_stage(
-        name=model_name, version=version, stage=stage, archive_existing_versions=True
-    )
+    registry().transition(model_name, version, stage)
 
 
 def get_production_model_uri(model_name: str) -> str | None:
-    client = mlflow.tracking.MlflowClient()
-    versions = client.get_latest_versions(model_name, stages=["Production"]) or []
-    if not versions:
+    version = registry().stage_version(model_name, "Production")
+    if version is None:
         return None
-    return f"models:/{model_name}/{versions[0].current_stage}"
+    return f"models:/{model_name}/{version.current_stage}"
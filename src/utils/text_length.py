@@ -0,0 +1,128 @@
+"""Politica sulla lunghezza degli input del modello.
+
+Il tokenizer RoBERTa tronca a 512 token: i testi molto lunghi (post stile
+Reddit) perdono la coda e sono anche i forward pass più costosi, che
+allungano il padding dell'intero batch. Qui:
+
+- `estimate_tokens` stima i token senza tokenizer (parole + punteggiatura,
+  circa un token BPE ciascuno), abbastanza economica da farla per richiesta;
+- `LengthPolicy` decide se un testo è "lungo" (corsia/batch separati) e, con
+  `mode="chunk"`, lo divide in finestre sovrapposte i cui punteggi vengono
+  aggregati (`predict_texts`); con `mode="truncate"` resta il troncamento.
+
+Configurazione via env: `LONG_TEXT_POLICY` (truncate|chunk),
+`LONG_TEXT_THRESHOLD`, `CHUNK_WINDOW_TOKENS`, `CHUNK_STRIDE_TOKENS`,
+`CHUNK_MAX_WINDOWS`.
+"""
+
+import os
+import re
+from collections import defaultdict
+from dataclasses import dataclass
+
+MODEL_MAX_TOKENS = 512
+
+# limiti superiori (token stimati) dei bucket usati nelle metriche
+LENGTH_BUCKETS = (32, 64, 128, 256, 512)
+
+_piece = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text: str) -> int:
+    """Stima economica del numero di token (inclusi `<s>` e `</s>`)."""
+    return len(_piece.findall(text)) + 2
+
+
+def length_bucket(n_tokens: int) -> str:
+    for bound in LENGTH_BUCKETS:
+        if n_tokens <= bound:
+            return str(bound)
+    return "inf"
+
+
+def split_windows(text: str, window: int, stride: int, max_windows: int) -> list:
+    """Finestre di `window` token stimati che avanzano di `stride`.
+
+    I tagli cadono sui confini dei token stimati e ogni finestra è una
+    sottostringa del testo originale. Oltre `max_windows` il resto è ignorato.
+    """
+    spans = [m.span() for m in _piece.finditer(text)]
+    if len(spans) <= window:
+        return [text]
+    windows = []
+    for start in range(0, len(spans), stride):
+        end = min(start + window, len(spans))
+        windows.append(text[spans[start][0] : spans[end - 1][1]])
+        if end == len(spans) or len(windows) == max_windows:
+            break
+    return windows
+
+
+def aggregate(results: list, weights: list) -> tuple:
+    """Combina i `(label, score)` delle finestre pesando per lunghezza.
+
+    Vince l'etichetta con la massa `score * peso` più alta; lo score è quella
+    massa normalizzata sul peso totale.
+    """
+    mass: dict = defaultdict(float)
+    for (label, score), weight in zip(results, weights):
+        mass[label] += score * weight
+    label = max(mass, key=mass.get)
+    return label, mass[label] / sum(weights)
+
+
+@dataclass(frozen=True)
+class LengthPolicy:
+    mode: str = "truncate"
+    long_threshold: int = 128
+    window: int = 256
+    stride: int = 192
+    max_windows: int = 8
+
+    @classmethod
+    def from_env(cls) -> "LengthPolicy":
+        mode = os.getenv("LONG_TEXT_POLICY", cls.mode)
+        if mode not in ("truncate", "chunk"):
+            raise ValueError(f"LONG_TEXT_POLICY must be truncate|chunk, got {mode!r}")
+        return cls(
+            mode=mode,
+            long_threshold=int(os.getenv("LONG_TEXT_THRESHOLD", cls.long_threshold)),
+            window=min(
+                int(os.getenv("CHUNK_WINDOW_TOKENS", cls.window)), MODEL_MAX_TOKENS - 2
+            ),
+            stride=int(os.getenv("CHUNK_STRIDE_TOKENS", cls.stride)),
+            max_windows=int(os.getenv("CHUNK_MAX_WINDOWS", cls.max_windows)),
+        )
+
+    def is_long(self, n_tokens: int) -> bool:
+        return n_tokens > self.long_threshold
+
+    def windows(self, text: str) -> list:
+        if self.mode != "chunk":
+            return [text]
+        return split_windows(text, self.window, self.stride, self.max_windows)
+
+
+def predict_texts(predict_batch, texts: list, policy: LengthPolicy, timings=None):
+    """Applica la policy attorno a `predict_batch(texts, timings)`.
+
+    Con `mode="chunk"` i testi lunghi vengono espansi in finestre, tutte le
+    finestre passano in un'unica chiamata e i risultati sono riaggregati per
+    testo; l'output resta una lista di `(label, score)` allineata a `texts`.
+    """
+    if policy.mode != "chunk":
+        return predict_batch(list(texts), timings)
+    flat, owners, weights = [], [], []
+    for i, text in enumerate(texts):
+        for window in policy.windows(text):
+            flat.append(window)
+            owners.append(i)
+            weights.append(estimate_tokens(window))
+    if len(flat) == len(texts):
+        return predict_batch(flat, timings)
+    results = predict_batch(flat, timings)
+    grouped: dict = defaultdict(lambda: ([], []))
+    for owner, result, weight in zip(owners, results, weights):
+        grouped[owner][0].append(result)
+        grouped[owner][1].append(weight)
+    return [aggregate(*grouped[i]) for i in range(len(texts))]
@@ -0,0 +1,267 @@
+"""Tokenizzazione con cache in memoria e token id precalcolati su disco.
+
+- `TokenCache.encode(tokenizer, texts)` sostituisce
+  `tokenizer(texts, padding=True, truncation=True, return_tensors="pt")`:
+  gli id (troncati, senza padding) di ogni testo restano in una LRU limitata
+  (`TOKEN_CACHE_SIZE` testi) indicizzata da hash del testo e versione del
+  tokenizer, così retweet e testi ripetuti non vengono ritokenizzati.
+- `TokenStore` salva gli id di un dataset offline come array memory-mapped in
+  `<file>.tokens/<versione tokenizer>/` accanto al CSV/Parquet/JSONL. Con
+  `TokenCache.attach(path)` i testi di quel dataset vengono letti dallo store
+  (creato alla prima esecuzione, riusato finché il file sorgente non cambia)
+  invece di passare dal tokenizer: candidato e Production in valutazione, e i
+  run successivi dei job batch, non ritokenizzano l'holdout.
+
+Il padding replica quello del tokenizer per i modelli RoBERTa (a destra, con
+`pad_token_id`, output `input_ids` + `attention_mask`).
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "50000"))
+
+_versions: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def tokenizer_version(tokenizer) -> str:
+    """Impronta del tokenizer: nome, classe, vocabolario e lunghezza massima."""
+    try:
+        return _versions[tokenizer]
+    except (KeyError, TypeError):
+        pass
+    spec = "|".join(
+        str(part)
+        for part in (
+            type(tokenizer).__name__,
+            getattr(tokenizer, "name_or_path", ""),
+            len(tokenizer),
+            getattr(tokenizer, "model_max_length", ""),
+        )
+    )
+    version = hashlib.sha1(spec.encode()).hexdigest()[:12]
+    try:
+        _versions[tokenizer] = version
+    except TypeError:  # oggetti senza weakref: si ricalcola ogni volta
+        pass
+    return version
+
+
+def text_hash(text: str) -> int:
+    return int.from_bytes(
+        hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little"
+    )
+
+
+def file_digest(path: str) -> str:
+    """SHA-1 del contenuto di `path`, letto a blocchi da 1 MB."""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def pad(ids: list, pad_id: int, return_tensors: str | None = "pt") -> dict:
+    """Lista di sequenze di id -> `input_ids`/`attention_mask` con padding."""
+    width = max((len(seq) for seq in ids), default=0)
+    input_ids = np.full((len(ids), width), pad_id, dtype=np.int64)
+    mask = np.zeros((len(ids), width), dtype=np.int64)
+    for row, seq in enumerate(ids):
+        input_ids[row, : len(seq)] = seq
+        mask[row, : len(seq)] = 1
+    if return_tensors == "pt":
+        import torch
+
+        return {
+            "input_ids": torch.from_numpy(input_ids),
+            "attention_mask": torch.from_numpy(mask),
+        }
+    return {"input_ids": input_ids, "attention_mask": mask}
+
+
+class TokenStore:
+    """Id di un dataset tokenizzato: `ids` (piatto, int32), `offsets`, hash
+    dei testi ordinati per la ricerca con `searchsorted`."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        with open(os.path.join(directory, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.ids = np.load(os.path.join(directory, "ids.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(directory, "offsets.npy"), mmap_mode="r")
+        hashes = np.load(os.path.join(directory, "hashes.npy"))
+        self._order = np.argsort(hashes, kind="stable")
+        self._sorted = hashes[self._order]
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def row(self, i: int) -> list:
+        return self.ids[self.offsets[i] : self.offsets[i + 1]].tolist()
+
+    def lookup(self, h: int) -> list | None:
+        pos = int(np.searchsorted(self._sorted, np.uint64(h)))
+        if pos < len(self._sorted) and self._sorted[pos] == h:
+            return self.row(int(self._order[pos]))
+        return None
+
+    @staticmethod
+    def directory_for(path: str, version: str) -> str:
+        return os.path.join(f"{path}.tokens", version)
+
+    @classmethod
+    def build(
+        cls, path: str, tokenizer, text_column: str = "text", batch_size: int = 1024
+    ) -> "TokenStore":
+        """Tokenizza `path` a chunk di `batch_size` righe (`iter_chunks`): in
+        memoria restano solo gli id compatti, non i testi del dataset."""
+        from src.utils.chunks import iter_chunks
+
+        version = tokenizer_version(tokenizer)
+        directory = cls.directory_for(path, version)
+        ids, lengths, hashes = [], [], []
+        for chunk in iter_chunks(path, batch_size, columns=(text_column,)):
+            texts = chunk[text_column].fillna("").astype(str).tolist()
+            seqs = tokenizer(texts, truncation=True)["input_ids"]
+            lengths.append(np.fromiter(map(len, seqs), dtype=np.int64))
+            ids.append(np.fromiter((t for seq in seqs for t in seq), dtype=np.int32))
+            hashes.append(np.array([text_hash(t) for t in texts], dtype=np.uint64))
+        lengths = np.concatenate(lengths) if lengths else np.zeros(0, dtype=np.int64)
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        tmp = f"{directory}.tmp-{os.getpid()}"
+        os.makedirs(tmp, exist_ok=True)
+        np.save(
+            os.path.join(tmp, "ids.npy"),
+            np.concatenate(ids) if ids else np.zeros(0, dtype=np.int32),
+        )
+        np.save(os.path.join(tmp, "offsets.npy"), offsets)
+        np.save(
+            os.path.join(tmp, "hashes.npy"),
+            np.concatenate(hashes) if hashes else np.zeros(0, dtype=np.uint64),
+        )
+        with open(os.path.join(tmp, "meta.json"), "w") as f:
+            json.dump(
+                {
+                    "source": os.path.abspath(path),
+                    "source_sha1": file_digest(path),
+                    "text_column": text_column,
+                    "tokenizer_version": version,
+                    "rows": len(lengths),
+                },
+                f,
+                indent=2,
+            )
+        if os.path.isdir(directory):  # store obsoleto
+            shutil.rmtree(directory, ignore_errors=True)
+        try:
+            os.replace(tmp, directory)
+        except OSError:  # creato nel frattempo da un altro processo (shard)
+            shutil.rmtree(tmp, ignore_errors=True)
+        return cls(directory)
+
+    @classmethod
+    def open(cls, path: str, tokenizer, text_column: str = "text", build: bool = True):
+        """Store valido per `path` e `tokenizer`, creandolo se manca o se il
+        file sorgente è cambiato (con `build=False` ritorna `None`)."""
+        directory = cls.directory_for(path, tokenizer_version(tokenizer))
+        if os.path.exists(os.path.join(directory, "meta.json")):
+            store = cls(directory)
+            if (
+                store.meta["source_sha1"] == file_digest(path)
+                and store.meta["text_column"] == text_column
+            ):
+                return store
+        return cls.build(path, tokenizer, text_column) if build else None
+
+
+class TokenCache:
+    def __init__(self, maxsize: int = TOKEN_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._lru: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._store_lock = threading.Lock()
+        self._datasets: dict = {}  # path -> (colonna del testo, build)
+        self._stores: dict = {}  # (path, versione) -> TokenStore o None
+
+    def attach(self, path: str, text_column: str = "text", build: bool = True) -> None:
+        """I testi di `path` vengono letti dal suo `TokenStore`; con
+        `build=False` solo se lo store esiste già (nessuna tokenizzazione
+        dell'intero file, es. negli shard)."""
+        self._datasets[path] = (text_column, build)
+
+    def detach(self, path: str) -> None:
+        self._datasets.pop(path, None)
+        for key in [k for k in self._stores if k[0] == path]:
+            del self._stores[key]
+
+    def _stores_for(self, tokenizer, version: str) -> list:
+        stores = []
+        with self._store_lock:
+            for path, (column, build) in list(self._datasets.items()):
+                key = (path, version)
+                if key not in self._stores:
+                    self._stores[key] = TokenStore.open(path, tokenizer, column, build)
+                if self._stores[key] is not None:
+                    stores.append(self._stores[key])
+        return stores
+
+    def encode(self, tokenizer, texts: list, return_tensors: str | None = "pt"):
+        """Come `tokenizer(texts, padding=True, truncation=True)`; ritorna
+        `(encoding, hit)` con `hit` = testi non passati dal tokenizer.
+
+        Tokenizer senza `pad_token_id` (padding non replicabile) vengono
+        chiamati direttamente, senza cache."""
+        if getattr(tokenizer, "pad_token_id", None) is None:
+            enc = tokenizer(
+                texts, padding=True, truncation=True, return_tensors=return_tensors
+            )
+            return enc, 0
+        version = tokenizer_version(tokenizer)
+        keys = [(version, text_hash(t)) for t in texts]
+        ids: list = [None] * len(texts)
+        with self._lock:
+            for i, key in enumerate(keys):
+                seq = self._lru.get(key)
+                if seq is not None:
+                    self._lru.move_to_end(key)
+                    ids[i] = seq
+        missing = [i for i, seq in enumerate(ids) if seq is None]
+        if missing and self._datasets:
+            for store in self._stores_for(tokenizer, version):
+                for i in missing:
+                    if ids[i] is None:
+                        ids[i] = store.lookup(keys[i][1])
+            missing = [i for i in missing if ids[i] is None]
+        if missing:
+            out = tokenizer([texts[i] for i in missing], truncation=True)
+            for i, seq in zip(missing, out["input_ids"]):
+                ids[i] = list(seq)
+        hit = len(texts) - len(missing)
+        with self._lock:
+            self.hits += hit
+            self.misses += len(missing)
+            if self.maxsize > 0:
+                for key, seq in zip(keys, ids):
+                    self._lru[key] = seq
+                    self._lru.move_to_end(key)
+                while len(self._lru) > self.maxsize:
+                    self._lru.popitem(last=False)
+        return pad(ids, tokenizer.pad_token_id, return_tensors), hit
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._lru), "hits": self.hits, "misses": self.misses}
+
+
+token_cache = TokenCache()
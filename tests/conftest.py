@@ -1,6 +1,49 @@
 # Rende importabile il pacchetto "src" durante i test CI senza installazione
 import os
 import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
 
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 sys.path.insert(0, ROOT)
+
+
+class _GatewayHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        gateway = self.server.gateway
+        if gateway.fail:
+            gateway.fail -= 1
+            self.send_response(503)
+        else:
+            gateway.pushes.append((self.path, body.decode()))
+            self.send_response(200)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class StandInGateway:
+    """Pushgateway finto: registra i push; `fail=n` risponde 503 n volte."""
+
+    def __init__(self):
+        self.pushes = []
+        self.fail = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _GatewayHandler)
+        self.server.gateway = self
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def pushgateway():
+    gateway = StandInGateway()
+    yield gateway
+    gateway.close()
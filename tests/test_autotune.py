@@ -0,0 +1,145 @@
+from collections import deque
+from types import SimpleNamespace
+
+import numpy as np
+from prometheus_client import REGISTRY
+
+from src.serving.autotune import BatchAutotuner, _p99
+from src.serving.batching import BatchScheduler
+
+
+def _arrivals(rate: float, seconds: float, start: float = 0.0, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    gaps = rng.exponential(1 / rate, int(rate * seconds * 1.2))
+    times = start + np.cumsum(gaps)
+    return times[times < start + seconds].tolist()
+
+
+def _cost(batch_size: int) -> float:
+    """Inferenza simulata: 2 ms di overhead fisso + 1 ms per testo."""
+    return 0.002 + 0.001 * batch_size
+
+
+def simulate(tuner, arrivals: list) -> list:
+    """Server a eventi discreti con lo stesso schema dello scheduler: attende
+    fino a `max_wait` che il batch si riempia, poi esegue fino a
+    `max_batch_size` richieste. Ritorna `(arrivo, latenza)` per richiesta."""
+    s = tuner.scheduler
+    t, i, queue, out = 0.0, 0, deque(), []
+    while i < len(arrivals) or queue:
+        if not queue:
+            t = max(t, arrivals[i])
+        while i < len(arrivals) and arrivals[i] <= t:
+            queue.append(arrivals[i])
+            i += 1
+        if len(queue) < s.max_batch_size and s.max_wait > 0:
+            flush = t + s.max_wait
+            while (
+                i < len(arrivals)
+                and len(queue) < s.max_batch_size
+                and arrivals[i] <= flush
+            ):
+                queue.append(arrivals[i])
+                i += 1
+            t = flush if len(queue) < s.max_batch_size else max(t, queue[-1])
+        batch = [queue.popleft() for _ in range(min(len(queue), s.max_batch_size))]
+        waits = [t - a for a in batch]
+        duration = _cost(len(batch))
+        t += duration
+        tuner.observe(len(batch), duration, waits)
+        out.extend((a, w + duration) for a, w in zip(batch, waits))
+    return out
+
+
+def _tail_p99(results: list, after: float) -> float:
+    return _p99([lat for arrival, lat in results if arrival >= after])
+
+
+def _tuner(size: int, wait_ms: float, slo_ms: float, **kwargs):
+    sched = SimpleNamespace(max_batch_size=size, max_wait=wait_ms / 1000)
+    return BatchAutotuner(sched, "sim", slo_p99_ms=slo_ms, **kwargs)
+
+
+def test_overload_grows_batch_until_slo_is_met():
+    # 800 req/s: a batch 1 la capacità è ~333 req/s, servono batch grandi
+    tuner = _tuner(1, 0, slo_ms=100, size_limit=64, interval=10)
+    results = simulate(tuner, _arrivals(800, 20))
+    s = tuner.scheduler
+    assert 8 <= s.max_batch_size <= 64
+    assert _tail_p99(results, after=15) <= 0.1
+
+
+def test_tight_slo_shrinks_oversized_batches():
+    tuner = _tuner(64, 20, slo_ms=30, wait_limit_ms=20, interval=10)
+    results = simulate(tuner, _arrivals(400, 20))
+    s = tuner.scheduler
+    assert s.max_batch_size < 64
+    assert 0 <= s.max_wait <= 0.02
+    assert _tail_p99(results, after=15) <= 0.03
+
+
+def test_light_traffic_uses_wait_budget_within_bounds():
+    tuner = _tuner(16, 0, slo_ms=50, wait_limit_ms=10, interval=10)
+    results = simulate(tuner, _arrivals(100, 20))
+    s = tuner.scheduler
+    assert s.max_wait == 0.01  # attesa al limite: c'è margine sull'SLO
+    assert s.max_batch_size == 16
+    assert _tail_p99(results, after=10) <= 0.05
+
+
+def test_traffic_shift_adapts_and_stays_in_bounds():
+    tuner = _tuner(4, 0, slo_ms=60, size_limit=32, wait_limit_ms=5, interval=10)
+    trace = _arrivals(100, 10) + _arrivals(700, 10, start=10, seed=1)
+    seen = []
+    real = tuner._decide
+
+    def spy(latencies, fills):
+        decision = real(latencies, fills)
+        seen.append((tuner.scheduler.max_batch_size, tuner.scheduler.max_wait))
+        return decision
+
+    tuner._decide = spy
+    results = simulate(tuner, trace)
+    assert all(1 <= size <= 32 and 0 <= wait <= 0.005 for size, wait in seen)
+    assert tuner.scheduler.max_batch_size >= 8
+    assert _tail_p99(results, after=17) <= 0.06
+
+
+def test_scheduler_reports_to_autotuner_and_gauges():
+    sched = BatchScheduler(
+        lambda texts, timings=None: [("neutral", 0.5)] * len(texts),
+        max_batch_size=4,
+        model="autotune-test",
+        mirror=False,
+        autotune=True,
+    )
+    sched.autotuner.interval = 2
+    for _ in range(4):
+        sched.predict("hello")
+    assert sum(sched.autotuner.batch_seconds) == 1  # solo batch da 1 testo
+    labels = {"model": "autotune-test"}
+    assert REGISTRY.get_sample_value(
+        "app_batch_autotune_setting", {**labels, "setting": "max_batch_size"}
+    ) == float(sched.max_batch_size)
+    decisions = [
+        REGISTRY.get_sample_value(
+            "app_batch_autotune_decisions_total", {**labels, "decision": d}
+        )
+        or 0
+        for d in ("increase_size", "increase_wait", "decrease", "hold")
+    ]
+    assert sum(decisions) == 2
+    assert REGISTRY.get_sample_value("app_batch_autotune_p99_seconds", labels) > 0
+
+
+def test_fill_is_measured_against_the_lane_limit():
+    # batch lunghi pieni a `long_batch_size=2` non sono "sottoriempiti"
+    full = _tuner(8, 0, slo_ms=100, wait_limit_ms=5, interval=4)
+    for _ in range(4):
+        full.observe(2, 0.004, [0.001, 0.001], limit=2)
+    assert full.scheduler.max_batch_size == 10 and full.scheduler.max_wait == 0
+
+    partial = _tuner(8, 0, slo_ms=100, wait_limit_ms=5, interval=4)
+    for _ in range(4):
+        partial.observe(2, 0.004, [0.001, 0.001])
+    assert partial.scheduler.max_batch_size == 8 and partial.scheduler.max_wait > 0
@@ -0,0 +1,117 @@
+import json
+import os
+
+import joblib
+import mlflow
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.models import batch_score, distill
+from src.utils.labels import LABELS, encode_labels
+
+
+class EchoModel:
+    def __init__(self):
+        self.calls = []
+
+    def predict(self, texts):
+        self.calls.append(len(texts))
+        return [{"label": (t.split() or [""])[0], "score": 0.9} for t in texts]
+
+
+def test_labels_and_scores_handles_both_output_shapes():
+    labels, scores = batch_score.labels_and_scores(
+        [{"label": "LABEL_2", "score": 0.7}, {"label": "odd"}]
+    )
+    assert labels.tolist() == ["positive", "unknown"]
+    assert scores[0] == 0.7 and np.isnan(scores[1])
+    labels, scores = batch_score.labels_and_scores(np.array(["negative", "neutral"]))
+    assert labels.tolist() == ["negative", "neutral"] and np.isnan(scores).all()
+
+
+def test_score_shard_writes_partition_then_marker(tmp_path):
+    chunk = pd.DataFrame({"id": [7, 8, 9], "text": ["neutral a", "positive b", None]})
+    model = EchoModel()
+    done = batch_score.score_shard(
+        3, chunk, str(tmp_path), fmt="csv", batch_size=2, model=model
+    )
+    assert model.calls == [2, 1] and done["rows"] == 3
+    out = pd.read_csv(tmp_path / "part-00003.csv")
+    assert out["id"].tolist() == [7, 8, 9]
+    assert out["label"].tolist() == ["neutral", "positive", "unknown"]
+    assert json.loads((tmp_path / "part-00003.done").read_text())["shard"] == 3
+
+
+def test_manifest_blocks_incompatible_resume(tmp_path):
+    manifest = {"input": "a.csv", "shard_size": 10}
+    batch_score._check_manifest(str(tmp_path), manifest)
+    batch_score._check_manifest(str(tmp_path), dict(manifest))
+    with pytest.raises(ValueError, match="parametri diversi"):
+        batch_score._check_manifest(str(tmp_path), {**manifest, "shard_size": 20})
+
+
+def test_manifest_detects_rewritten_input(tmp_path):
+    corpus = tmp_path / "corpus.csv"
+    pd.DataFrame({"text": ["a", "b"]}).to_csv(corpus, index=False)
+    out = str(tmp_path / "scores")
+    os.makedirs(out)
+
+    def manifest():
+        return batch_score._manifest(str(corpus), "models:/S/1", 10, "text", "csv")
+
+    batch_score._check_manifest(out, manifest())
+    batch_score._check_manifest(out, manifest())  # stesso file: resume
+    pd.DataFrame({"text": ["c", "d"]}).to_csv(corpus, index=False)
+    with pytest.raises(ValueError, match="parametri diversi"):
+        batch_score._check_manifest(out, manifest())
+
+
+def test_batch_score_in_process_pool_and_resume(tmp_path):
+    rng = np.random.default_rng(0)
+    labels = rng.choice(LABELS, 90)
+    words = {"negative": "awful", "neutral": "okay", "positive": "lovely"}
+    df = pd.DataFrame(
+        {
+            "id": range(90),
+            "text": [f"{words[lab]} item {i}" for i, lab in enumerate(labels)],
+        }
+    )
+    corpus = tmp_path / "corpus.jsonl"
+    df.to_json(corpus, orient="records", lines=True)
+
+    soft = np.eye(3)[encode_labels(labels)]
+    joblib.dump(distill.train_student(df["text"].tolist(), soft), tmp_path / "s.joblib")
+    mlflow.set_tracking_uri(f"file:{tmp_path / 'mlruns'}")
+    out = str(tmp_path / "scores")
+    try:
+        mlflow.set_experiment("batch_score_test")
+        with mlflow.start_run() as run:
+            mlflow.pyfunc.log_model(
+                artifact_path="model",
+                python_model=distill.StudentClassifier(),
+                artifacts={"student": str(tmp_path / "s.joblib")},
+            )
+        uri = f"runs:/{run.info.run_id}/model"
+        report = batch_score.batch_score(
+            str(corpus), out, model_uri=uri, workers=2, shard_size=25
+        )
+        assert report["shards_scored"] == 4 and report["rows"] == 90
+        assert report["rows_per_sec"] > 0
+        assert all(w["rows_per_sec"] > 0 for w in report["workers"].values())
+
+        # shard interrotto: partizione senza marker, viene rifatto solo quello
+        os.remove(os.path.join(out, "part-00002.done"))
+        again = batch_score.batch_score(
+            str(corpus), out, model_uri=uri, workers=1, shard_size=25
+        )
+        assert again["shards_scored"] == 1 and again["shards_skipped"] == 3
+    finally:
+        mlflow.set_tracking_uri(None)
+
+    scored = pd.concat(
+        pd.read_parquet(os.path.join(out, f"part-{i:05d}.parquet")) for i in range(4)
+    )
+    assert scored["id"].tolist() == list(range(90))
+    assert (scored["label"].to_numpy() == labels).mean() > 0.9
+    assert scored["score"].between(0, 1).all()
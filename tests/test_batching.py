@@ -0,0 +1,158 @@
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src.serving import load_model
+from src.serving.app import app
+from src.serving.batching import BatchScheduler, DeadlineExceeded
+from src.serving.metrics import SHED_REQUESTS
+from src.utils.text_length import LengthPolicy
+
+client = TestClient(app)
+
+
+class _GatedModel:
+    """predict_batch che blocca il primo batch finché il test non lo rilascia."""
+
+    def __init__(self):
+        self.batches = []
+        self.entered = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self, texts, timings=None):
+        self.batches.append(list(texts))
+        self.entered.set()
+        self.release.wait(5)
+        return [("neutral", 0.5)] * len(texts)
+
+
+def _submit(scheduler, text, results, **kwargs):
+    def run():
+        try:
+            results[text] = scheduler.predict(text, **kwargs)
+        except DeadlineExceeded as exc:
+            results[text] = exc
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def _wait_pending(scheduler, n):
+    end = time.time() + 5
+    while sum(scheduler.pending().values()) < n:
+        assert time.time() < end
+        time.sleep(0.005)
+
+
+def test_high_priority_served_first():
+    model = _GatedModel()
+    scheduler = BatchScheduler(model, max_batch_size=2)
+    results = {}
+    threads = [_submit(scheduler, "blocker", results)]
+    model.entered.wait(5)
+    for i in range(3):
+        threads.append(_submit(scheduler, f"low{i}", results, priority="low"))
+    _wait_pending(scheduler, 3)
+    for i in range(3):
+        threads.append(_submit(scheduler, f"high{i}", results, priority="high"))
+    _wait_pending(scheduler, 6)
+    model.release.set()
+    for t in threads:
+        t.join(5)
+
+    assert model.batches[0] == ["blocker"]
+    assert model.batches[1] == ["high0", "high1"]
+    assert model.batches[2] == ["high2", "low0"]
+    assert all(len(b) <= 2 for b in model.batches)
+    assert len(results) == 7 and all(r == ("neutral", 0.5) for r in results.values())
+
+
+def test_expired_requests_are_shed_without_model_time():
+    model = _GatedModel()
+    scheduler = BatchScheduler(model)
+    results = {}
+    shed_before = SHED_REQUESTS.labels(model="default", priority="low")._value.get()
+    threads = [_submit(scheduler, "blocker", results)]
+    model.entered.wait(5)
+    deadline = time.perf_counter() + 0.05
+    threads.append(
+        _submit(scheduler, "late", results, priority="low", deadline=deadline)
+    )
+    threads.append(_submit(scheduler, "ok", results, priority="low"))
+    _wait_pending(scheduler, 2)
+    time.sleep(0.1)
+    model.release.set()
+    for t in threads:
+        t.join(5)
+
+    assert isinstance(results["late"], DeadlineExceeded)
+    assert results["ok"] == ("neutral", 0.5)
+    assert ["ok"] in model.batches and not any("late" in b for b in model.batches)
+    assert (
+        SHED_REQUESTS.labels(model="default", priority="low")._value.get() - shed_before
+        == 1
+    )
+
+
+def test_model_errors_reach_every_request():
+    def boom(texts, timings=None):
+        raise RuntimeError("model down")
+
+    with pytest.raises(RuntimeError, match="model down"):
+        BatchScheduler(boom).predict("x")
+
+
+def test_queue_time_in_timings():
+    scheduler = BatchScheduler(lambda texts, timings: [("positive", 0.9)] * len(texts))
+    timings = {}
+    assert scheduler.predict("x", timings=timings) == ("positive", 0.9)
+    assert timings["queue"] >= 0
+
+
+def test_predict_priority_and_deadline_headers(monkeypatch):
+    monkeypatch.setattr(
+        load_model, "predict_batch", lambda texts, timings=None: [("positive", 0.9)]
+    )
+    r = client.post("/predict", json={"text": "hi"}, headers={"X-Priority": "high"})
+    assert r.status_code == 200 and r.json()["label"] == "positive"
+
+    r = client.post("/predict", json={"text": "hi"}, headers={"X-Deadline-Ms": "0"})
+    assert r.status_code == 503 and "deadline" in r.json()["error"]
+
+    r = client.post("/predict", json={"text": "hi"}, headers={"X-Priority": "urgent"})
+    assert r.status_code == 400
+
+    r = client.post(
+        "/predict", json={"text": "hi", "priority": "low", "deadline_ms": 1000}
+    )
+    assert r.status_code == 200
+
+
+def test_long_texts_batched_separately():
+    model = _GatedModel()
+    scheduler = BatchScheduler(
+        model,
+        max_batch_size=8,
+        long_batch_size=2,
+        policy=LengthPolicy(long_threshold=10),
+    )
+    results = {}
+    long_text = " ".join(["word"] * 50)
+    threads = [_submit(scheduler, "blocker", results)]
+    model.entered.wait(5)
+    for i in range(3):
+        threads.append(_submit(scheduler, f"{long_text} {i}", results))
+    threads.append(_submit(scheduler, "short0", results, priority="low"))
+    threads.append(_submit(scheduler, "short1", results))
+    _wait_pending(scheduler, 5)
+    model.release.set()
+    for t in threads:
+        t.join(5)
+
+    sizes = [[len(t.split()) > 10 for t in b] for b in model.batches[1:]]
+    # short (normal) davanti ai long (normal), poi i long a gruppi di 2
+    assert model.batches[1] == ["short1", "short0"]
+    assert sizes[1:] == [[True, True], [True]]
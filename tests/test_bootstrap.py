@@ -0,0 +1,94 @@
+import time
+
+import numpy as np
+import pytest
+from sklearn.metrics import accuracy_score, f1_score
+
+from src.models.evaluate import _significance_gate
+from src.monitoring import push_model_metrics
+from src.monitoring.exporter import MetricsExporter
+from src.utils.bootstrap import paired_bootstrap, per_class_metrics
+
+
+def _noisy(y, accuracy, rng):
+    return np.where(rng.random(len(y)) < accuracy, y, rng.integers(0, 3, len(y)))
+
+
+def test_point_estimates_match_sklearn():
+    rng = np.random.default_rng(0)
+    y = rng.integers(0, 3, 300)
+    pred = _noisy(y, 0.7, rng)
+    pred[:3] = -1  # output fuori schema: sklearn lo conta come classe a sé
+    result = paired_bootstrap(y, pred, n_resamples=200)
+    assert result["macro_f1"]["value"] == pytest.approx(
+        f1_score(y, pred, average="macro"), abs=1e-4
+    )
+    assert result["accuracy"]["value"] == pytest.approx(
+        accuracy_score(y, pred), abs=1e-4
+    )
+    low, high = result["macro_f1"]["ci"]
+    assert low <= result["macro_f1"]["value"] <= high
+    assert "delta_macro_f1" not in result
+
+    per_class = per_class_metrics(y, pred)
+    sk = f1_score(y, pred, labels=[0, 1, 2], average=None)
+    assert [per_class[c]["f1"] for c in per_class] == pytest.approx(sk, abs=1e-4)
+    assert sum(c["support"] for c in per_class.values()) == len(y)
+
+
+def test_paired_delta_and_gate():
+    rng = np.random.default_rng(1)
+    y = rng.integers(0, 3, 400)
+    prod = _noisy(y, 0.6, rng)
+
+    same = paired_bootstrap(y, prod, prod, n_resamples=500)
+    assert same["delta_macro_f1"]["ci"] == [0.0, 0.0]
+    assert not _significance_gate(same, 0.0)[0]
+
+    better = paired_bootstrap(y, _noisy(y, 0.95, rng), prod, n_resamples=500)
+    assert better["delta_macro_f1"]["ci"][0] > 0
+    assert better["delta_macro_f1"]["p_value"] == 0.0
+    assert _significance_gate(better, 0.0) == (True, None)
+    ok, reason = _significance_gate(better, 0.9)
+    assert not ok and "non supera 0.9" in reason
+
+    # piccolo guadagno su un holdout piccolo: rumore, niente promozione
+    small = np.arange(60) % 3
+    noisy = paired_bootstrap(small, _noisy(small, 0.75, rng), _noisy(small, 0.7, rng))
+    assert noisy["delta_macro_f1"]["ci"][0] < 0
+    assert not _significance_gate(noisy, 0.0)[0]
+
+    # prima versione: nessun confronto, si promuove
+    assert _significance_gate(paired_bootstrap(y, prod, n_resamples=10), 0.0)[0]
+
+
+def test_bootstrap_is_fast():
+    rng = np.random.default_rng(2)
+    y = rng.integers(0, 3, 2000)
+    start = time.perf_counter()
+    paired_bootstrap(y, _noisy(y, 0.8, rng), _noisy(y, 0.7, rng), n_resamples=2000)
+    assert time.perf_counter() - start < 5
+
+
+def test_push_metrics_includes_classes_and_intervals(pushgateway, tmp_path):
+    rng = np.random.default_rng(3)
+    y = rng.integers(0, 3, 200)
+    pred = _noisy(y, 0.8, rng)
+    bootstrap = paired_bootstrap(y, pred, _noisy(y, 0.6, rng), n_resamples=100)
+    exporter = MetricsExporter(pushgateway.url, "job", spool_dir=str(tmp_path))
+    push_model_metrics.record_model_metrics(
+        exporter, "Sentiment", "4", 0.8, 0.8,
+        per_class=per_class_metrics(y, pred), bootstrap=bootstrap,
+    )  # fmt: skip
+    reg = exporter.registry()
+    labels = {"model_name": "Sentiment", "model_version": "4"}
+    assert reg.get_sample_value(
+        "model_class_f1_score", {**labels, "sentiment_label": "neutral"}
+    ) == pytest.approx(per_class_metrics(y, pred)["neutral"]["f1"])
+    assert (
+        reg.get_sample_value(
+            "model_metric_ci", {**labels, "metric": "delta_macro_f1", "bound": "lower"}
+        )
+        == bootstrap["delta_macro_f1"]["ci"][0]
+    )
+    assert exporter.flush() and len(pushgateway.pushes) == 1
@@ -0,0 +1,160 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi import Response
+
+from src.serving import app as app_module
+from src.serving import load_model, models, profiling
+from src.serving.batching import DeadlineExceeded
+from src.serving.coalesce import SingleFlight
+from src.serving.metrics import COALESCED_REQUESTS
+
+
+def _concurrently(n, fn):
+    barrier = threading.Barrier(n)
+
+    def call(i):
+        barrier.wait()
+        return fn(i)
+
+    with ThreadPoolExecutor(max_workers=n) as pool:
+        return list(pool.map(call, range(n)))
+
+
+def _predict(text):
+    # header non presenti: chiamata diretta all'handler
+    return app_module.predict(
+        app_module.Item(text=text),
+        Response(),
+        x_priority=None,
+        x_deadline_ms=None,
+        x_model=None,
+    )
+
+
+def test_single_flight_shares_one_call():
+    flight = SingleFlight()
+    calls = []
+
+    def work():
+        calls.append(1)
+        time.sleep(0.2)
+        return "positive", 0.9
+
+    results = _concurrently(8, lambda i: flight.do("same", work))
+    assert len(calls) == 1
+    assert {r for r, _ in results} == {("positive", 0.9)}
+    assert sum(shared for _, shared in results) == 7
+    assert flight.inflight() == 0
+
+
+def test_single_flight_propagates_errors_and_releases_key():
+    flight = SingleFlight()
+
+    def boom():
+        time.sleep(0.1)
+        raise RuntimeError("model down")
+
+    def call(i):
+        with pytest.raises(RuntimeError, match="model down"):
+            flight.do("k", boom)
+
+    _concurrently(4, call)
+    assert flight.inflight() == 0
+    assert flight.do("k", lambda: 1) == (1, False)
+
+
+def test_predict_coalesces_equivalent_texts(monkeypatch):
+    calls = []
+
+    def slow_predict(texts, timings=None):
+        calls.extend(texts)
+        time.sleep(0.2)
+        return [("neutral", 0.5)] * len(texts)
+
+    monkeypatch.setattr(load_model, "predict_batch", slow_predict)
+    monkeypatch.setattr(app_module, "COALESCE_REQUESTS", True)
+    before = COALESCED_REQUESTS.labels(model="default")._value.get()
+
+    # stesso testo dopo normalize_text (spazi, mention)
+    texts = ["Go  @alice go", "Go @bob go ", " Go @carol go", "Go @dave go"]
+    results = _concurrently(len(texts), lambda i: _predict(texts[i]))
+    assert len(calls) == 1
+    assert all(r == {"label": "neutral", "score": 0.5} for r in results)
+    assert (
+        COALESCED_REQUESTS.labels(model="default")._value.get() - before
+        == len(texts) - 1
+    )
+
+
+def test_coalesced_followers_get_leader_stage_timings(monkeypatch):
+    def slow_predict(texts, timings=None):
+        time.sleep(0.2)
+        if timings is not None:
+            timings["inference"] = 0.2
+        return [("neutral", 0.5)] * len(texts)
+
+    monkeypatch.setattr(load_model, "predict_batch", slow_predict)
+    monkeypatch.setattr(app_module, "COALESCE_REQUESTS", True)
+    monkeypatch.setattr(profiling, "STAGE_TIMINGS_HEADER", True)
+
+    def call(i):
+        response = Response()
+        app_module.predict(
+            app_module.Item(text="same text"),
+            response,
+            x_priority=None,
+            x_deadline_ms=None,
+            x_model=None,
+        )
+        return response.headers["server-timing"]
+
+    headers = _concurrently(4, call)
+    assert all("inference;dur=" in h and "queue;dur=" in h for h in headers)
+    assert sum("coalesced" in h for h in headers) == 3
+
+
+def test_follower_does_not_inherit_leader_deadline(monkeypatch):
+    handle = models.manager.resolve(None)
+
+    def predict(text, priority, deadline, timings=None, n_tokens=None):
+        time.sleep(0.2)
+        if deadline is not None:
+            raise DeadlineExceeded("deadline exceeded in queue")
+        return "neutral", 0.5
+
+    monkeypatch.setattr(handle.scheduler, "predict", predict)
+    monkeypatch.setattr(app_module, "COALESCE_REQUESTS", True)
+
+    def call(deadline_ms):
+        response = Response()
+        body = app_module.predict(
+            app_module.Item(text="same text", deadline_ms=deadline_ms),
+            response,
+            x_priority=None,
+            x_deadline_ms=None,
+            x_model=None,
+        )
+        return response.status_code, body
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        leader = pool.submit(call, 50)
+        time.sleep(0.05)  # il follower si aggancia all'inferenza in volo
+        follower = pool.submit(call, None)
+        assert leader.result()[0] == 503
+        assert follower.result() == (200, {"label": "neutral", "score": 0.5})
+
+
+def test_predict_without_coalescing(monkeypatch):
+    calls = []
+    monkeypatch.setattr(
+        load_model,
+        "predict_batch",
+        lambda texts, timings=None: calls.extend(texts) or [("neutral", 0.5)],
+    )
+    monkeypatch.setattr(app_module, "COALESCE_REQUESTS", False)
+    _predict("hello")
+    _predict("hello")
+    assert len(calls) == 2
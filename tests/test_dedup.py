@@ -0,0 +1,114 @@
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.features.dedup import DedupIndex, dedup_file, dedup_normalize
+
+
+def _batch(path, texts, labels=None):
+    labels = labels or ["neutral"] * len(texts)
+    pd.DataFrame({"text": texts, "label": labels}).to_csv(path, index=False)
+    return str(path)
+
+
+BASE = "the new phone update drains my battery so fast, really disappointed today"
+
+
+def test_normalize_collapses_retweets_and_urls():
+    a, b, c = dedup_normalize(
+        [
+            f"{BASE} https://t.co/abc",
+            f"RT @someone: {BASE.upper()}   https://bit.ly/x?y=1 !!",
+            "something else",
+        ]
+    )
+    assert a == b and a != c
+
+
+def test_minhash_similarity_tracks_jaccard(tmp_path):
+    index = DedupIndex(str(tmp_path / "idx.sqlite"))
+    sig = index.signature(BASE)
+    near = index.signature(BASE.replace("really", "very"))
+    other = index.signature("completely unrelated sentence about football games")
+    assert (sig == index.signature(BASE)).all()
+    assert (sig == near).mean() > 0.6
+    assert (sig == other).mean() < 0.2
+    index.close()
+
+
+def test_dedup_file_weights_and_persistent_index(tmp_path):
+    index_path = str(tmp_path / "idx.sqlite")
+    texts = [
+        BASE,
+        f"RT @user1: {BASE}",
+        f"{BASE} https://t.co/1",
+        BASE.replace("today", "tonight"),  # near-duplicate
+        "great match last night, what a goal",
+        "great match last night, what a goal!!",
+        "totally different tweet about the weather",
+    ]
+    src = _batch(tmp_path / "day1.csv", texts)
+    out = str(tmp_path / "current.csv")
+    stats = dedup_file(src, out, index_path, run="day1", chunksize=3)
+    df = pd.read_csv(out)
+    assert df["text"].tolist() == [BASE, texts[4], texts[6]]
+    assert df["weight"].tolist() == [4, 2, 1]
+    assert stats["rows"] == 7 and stats["output_rows"] == 3
+    assert stats["near_duplicates"] >= 1 and stats["seen_before"] == 0
+
+    # giorno dopo: il cluster noto resta (peso del nuovo batch) o, con
+    # drop_seen, viene escluso
+    day2 = _batch(tmp_path / "day2.csv", [f"RT @x: {BASE}", "brand new topic here"] * 2)
+    stats = dedup_file(day2, out, index_path, run="day2")
+    assert pd.read_csv(out)["weight"].tolist() == [2, 2]
+    assert stats["seen_before"] == 1 and stats["index_docs"] == 4
+    dedup_file(day2, out, index_path, run="day3", drop_seen=True)
+    assert pd.read_csv(out)["text"].tolist() == []
+
+    with sqlite3.connect(index_path) as db:
+        counts = dict(db.execute("SELECT first_run, SUM(count) FROM docs GROUP BY 1"))
+    assert counts == {"day1": 7 + 2 + 2, "day2": 2 + 2}
+
+
+def test_rerun_with_same_run_id_is_idempotent(tmp_path):
+    index_path = str(tmp_path / "idx.sqlite")
+    old = _batch(tmp_path / "day1.csv", [BASE, "old topic from yesterday"])
+    dedup_file(old, str(tmp_path / "day1-out.csv"), index_path, run="day1")
+    texts = [f"RT @a: {BASE}", "fresh topic", "fresh topic!!", BASE]
+    src = _batch(tmp_path / "day2.csv", texts)
+    out = str(tmp_path / "current.csv")
+
+    def counts():
+        with sqlite3.connect(index_path) as db:
+            return db.execute("SELECT id, count, run, run_count FROM docs").fetchall()
+
+    first = dedup_file(src, out, index_path, run="day2", chunksize=2)
+    expected, after_first = pd.read_csv(out), counts()
+    assert expected["weight"].tolist() == [2, 2]
+    again = dedup_file(src, out, index_path, run="day2", chunksize=2)
+    pd.testing.assert_frame_equal(pd.read_csv(out), expected)
+    assert counts() == after_first
+    for key in ("output_rows", "seen_before", "index_docs"):
+        assert again[key] == first[key]
+    assert again["seen_before"] == 1
+
+
+def test_index_rejects_other_parameters(tmp_path):
+    DedupIndex(str(tmp_path / "idx.sqlite")).close()
+    with pytest.raises(ValueError, match="parametri diversi"):
+        DedupIndex(str(tmp_path / "idx.sqlite"), num_perm=32, bands=8)
+
+
+def test_dedup_scales_with_chunked_index(tmp_path):
+    rng = np.random.default_rng(0)
+    words = [f"w{i}" for i in range(500)]
+    uniques = [" ".join(rng.choice(words, 12)) for _ in range(800)]
+    texts = [uniques[i] for i in rng.integers(0, len(uniques), 3000)]
+    src = _batch(tmp_path / "big.csv", texts)
+    out = str(tmp_path / "out.csv")
+    stats = dedup_file(src, out, str(tmp_path / "idx.sqlite"), chunksize=500)
+    df = pd.read_csv(out)
+    assert len(df) == len(set(texts)) and df["weight"].sum() == 3000
+    assert stats["exact_duplicates"] == 3000 - len(set(texts))
@@ -0,0 +1,88 @@
+import json
+
+import mlflow
+import numpy as np
+import pandas as pd
+
+from src.models import distill
+
+_WORDS = {"love": 2, "great": 2, "hate": 0, "awful": 0}
+
+
+class KeywordTeacher:
+    """Teacher finto: parole chiave -> distribuzione, il resto neutral."""
+
+    def predict_proba(self, texts, temperature=1.0):
+        logits = np.zeros((len(texts), 3))
+        for i, text in enumerate(texts):
+            hits = [_WORDS[w] for w in text.lower().split() if w in _WORDS]
+            logits[i, hits[0] if hits else 1] = 4.0
+        z = np.exp(logits / temperature)
+        return z / z.sum(axis=1, keepdims=True)
+
+
+def _corpus(tmp_path):
+    rng = np.random.default_rng(0)
+    fillers = ["the movie", "this phone", "our trip", "the update", "today"]
+    rows = [
+        f"{rng.choice(fillers)} {w} {rng.choice(fillers)}"
+        for w in list(_WORDS) + ["is", "was"]
+        for _ in range(30)
+    ]
+    pd.DataFrame({"text": rows + rows[:10]}).to_csv(tmp_path / "a.csv", index=False)
+    pd.DataFrame({"text": ["i love it", None]}).to_json(
+        tmp_path / "b.jsonl", orient="records", lines=True
+    )
+    holdout = tmp_path / "holdout.csv"
+    pd.DataFrame(
+        {
+            "text": ["I love this", "awful service", "the phone", "great day"],
+            "label": ["positive", "negative", "neutral", "positive"],
+        }
+    ).to_csv(holdout, index=False)
+    return [str(tmp_path / "*.csv"), str(tmp_path / "*.jsonl")], str(holdout)
+
+
+def test_load_texts_dedups_and_skips_empty(tmp_path):
+    patterns, _ = _corpus(tmp_path)
+    texts = distill.load_texts(patterns)
+    assert len(texts) == len(set(texts))
+    assert "i love it" in texts
+    assert len(distill.load_texts(patterns, max_texts=5)) == 5
+
+
+def test_student_learns_soft_labels():
+    texts = ["love it", "hate it", "it is ok"] * 20
+    soft = KeywordTeacher().predict_proba(texts, temperature=2.0)
+    student = distill.StudentClassifier(distill.train_student(texts, soft))
+    out = student.predict(None, ["so much love", "hate", "whatever"])
+    assert [o["label"] for o in out] == ["positive", "negative", "neutral"]
+    assert all(0 < o["score"] <= 1 for o in out)
+
+
+def test_distill_registers_drop_in_pyfunc(tmp_path, monkeypatch):
+    mlflow.set_tracking_uri(f"file:{tmp_path / 'mlruns'}")
+    monkeypatch.setattr(distill, "get_or_create_experiment", lambda name: None)
+    patterns, holdout = _corpus(tmp_path)
+    report_path = tmp_path / "report.json"
+    try:
+        result = distill.distill(
+            patterns,
+            holdout,
+            experiment="distill_test",
+            report_path=str(report_path),
+            teacher=KeywordTeacher(),
+        )
+        report = json.loads(report_path.read_text())
+        assert report["teacher"]["accuracy"] == 1.0
+        assert report["student"]["accuracy"] >= 0.75
+        assert report["agreement"] >= 0.75
+        assert report["unlabeled_texts"] == len(distill.load_texts(patterns))
+        assert result["model_uri"] == "models:/Sentiment-student/1"
+
+        model = mlflow.pyfunc.load_model(result["model_uri"])
+        out = model.predict(["I love this", "awful"])
+        assert [o["label"] for o in out] == ["positive", "negative"]
+        assert set(out[0]) == {"label", "score"}
+    finally:
+        mlflow.set_tracking_uri(None)
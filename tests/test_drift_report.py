@@ -32,3 +32,18 @@ def test_no_drift_when_distributions_match(tmp_path):
 
     code = drift_report.main(ref, cur, out_dir=tmp_path)
     assert code == 0
+
+
+def test_run_returns_summary(tmp_path):
+    rows = [["good", "positive"], ["bad", "negative"]]
+    ref = _write(tmp_path, "ref.csv", rows)
+    cur = _write(tmp_path, "cur.csv", rows)
+
+    summary = drift_report.run(ref, cur, out_dir=tmp_path)
+    assert summary["drift_flag"] == 0
+    assert summary["class_distribution_current"] == {"positive": 0.5, "negative": 0.5}
+
+
+def test_class_distribution_keeps_unknown_labels():
+    dist = drift_report._class_distribution(["Positive", "LABEL_0", "Mixed", "mixed"])
+    assert dist == {"positive": 0.25, "negative": 0.25, "mixed": 0.5}
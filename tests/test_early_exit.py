@@ -0,0 +1,149 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+from prometheus_client import REGISTRY
+
+from src.models import early_exit
+from src.serving import load_model
+from src.utils.labels import softmax
+
+torch = pytest.importorskip("torch")
+transformers = pytest.importorskip("transformers")
+
+
+class WordTokenizer:
+    """Tokenizer finto: un id per parola, padding a destra con `pad_token_id`."""
+
+    name_or_path = "word"
+    pad_token_id = 1
+
+    def __len__(self):
+        return 50
+
+    def __call__(self, texts, return_tensors=None, **kwargs):
+        ids = [[0] + [3 + hash(w) % 40 for w in t.split()][:20] + [2] for t in texts]
+        if return_tensors is None:
+            return {"input_ids": ids}
+        width = max(len(i) for i in ids)
+        input_ids = torch.ones((len(ids), width), dtype=torch.long)
+        mask = torch.zeros((len(ids), width), dtype=torch.long)
+        for row, seq in enumerate(ids):
+            input_ids[row, : len(seq)] = torch.tensor(seq)
+            mask[row, : len(seq)] = 1
+        return {"input_ids": input_ids, "attention_mask": mask}
+
+
+@pytest.fixture(scope="module")
+def model():
+    torch.manual_seed(0)
+    config = transformers.RobertaConfig(
+        vocab_size=50,
+        hidden_size=16,
+        num_hidden_layers=4,
+        num_attention_heads=2,
+        intermediate_size=32,
+        max_position_embeddings=40,
+        num_labels=3,
+        id2label={0: "negative", 1: "neutral", 2: "positive"},
+    )
+    return transformers.RobertaForSequenceClassification(config).eval()
+
+
+TEXTS = ["good day", "a much longer text with many words in it", "bad", "ok then"]
+
+
+def _heads(model, threshold):
+    hidden = model.config.hidden_size
+    rng = np.random.default_rng(0)
+    return early_exit.ExitHeads(
+        layers=[1, 2],
+        weights=[rng.normal(size=(hidden, 3)) for _ in range(2)],
+        biases=[np.zeros(3), np.zeros(3)],
+        thresholds=[threshold, threshold],
+    )
+
+
+def test_without_exits_matches_full_forward(model):
+    enc = WordTokenizer()(TEXTS, return_tensors="pt")
+    probs, executed = early_exit.forward_probs(model, enc, _heads(model, 1.01))
+    with torch.no_grad():
+        expected = softmax(model(**enc).logits.numpy())
+    np.testing.assert_allclose(probs, expected, atol=1e-5)
+    assert executed.tolist() == [4] * len(TEXTS)
+
+
+def test_confident_examples_exit_early(model):
+    enc = WordTokenizer()(TEXTS, return_tensors="pt")
+    heads = _heads(model, 0.0)
+    probs, executed = early_exit.forward_probs(model, enc, heads)
+    assert executed.tolist() == [1] * len(TEXTS)
+    with torch.no_grad():
+        cls = model(**enc, output_hidden_states=True).hidden_states[1][:, 0].numpy()
+    np.testing.assert_allclose(
+        probs, softmax(cls @ heads.weights[0] + heads.biases[0]), atol=1e-5
+    )
+
+    # uscita solo per una parte del batch: il resto prosegue e resta esatto
+    heads.thresholds = [float(np.sort(probs.max(axis=1))[2]), 1.01]
+    mixed, executed = early_exit.forward_probs(model, enc, heads)
+    deep = executed == 4
+    assert 0 < deep.sum() < len(TEXTS)
+    with torch.no_grad():
+        full = softmax(model(**enc).logits.numpy())
+    np.testing.assert_allclose(mixed[deep], full[deep], atol=1e-5)
+
+
+def test_fit_calibrate_and_roundtrip(model, tmp_path):
+    train = pd.DataFrame({"text": [f"w{i} w{i % 7} x{i % 3}" for i in range(60)]})
+    train.to_csv(tmp_path / "train.csv", index=False)
+    with torch.no_grad():
+        enc = WordTokenizer()(train["text"].tolist()[:30], return_tensors="pt")
+        labels = np.array(["negative", "neutral", "positive"])[
+            model(**enc).logits.argmax(-1).numpy()
+        ]
+    pd.DataFrame({"text": train["text"][:30], "label": labels}).to_csv(
+        tmp_path / "holdout.csv", index=False
+    )
+
+    out = str(tmp_path / "heads.npz")
+    report = early_exit.train(
+        str(tmp_path / "train.csv"),
+        str(tmp_path / "holdout.csv"),
+        out,
+        layers=[1, 2, 3],
+        max_accuracy_drop=0.0,
+        model=model,
+        tokenizer=WordTokenizer(),
+    )
+    assert report["accuracy_full"] == 1.0
+    assert report["accuracy_delta"] == 0.0
+    assert 1 <= report["avg_layers"] <= 4
+    assert sum(report["exit_rate"].values()) == pytest.approx(1.0)
+
+    heads = early_exit.ExitHeads.load(out)
+    assert heads.layers == [1, 2, 3] and len(heads.thresholds) == 3
+    assert heads.report == report
+
+    loose = early_exit.calibrate(
+        heads, model, WordTokenizer(), train["text"][:30].tolist(), labels, 1.0
+    )
+    assert loose.thresholds[0] == early_exit._THRESHOLDS[0]
+    assert loose.report["avg_layers"] == 1.0
+
+
+def test_serving_path_uses_heads_from_env(model, tmp_path, monkeypatch):
+    path = _heads(model, 0.0).save(str(tmp_path / "heads.npz"))
+    monkeypatch.setenv("EARLY_EXIT_HEADS", path)
+    monkeypatch.setattr(
+        load_model, "_pipeline", SimpleNamespace(tokenizer=WordTokenizer(), model=model)
+    )
+    before = REGISTRY.get_sample_value("app_early_exit_layers_count") or 0
+    timings = {}
+    results = load_model.predict_pipeline_batch(TEXTS, timings)
+    assert len(results) == len(TEXTS)
+    assert {label for label, _ in results} <= {"negative", "neutral", "positive"}
+    assert set(timings) == {"tokenization", "inference", "postprocessing"}
+    assert REGISTRY.get_sample_value("app_early_exit_layers_count") == before + 4
+    assert REGISTRY.get_sample_value("app_early_exit_layers_sum") is not None
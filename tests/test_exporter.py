@@ -0,0 +1,92 @@
+import pytest
+from prometheus_client.parser import text_string_to_metric_families
+
+from src.monitoring import push_metrics
+from src.monitoring.exporter import MetricsExporter
+
+
+def _samples(body):
+    return {
+        (s.name, tuple(sorted(s.labels.items()))): s.value
+        for family in text_string_to_metric_families(body)
+        for s in family.samples
+    }
+
+
+def _exporter(gateway, tmp_path, **kwargs):
+    kwargs = {"retries": 2, "backoff": 0, "timeout": 2, **kwargs}
+    return MetricsExporter(
+        gateway, "retrain_sentiment", {"instance": "airflow"},
+        spool_dir=str(tmp_path / "spool"), **kwargs,
+    )  # fmt: skip
+
+
+def test_run_buffer_is_pushed_once(pushgateway, tmp_path):
+    def task_exporter():  # ogni task del DAG apre il proprio exporter
+        return MetricsExporter.for_run(
+            "scheduled__2025-01-01T00:00:00+00:00",
+            gateway=pushgateway.url,
+            job="retrain_sentiment",
+            grouping_key={"instance": "airflow"},
+            spool_dir=str(tmp_path / "spool"),
+        )
+
+    push_metrics.record_freshness(task_exporter(), "detected", 30)
+    push_metrics.record_drift(task_exporter(), 0)
+    push_metrics.record_drift(task_exporter(), 1)  # ultimo valore vince
+    push_metrics.record_freshness(task_exporter(), "train_start", 95)
+    assert pushgateway.pushes == []
+
+    assert task_exporter().flush()
+    [(path, body)] = pushgateway.pushes
+    assert path == "/metrics/job/retrain_sentiment/instance/airflow"
+    assert _samples(body) == {
+        ("data_drift_flag", ()): 1.0,
+        ("data_freshness_lag_seconds", (("stage", "detected"),)): 30.0,
+        ("data_freshness_lag_seconds", (("stage", "train_start"),)): 95.0,
+    }
+    assert task_exporter().samples() == []
+
+
+def test_retries_transient_errors(pushgateway, tmp_path):
+    pushgateway.fail = 2
+    exporter = _exporter(pushgateway.url, tmp_path)
+    exporter.set("data_drift_flag", 1)
+    assert exporter.flush() and len(pushgateway.pushes) == 1
+    assert exporter.pending() == 0
+
+
+def test_spools_when_unreachable_and_replays_in_order(pushgateway, tmp_path):
+    down = _exporter("http://127.0.0.1:9", tmp_path, retries=1)
+    down.set("model_f1_score", 0.7, model_version="3")
+    assert not down.flush()
+    pushgateway.fail = 10
+    late = _exporter(pushgateway.url, tmp_path, retries=1)
+    late.set("model_f1_score", 0.8, model_version="4")
+    assert not late.flush()  # il gateway risponde 503: anche questo in spool
+    assert late.pending() == 2 and pushgateway.pushes == []
+
+    pushgateway.fail = 0
+    again = _exporter(pushgateway.url, tmp_path)
+    again.set("data_drift_flag", 0)
+    assert again.flush()
+    values = [_samples(body) for _, body in pushgateway.pushes]
+    assert values == [
+        {("model_f1_score", (("model_version", "3"),)): pytest.approx(0.7)},
+        {("model_f1_score", (("model_version", "4"),)): pytest.approx(0.8)},
+        {("data_drift_flag", ()): 0.0},
+    ]
+    assert again.pending() == 0
+
+
+def test_rejected_push_is_not_spooled(tmp_path, monkeypatch):
+    import urllib.error
+    import urllib.request
+
+    def reject(request, timeout):
+        raise urllib.error.HTTPError(request.full_url, 400, "bad", {}, None)
+
+    monkeypatch.setattr(urllib.request, "urlopen", reject)
+    exporter = _exporter("gw:9091", tmp_path)
+    exporter.set("data_drift_flag", 1)
+    assert exporter.flush() and exporter.pending() == 0
@@ -0,0 +1,62 @@
+"""Budget di startup per gli entry point (`python -X importtime`).
+
+Ogni entry point ha un tempo massimo di import (cumulativo, misurato in un
+interprete nuovo) e una lista di dipendenze pesanti che non deve importare.
+I budget sono larghi per non essere fragili in CI; `IMPORT_BUDGET_SCALE`
+permette di allargarli ulteriormente su macchine lente.
+"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+SCALE = float(os.getenv("IMPORT_BUDGET_SCALE", "1.0"))
+HEAVY = ("mlflow", "transformers", "torch")
+
+# entry point -> (budget in secondi, moduli top-level vietati)
+BUDGETS = {
+    "src.serving.app": (3.0, HEAVY),
+    "src.monitoring.drift_report": (3.0, HEAVY),
+    "src.monitoring.push_metrics": (1.0, HEAVY + ("pandas",)),
+    "src.monitoring.push_model_metrics": (1.0, HEAVY + ("pandas",)),
+    "src.features.preprocess": (0.2, ("numpy", "pandas")),
+    "src.features.dedup": (2.0, HEAVY),
+    "src.monitoring.incoming": (0.5, HEAVY + ("pandas", "numpy")),
+    "src.utils.labels": (0.5, HEAVY + ("pandas",)),
+}
+
+
+def _importtime(module: str) -> dict[str, int]:
+    """Ritorna {modulo: tempo cumulativo in µs} per `import module`."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        env=dict(os.environ, PYTHONPATH=ROOT),
+    )
+    assert proc.returncode == 0, proc.stderr[-2000:]
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+@pytest.mark.parametrize("module", sorted(BUDGETS))
+def test_import_budget(module):
+    budget, forbidden = BUDGETS[module]
+    times = _importtime(module)
+
+    loaded = sorted(m for m in forbidden if m in times)
+    assert not loaded, f"{module} importa dipendenze pesanti: {loaded}"
+
+    seconds = times[module] / 1e6
+    assert (
+        seconds <= budget * SCALE
+    ), f"{module}: import in {seconds:.2f}s (budget {budget * SCALE:.2f}s)"
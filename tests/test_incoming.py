@@ -0,0 +1,66 @@
+import os
+
+import pytest
+
+from src.monitoring import push_metrics
+from src.monitoring.exporter import MetricsExporter
+from src.monitoring.incoming import IncomingWatch, freshness_lag
+
+NOW = 1_700_000_000.0
+
+
+def _drop(directory, name, age):
+    path = directory / name
+    path.write_text("text,label\nhello,neutral\n")
+    os.utime(path, (NOW - age, NOW - age))
+    return str(path)
+
+
+def test_debounce_waits_for_quiet_burst(tmp_path):
+    incoming = tmp_path / "incoming"
+    incoming.mkdir()
+    watch = IncomingWatch(str(incoming), str(tmp_path / "state.json"))
+    assert watch.ready(now=NOW) is None
+
+    _drop(incoming, "a.csv", age=200)
+    _drop(incoming, "b.csv", age=30)  # raffica ancora in corso
+    assert watch.ready(quiet_seconds=60, max_wait_seconds=900, now=NOW) is None
+
+    batch = watch.ready(quiet_seconds=60, max_wait_seconds=900, now=NOW + 40)
+    assert [os.path.basename(p) for p in batch["files"]] == ["a.csv", "b.csv"]
+    assert batch["lag_seconds"] == pytest.approx(240)
+
+    # una raffica continua non rimanda il batch oltre max_wait
+    assert watch.ready(quiet_seconds=60, max_wait_seconds=150, now=NOW) is not None
+
+
+def test_mark_processed_leaves_only_the_delta(tmp_path):
+    incoming = tmp_path / "incoming"
+    incoming.mkdir()
+    watch = IncomingWatch(str(incoming), str(tmp_path / "state" / "ingest.json"))
+    _drop(incoming, "a.csv", age=500)
+    batch = watch.ready(quiet_seconds=60, now=NOW)
+    watch.mark_processed(batch["files"], batch["mtimes"])
+    assert watch.ready(quiet_seconds=60, now=NOW) is None
+
+    _drop(incoming, "c.csv", age=300)
+    _drop(incoming, "a.csv", age=100)  # riscritto: di nuovo in attesa
+    assert [os.path.basename(f["path"]) for f in watch.pending()] == ["c.csv", "a.csv"]
+
+    os.remove(incoming / "a.csv")
+    batch = watch.ready(quiet_seconds=60, now=NOW)
+    watch.mark_processed(batch["files"], batch["mtimes"])
+    assert list(watch._state()) == [str(incoming / "c.csv")]
+
+
+def test_push_freshness(pushgateway, tmp_path):
+    lag = freshness_lag(NOW - 90, now=NOW)
+    exporter = MetricsExporter(
+        pushgateway.url, "retrain_sentiment", {"instance": "airflow"},
+        spool_dir=str(tmp_path / "spool"),
+    )  # fmt: skip
+    push_metrics.record_freshness(exporter, "detected", lag)
+    assert exporter.flush()
+    [(path, body)] = pushgateway.pushes
+    assert path == "/metrics/job/retrain_sentiment/instance/airflow"
+    assert 'data_freshness_lag_seconds{stage="detected"} 90.0' in body
@@ -0,0 +1,93 @@
+import pytest
+from fastapi import WebSocketDisconnect
+from fastapi.testclient import TestClient
+
+from src.serving import internal_api, load_model
+from src.serving.app import app
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    batches = []
+
+    def predict_batch(texts, timings=None):
+        batches.append(list(texts))
+        return [("negative" if "bad" in t else "positive", 0.9) for t in texts]
+
+    monkeypatch.setattr(load_model, "predict_batch", predict_batch)
+    return batches
+
+
+def test_batch_endpoint(fake_model):
+    r = client.post("/v1/predict/batch", json={"texts": ["good", "bad", "fine"]})
+    assert r.status_code == 200
+    assert [p["label"] for p in r.json()["predictions"]] == [
+        "positive",
+        "negative",
+        "positive",
+    ]
+    # un'unica chiamata al modello per tutta la richiesta
+    assert fake_model == [["good", "bad", "fine"]]
+
+    r = client.post("/v1/predict/batch", json=["good"])
+    assert r.json() == {"predictions": [{"label": "positive", "score": 0.9}]}
+
+
+def test_batch_endpoint_errors(fake_model):
+    assert client.post("/v1/predict/batch", content=b"{not json").status_code == 400
+    assert client.post("/v1/predict/batch", json={"texts": [1, 2]}).status_code == 422
+    r = client.post("/v1/predict/batch", json={"texts": ["a"], "priority": "urgent"})
+    assert r.status_code == 400
+    r = client.post("/v1/predict/batch", json={"texts": ["a", "b"], "deadline_ms": 0})
+    assert all("deadline" in p["error"] for p in r.json()["predictions"])
+    r = client.post("/v1/predict/batch", json={"texts": ["a"], "deadline_ms": "soon"})
+    assert r.status_code == 400 and "deadline_ms" in r.json()["error"]
+    r = client.post(
+        "/v1/predict/batch", json={"texts": ["a"]}, headers={"X-Deadline-Ms": "x"}
+    )
+    assert r.status_code == 400
+    r = client.post("/v1/predict/batch", json={"texts": ["a"], "model": 3})
+    assert r.status_code == 422 and "model" in r.json()["error"]
+    assert fake_model == []
+
+
+def test_stream_endpoint(fake_model):
+    with client.websocket_connect("/v1/predict/stream") as ws:
+        ws.send_json({"id": 1, "text": "good"})
+        assert ws.receive_json() == {"id": 1, "label": "positive", "score": 0.9}
+        ws.send_bytes(b'{"id": "b", "texts": ["bad", "good"]}')
+        reply = ws.receive_bytes()
+        assert b'"id":"b"' in reply and reply.count(b'"label"') == 2
+        ws.send_text("nope")
+        assert ws.receive_json() == {"id": None, "error": "invalid JSON message"}
+        ws.send_json({"id": 2, "text": "late", "deadline_ms": 0})
+        assert "deadline" in ws.receive_json()["error"]
+        # deadline non numerica: errore sul singolo messaggio, lo stream resta aperto
+        ws.send_json({"id": 3, "text": "good", "deadline_ms": "soon"})
+        assert ws.receive_json() == {"id": 3, "error": "deadline_ms must be a number"}
+        ws.send_json({"id": 4, "text": "good"})
+        assert ws.receive_json()["label"] == "positive"
+
+
+def test_text_limit_per_request_and_message(fake_model, monkeypatch):
+    monkeypatch.setattr(internal_api, "MAX_BATCH_TEXTS", 3)
+    r = client.post("/v1/predict/batch", json={"texts": ["good"] * 4})
+    assert r.status_code == 413 and "at most 3" in r.json()["error"]
+    assert client.post("/v1/predict/batch", json=["good"] * 3).status_code == 200
+    with client.websocket_connect("/v1/predict/stream") as ws:
+        ws.send_json({"id": 1, "texts": ["good"] * 4})
+        assert ws.receive_json() == {"id": 1, "error": "at most 3 texts per message"}
+        ws.send_json({"id": 2, "texts": ["good"] * 3})
+        assert len(ws.receive_json()["predictions"]) == 3
+    assert fake_model == [["good"] * 3, ["good"] * 3]
+
+
+def test_stream_rejects_invalid_deadline_header(fake_model):
+    with client.websocket_connect(
+        "/v1/predict/stream", headers={"X-Deadline-Ms": "later"}
+    ) as ws:
+        with pytest.raises(WebSocketDisconnect) as exc:
+            ws.receive_json()
+    assert exc.value.code == 1008
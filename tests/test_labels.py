@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from src.utils import labels
+
+
+def test_encode_labels_aliases_and_unknown():
+    codes = labels.encode_labels(
+        ["Positive", " negative ", "LABEL_1", "label_2", "mixed", "nan"]
+    )
+    assert codes.dtype == np.int8
+    assert codes.tolist() == [2, 0, 1, 2, labels.UNKNOWN, labels.UNKNOWN]
+
+
+def test_encode_labels_integer_ids():
+    codes = labels.encode_labels(np.array([0, 2, 1, 5, -3]))
+    assert codes.tolist() == [0, 2, 1, labels.UNKNOWN, labels.UNKNOWN]
+
+
+def test_encode_labels_empty():
+    assert labels.encode_labels([]).shape == (0,)
+
+
+def test_from_logits_matches_softmax_argmax():
+    logits = np.array([[2.0, 0.0, -1.0], [0.1, 0.2, 3.0], [0.0, 0.0, 0.0]])
+    codes, scores = labels.from_logits(logits)
+    assert codes.tolist() == [0, 2, 0]
+    assert labels.decode_labels(codes).tolist() == ["negative", "positive", "negative"]
+    probs = labels.softmax(logits)
+    np.testing.assert_allclose(probs.sum(axis=1), 1.0)
+    np.testing.assert_allclose(scores, probs.max(axis=1))
+    assert scores[2] == pytest.approx(1 / 3)
+
+
+def test_labels_from_outputs_dicts_and_arrays():
+    dicts = [{"label": "LABEL_0", "score": 0.9}, {"label": "positive", "score": 0.8}]
+    assert labels.labels_from_outputs(dicts).tolist() == [0, 2]
+    arr = np.array(["neutral", "negative"])
+    assert labels.labels_from_outputs(arr).tolist() == [1, 0]
+
+
+def test_class_distribution_counts_over_all_rows():
+    codes = np.array([0, 0, 2, labels.UNKNOWN], dtype=np.int8)
+    assert labels.class_counts(codes).tolist() == [2, 0, 1]
+    assert labels.class_distribution(codes) == {"negative": 0.5, "positive": 0.25}
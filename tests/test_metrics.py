@@ -0,0 +1,60 @@
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+
+from src.serving import metrics
+from src.serving.app import app
+
+client = TestClient(app)
+
+
+def _value(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_predict_updates_app_and_stage_metrics():
+    before = _value("app_requests_total", model="default")
+    stage_before = _value(
+        "app_inference_stage_seconds_count", model="default", stage="inference"
+    )
+    r = client.post("/predict", json={"text": "I love this!"})
+    assert r.status_code == 200
+    assert _value("app_requests_total", model="default") == before + 1
+    assert (
+        _value("app_inference_stage_seconds_count", model="default", stage="inference")
+        > stage_before
+    )
+
+
+def test_middleware_labels_route_templates_and_unmatched():
+    before = _value("api_requests_total", path="/health", method="GET")
+    client.get("/health")
+    assert _value("api_requests_total", path="/health", method="GET") == before + 1
+
+    client.get("/wp-admin/setup.php")
+    assert (
+        _value(
+            "api_responses_total",
+            path=metrics.UNMATCHED_PATH,
+            method="GET",
+            status="404",
+        )
+        >= 1
+    )
+
+
+def test_metrics_endpoint_exposes_instrumentation():
+    client.post("/predict", json={"text": "ok"})
+    body = client.get("/metrics").text
+    for name in (
+        "app_requests_total",
+        "app_inference_stage_seconds",
+        "api_request_latency_seconds",
+        "data_drift_flag",
+    ):
+        assert name in body
+
+
+def test_collect_registry_multiprocess(monkeypatch, tmp_path):
+    assert metrics.collect_registry() is REGISTRY
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+    assert metrics.collect_registry() is not REGISTRY
@@ -0,0 +1,100 @@
+import mlflow
+import pytest
+from mlflow.exceptions import MlflowException
+
+from src.utils import mlflow_utils
+from src.utils.mlflow_utils import RegistryClient
+
+
+@pytest.fixture
+def store(tmp_path):
+    uri = f"file:{tmp_path / 'mlruns'}"
+    mlflow.set_tracking_uri(uri)
+    client = mlflow.tracking.MlflowClient(uri)
+    client.create_registered_model("Sentiment")
+    for _ in range(12):
+        client.create_model_version("Sentiment", source=str(tmp_path / "model"))
+    yield uri
+    mlflow.set_tracking_uri(None)
+
+
+def test_latest_version_is_cached_until_ttl(store, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(mlflow_utils.time, "monotonic", lambda: clock[0])
+    reg = RegistryClient(store, ttl=30)
+    assert int(reg.latest_version("Sentiment").version) == 12
+    assert int(reg.latest_version("Sentiment").version) == 12
+    assert reg.requests == 1
+
+    reg.client.create_model_version("Sentiment", source="elsewhere")
+    assert int(reg.latest_version("Sentiment").version) == 12  # ancora in cache
+    clock[0] += 31
+    assert int(reg.latest_version("Sentiment").version) == 13
+    assert reg.latest_version("Missing") is None and reg.requests == 3
+
+
+def test_transition_invalidates_stage_lookup(store):
+    assert mlflow_utils.get_production_model_uri("Sentiment") is None
+    mlflow_utils.promote_to_stage("Sentiment", 7)
+    reg = mlflow_utils.registry()
+    assert reg is mlflow_utils.registry()  # un solo client per tracking URI
+    assert int(reg.stage_version("Sentiment").version) == 7
+    assert mlflow_utils.get_production_model_uri("Sentiment") == (
+        "models:/Sentiment/Production"
+    )
+    assert mlflow_utils.latest_version_uri("Sentiment") == "models:/Sentiment/12"
+
+
+def test_latest_falls_back_to_paged_scan(store, monkeypatch):
+    reg = RegistryClient(store, ttl=0)
+    search = reg.client.search_model_versions
+    pages = []
+
+    def no_order_by(query, max_results=None, order_by=None, page_token=None):
+        if order_by:
+            raise MlflowException("order_by non supportato")
+        page = search(query, max_results=5, page_token=page_token)
+        pages.append(len(page))
+        return page
+
+    monkeypatch.setattr(reg.client, "search_model_versions", no_order_by)
+    assert int(reg.latest_version("Sentiment").version) == 12
+    assert pages == [5, 5, 2]
+
+
+def test_candidate_version_never_crosses_model_names(store, tmp_path):
+    from src.models.evaluate import _registered_version
+
+    client = mlflow_utils.registry().client
+    client.create_registered_model("Sentiment-dev")
+    client.create_model_version("Sentiment-dev", source=str(tmp_path / "dev"))
+    run_id = client.create_run(client.create_experiment("runs")).info.run_id
+    client.create_model_version(
+        "Sentiment", source=f"{tmp_path}/{run_id}/artifacts/model", run_id=run_id
+    )  # versione 13, registrata dal run
+
+    assert _registered_version("models:/Sentiment/4") == 4
+    assert _registered_version("models:/Sentiment-dev/1") is None
+    assert _registered_version(f"runs:/{run_id}/model") == 13
+    assert _registered_version("runs:/unregistered/model") is None
+    assert _registered_version(str(tmp_path / "model")) is None
+    assert _registered_version("models:/Sentiment/latest") == 13
+
+
+def test_registration_invalidates_cached_latest(store, tmp_path):
+    import pandas as pd
+
+    from src.models import train_smoke
+
+    train_csv = tmp_path / "train.csv"
+    pd.DataFrame(
+        {
+            "text": ["good", "bad", "fine", "awful"],
+            "label": ["positive", "negative"] * 2,
+        }
+    ).to_csv(train_csv, index=False)
+    reg = mlflow_utils.registry()
+    assert int(reg.latest_version("Sentiment").version) == 12  # ora in cache
+    result = train_smoke.train("smoke", str(train_csv), n_samples=0, dev_suffix="")
+    assert int(result["version"]) == 13
+    assert int(reg.latest_version("Sentiment").version) == 13
@@ -0,0 +1,210 @@
+import pytest
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+
+from src.serving import models
+from src.serving.app import app
+from src.serving.models import ModelManager, parse_models
+
+client = TestClient(app)
+MB = 2**20
+
+
+class _FakeRegistry:
+    """Loader finto: ogni modello "occupa" `sizes[uri]` MB di memoria simulata."""
+
+    def __init__(self, sizes):
+        self.sizes = sizes
+        self.rss = 0
+        self.loads = []
+
+    def memory(self):
+        return self.rss
+
+    def load(self, uri):
+        self.loads.append(uri)
+        self.rss += self.sizes.get(uri, 10) * MB
+        label = "negative" if "dev" in uri else "positive"
+        return lambda texts, timings=None: [(label, 0.8)] * len(texts)
+
+
+def _manager(registry, budget_mb=0):
+    return ModelManager(
+        parse_models(
+            "prod=models:/Sentiment/Production, dev=models:/Sentiment-dev/latest,"
+            "cand=models:/Sentiment/Staging"
+        ),
+        budget_mb=budget_mb,
+        loader=registry.load,
+        memory=registry.memory,
+    )
+
+
+def _use(manager, key):
+    handle = manager.resolve(key)
+    try:
+        with manager.acquire(handle):
+            return handle.scheduler.predict("text")
+    finally:
+        manager.release(handle)
+
+
+def test_parse_models():
+    assert parse_models(" a=models:/X/1 ,b=runs:/r/model,,bad") == {
+        "a": "models:/X/1",
+        "b": "runs:/r/model",
+    }
+
+
+def test_resolve_aliases_and_versions():
+    manager = _manager(_FakeRegistry({}))
+    assert manager.resolve(None).name == "default"
+    assert manager.resolve("dev").uri == "models:/Sentiment-dev/latest"
+    assert manager.resolve("Sentiment/12").uri == "models:/Sentiment/12"
+    for key in (
+        "nope",
+        "Other/1",
+        "Sentiment",
+        "Sentiment/junk",
+        "Sentiment/1 OR",
+        3,
+        ["Sentiment/1"],
+    ):
+        with pytest.raises(KeyError):
+            manager.resolve(key)
+
+
+def test_adhoc_versions_are_capped_and_forgotten():
+    registry = _FakeRegistry({})
+
+    def load(uri):
+        if uri.endswith("/999"):
+            raise OSError("version not found")
+        return registry.load(uri)
+
+    manager = ModelManager(
+        parse_models("prod=models:/Sentiment/Production"),
+        loader=load,
+        memory=registry.memory,
+        max_adhoc=2,
+    )
+
+    def series(model):
+        return REGISTRY.get_sample_value("app_requests_total", {"model": model})
+
+    for version in (1, 2, 3):
+        handle = manager.resolve(f"Sentiment/{version}")
+        with manager.acquire(handle):
+            handle.scheduler.predict("text")
+        handle.scheduler.metrics.prediction("positive")
+        manager.release(handle)
+    names = {s["model"] for s in manager.status()}
+    assert names == {"default", "prod", "Sentiment/2", "Sentiment/3"}
+    assert series("Sentiment/1") is None and series("Sentiment/3") == 1
+
+    bad = manager.resolve("Sentiment/999")
+    with pytest.raises(OSError):
+        with manager.acquire(bad):
+            pass
+    # ha preso il posto LRU di Sentiment/2, poi è stato scartato anche lui
+    names = {s["model"] for s in manager.status()}
+    assert names == {"default", "prod", "Sentiment/3"}
+    assert series("Sentiment/999") is None
+
+
+def test_resolved_adhoc_handle_is_not_dropped_before_use():
+    import threading
+
+    registry = _FakeRegistry({})
+    manager = ModelManager(
+        parse_models("prod=models:/Sentiment/Production"),
+        loader=registry.load,
+        memory=registry.memory,
+        max_adhoc=1,
+    )
+    first = manager.resolve("Sentiment/1")  # risolto, non ancora acquisito
+    errors = []
+
+    def other():
+        try:
+            manager.resolve("Sentiment/2")
+        except KeyError as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=other)
+    thread.start()
+    thread.join(5)
+    assert errors  # nessuno slot libero: Sentiment/1 è in uso
+    with manager.acquire(first):
+        assert first.scheduler.predict("text") == ("positive", 0.8)
+    manager.release(first)
+    assert {s["model"] for s in manager.status()} == {
+        "default",
+        "prod",
+        "Sentiment/1",
+    }
+
+    # rilasciato: ora la seconda versione prende il suo posto
+    second = manager.resolve("Sentiment/2")
+    manager.release(second)
+    assert "Sentiment/1" not in {s["model"] for s in manager.status()}
+    with pytest.raises(KeyError):  # handle scartato: niente load orfano
+        with manager.acquire(first):
+            pass
+    assert registry.loads == ["models:/Sentiment/1"]
+
+
+def test_lazy_load_and_lru_eviction():
+    registry = _FakeRegistry(
+        {
+            "models:/Sentiment/Production": 40,
+            "models:/Sentiment-dev/latest": 30,
+            "models:/Sentiment/Staging": 40,
+        }
+    )
+    manager = _manager(registry, budget_mb=90)
+    assert registry.loads == []
+    assert _use(manager, "prod") == ("positive", 0.8)
+    assert _use(manager, "dev") == ("negative", 0.8)
+    _use(manager, "prod")  # prod ora è il più recente
+    _use(manager, "cand")  # 40 + 30 + 40 > 90: esce dev (LRU)
+    loaded = {s["model"] for s in manager.status() if s["loaded"]}
+    assert loaded == {"default", "prod", "cand"}
+
+    _use(manager, "dev")  # ricaricato, esce prod (ora il meno recente)
+    assert registry.loads.count("models:/Sentiment-dev/latest") == 2
+    loaded = {s["model"] for s in manager.status() if s["loaded"]}
+    assert loaded == {"default", "cand", "dev"}
+
+
+def test_models_in_use_are_not_evicted():
+    registry = _FakeRegistry({})
+    manager = _manager(registry, budget_mb=15)
+    prod = manager.resolve("prod")
+    with manager.acquire(prod):
+        _use(manager, "dev")
+        assert prod.loaded
+    _use(manager, "cand")
+    assert not prod.loaded
+
+
+def test_predict_routes_by_model_with_labelled_metrics(monkeypatch):
+    manager = _manager(_FakeRegistry({}))
+    monkeypatch.setattr(models, "manager", manager)
+
+    def requests_for(model):
+        return REGISTRY.get_sample_value("app_requests_total", {"model": model}) or 0
+
+    before = requests_for("dev")
+    r = client.post("/predict", json={"text": "hi", "model": "dev"})
+    assert r.json()["label"] == "negative"
+    r = client.post("/predict", json={"text": "hi"}, headers={"X-Model": "prod"})
+    assert r.json()["label"] == "positive"
+    assert requests_for("dev") == before + 1
+
+    assert client.post("/predict", json={"text": "hi", "model": "x"}).status_code == 404
+    r = client.post("/v1/predict/batch", json={"texts": ["a", "b"], "model": "dev"})
+    assert [p["label"] for p in r.json()["predictions"]] == ["negative"] * 2
+
+    status = client.get("/admin/models").json()["models"]
+    assert {s["model"] for s in status if s["loaded"]} == {"default", "dev", "prod"}
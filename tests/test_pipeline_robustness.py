@@ -26,3 +26,25 @@ def test_predict_fn_handles_shapes(monkeypatch, fake_pipe, expected):
     label, score = load_model.predict_fn("text")
     assert label == expected
     assert isinstance(score, float) and 0.0 <= score <= 1.0
+
+
+def test_predict_fn_records_stage_timings(monkeypatch):
+    torch = pytest.importorskip("torch")
+    from types import SimpleNamespace
+
+    class _FakeHFPipe:
+        def __init__(self):
+            self.tokenizer = lambda text, **kw: {"input_ids": torch.zeros((1, 3))}
+            self.model = _FakeModel()
+
+    class _FakeModel:
+        config = SimpleNamespace(id2label={0: "negative", 1: "neutral", 2: "positive"})
+
+        def __call__(self, input_ids):
+            return SimpleNamespace(logits=torch.tensor([[0.0, 4.0, 0.0]]))
+
+    monkeypatch.setattr(load_model, "get_pipeline", lambda: _FakeHFPipe())
+    timings = {}
+    label, score = load_model.predict_fn("text", timings=timings)
+    assert label == "neutral" and score > 0.9
+    assert set(timings) == {"tokenization", "inference", "postprocessing"}
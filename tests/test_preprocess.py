@@ -1,4 +1,6 @@
-from src.features.preprocess import normalize_text
+import pytest
+
+from src.features.preprocess import normalize_text, normalize_texts
 
 
 def test_normalize_text_basic():
@@ -7,3 +9,75 @@ def test_normalize_text_basic():
     assert "<USER>" in out
     assert "<URL>" in out
     assert "#" not in out
+
+
+# frammenti scelti per stressare le interazioni tra i pattern (URL dentro
+# mention/hashtag, hashtag prima di URL, spazi unicode, ...)
+_PIECES = [
+    "@user",
+    "@",
+    "#",
+    "#tag",
+    "#é",
+    "https://",
+    "http://x.y/z",
+    "https://a",
+    "http",
+    "://",
+    "a",
+    "B",
+    "_",
+    "9",
+    "é",
+    "日本",
+    " ",
+    "  ",
+    "\t",
+    "\n",
+    " ",
+    " ",
+    "<",
+    ">",
+    ".",
+    "!",
+    "😀",
+    "@a_b",
+    "#a_b",
+]
+
+
+def _random_texts(n, seed=0):
+    import random
+
+    rnd = random.Random(seed)
+    return ["".join(rnd.choices(_PIECES, k=rnd.randint(0, 12))) for _ in range(n)]
+
+
+def test_normalize_texts_matches_normalize_text_property():
+    texts = _random_texts(5000)
+    expected = [normalize_text(t) for t in texts]
+    assert normalize_texts(texts) == expected
+
+
+def test_normalize_texts_pandas_and_arrow_inputs():
+    pd = pytest.importorskip("pandas")
+    texts = _random_texts(300, seed=1)
+    s = pd.Series(texts + [None] + texts[:50], index=range(10, 361), name="text")
+    out = normalize_texts(s)
+    assert list(out.index) == list(s.index) and out.name == "text"
+    assert out.iloc[len(texts)] is None
+    assert [t for t in out if t is not None] == [
+        normalize_text(t) for t in texts + texts[:50]
+    ]
+
+    pa = pytest.importorskip("pyarrow")
+    arr = normalize_texts(pa.array(texts[:20] + [None]))
+    assert arr.to_pylist() == [normalize_text(t) for t in texts[:20]] + [None]
+
+
+def test_normalize_texts_process_pool(monkeypatch):
+    from src.features import preprocess
+
+    monkeypatch.setattr(preprocess, "PARALLEL_MIN_ITEMS", 10)
+    texts = _random_texts(200, seed=2)
+    assert normalize_texts(texts, n_jobs=2) == [normalize_text(t) for t in texts]
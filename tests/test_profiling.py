@@ -0,0 +1,62 @@
+import time
+
+from fastapi.testclient import TestClient
+
+from src.serving import load_model, profiling
+from src.serving.app import app
+
+client = TestClient(app)
+
+
+def _busy_wait(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def test_sampler_aggregates_stacks():
+    sampler = profiling.StackSampler(interval=0.001)
+    with sampler.track():
+        _busy_wait(0.1)
+    collapsed = sampler.collapsed()
+    assert "_busy_wait" in collapsed
+    stack, count = collapsed.splitlines()[0].rsplit(" ", 1)
+    assert int(count) > 0 and ";" in stack
+
+    doc = sampler.speedscope()
+    frames = doc["shared"]["frames"]
+    prof = doc["profiles"][0]
+    assert prof["type"] == "sampled"
+    assert len(prof["samples"]) == len(prof["weights"])
+    assert all(0 <= i < len(frames) for s in prof["samples"] for i in s)
+
+    sampler.reset()
+    assert sampler.collapsed() == ""
+
+
+def test_admin_profile_disabled_by_default(monkeypatch):
+    monkeypatch.setattr(profiling, "profiler", profiling.RequestProfiler(0.0, 1.0))
+    assert client.get("/admin/profile").status_code == 404
+
+
+def test_predict_sampled_and_server_timing_header(monkeypatch):
+    prof = profiling.RequestProfiler(1.0, 1.0)
+    monkeypatch.setattr(profiling, "profiler", prof)
+    monkeypatch.setattr(profiling, "STAGE_TIMINGS_HEADER", True)
+
+    class _SlowPipe:
+        def __call__(self, *args, **kwargs):
+            _busy_wait(0.05)
+            return [{"label": "LABEL_2", "score": 0.9}]
+
+    monkeypatch.setattr(load_model, "get_pipeline", lambda: _SlowPipe())
+    r = client.post("/predict", json={"text": "hello"})
+    assert r.status_code == 200
+    assert "inference;dur=" in r.headers["server-timing"]
+    assert prof.sampled_requests == 1
+
+    body = client.get("/admin/profile").text
+    assert "_busy_wait" in body
+    doc = client.get("/admin/profile", params={"format": "speedscope"}).json()
+    assert doc["profiles"][0]["endValue"] > 0
+    assert client.delete("/admin/profile").json() == {"status": "reset"}
@@ -0,0 +1,64 @@
+import os
+
+from src.serving import runtime
+
+
+def test_plan_topology_avoids_oversubscription(monkeypatch):
+    for name in ("SERVING_WORKERS", "TORCH_NUM_THREADS", "TORCH_INTEROP_THREADS"):
+        monkeypatch.delenv(name, raising=False)
+    topo = runtime.plan_topology(cpus=16)
+    assert topo.workers * topo.intra_op_threads <= 16
+    assert topo.intra_op_threads == runtime.MAX_THREADS_PER_WORKER
+    assert topo.tokenizers_parallelism is False
+
+    single = runtime.plan_topology(cpus=2)
+    assert (single.workers, single.intra_op_threads) == (1, 2)
+    assert single.tokenizers_parallelism is True
+
+
+def test_plan_topology_env_overrides(monkeypatch):
+    monkeypatch.setenv("SERVING_WORKERS", "3")
+    monkeypatch.setenv("TORCH_INTEROP_THREADS", "2")
+    topo = runtime.plan_topology(cpus=12)
+    assert (topo.workers, topo.intra_op_threads, topo.inter_op_threads) == (3, 4, 2)
+
+
+def test_cgroup_quota_limits_cpus(monkeypatch, tmp_path):
+    cpu_max = tmp_path / "cpu.max"
+    cpu_max.write_text("250000 100000\n")
+    monkeypatch.setattr(runtime, "_CGROUP_V2", str(cpu_max))
+    monkeypatch.setattr(runtime, "affinity_cpus", lambda: list(range(64)))
+    assert runtime.cgroup_cpu_quota() == 2.5
+    assert runtime.available_cpus() == 2
+
+    cpu_max.write_text("max 100000\n")
+    assert runtime.available_cpus() == 64
+
+
+def test_candidate_splits_cover_all_cpus():
+    splits = runtime.candidate_splits(cpus=4)
+    assert (1, 4) in splits and (2, 2) in splits and (4, 1) in splits
+    assert all(w * t == 4 for w, t in splits)
+    assert runtime.candidate_splits(cpus=8) == [(1, 8), (2, 4), (4, 2), (8, 1)]
+    assert runtime.candidate_splits(cpus=7) == [(1, 7), (7, 1)]
+
+
+def test_claim_worker_slot_is_unique_and_recovers_dead(tmp_path):
+    assert runtime.claim_worker_slot(2, str(tmp_path)) == 0
+    assert runtime.claim_worker_slot(2, str(tmp_path)) == 1
+    assert runtime.claim_worker_slot(2, str(tmp_path)) is None
+    # slot 0 di un pid inesistente: viene riassegnato
+    (tmp_path / "slot-0").write_text("999999999")
+    assert runtime.claim_worker_slot(2, str(tmp_path)) == 0
+
+
+def test_apply_env_keeps_explicit_values(monkeypatch):
+    monkeypatch.setenv("OMP_NUM_THREADS", "7")
+    # setenv + delenv: il valore originale viene ripristinato a fine test
+    for name in ("MKL_NUM_THREADS", "TOKENIZERS_PARALLELISM"):
+        monkeypatch.setenv(name, "")
+        monkeypatch.delenv(name)
+    topo = runtime.plan_topology(cpus=4, workers=2)
+    runtime.apply_env(topo)
+    assert os.environ["OMP_NUM_THREADS"] == "7"
+    assert os.environ["MKL_NUM_THREADS"] == "2"
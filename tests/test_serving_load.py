@@ -0,0 +1,33 @@
+import json
+import os
+
+from benchmarks import serving_load
+
+
+def test_summarize_percentiles():
+    out = serving_load.summarize([0.001 * i for i in range(1, 101)], 2.0, errors=1)
+    assert out["requests"] == 100 and out["errors"] == 1
+    assert out["p50_ms"] < out["p95_ms"] < out["p99_ms"] <= 100
+    assert out["throughput_rps"] == 50
+
+
+def test_asgi_run_writes_report(tmp_path, monkeypatch):
+    monkeypatch.delenv("HF_HUB_OFFLINE", raising=False)
+    out = tmp_path / "bench.json"
+    report = serving_load.main(
+        ["--concurrency", "1,4", "--requests", "20", "--warmup", "2", "--out", str(out)]
+    )
+    assert "HF_HUB_OFFLINE" not in os.environ  # non resta impostata dopo main()
+    assert [r["concurrency"] for r in report["runs"]] == [1, 4]
+    assert all(r["errors"] == 0 and r["requests"] == 20 for r in report["runs"])
+    assert json.loads(out.read_text())["runs"][0]["p99_ms"] >= 0
+
+
+def test_protocol_overhead_runs_every_interface():
+    from benchmarks import protocol_overhead
+
+    report = protocol_overhead.main(["--texts", "40", "--batch-sizes", "1,8"])
+    interfaces = [r["interface"] for r in report["runs"]]
+    assert interfaces.count("orjson /v1/predict/batch") == 2
+    assert interfaces.count("ws /v1/predict/stream") == 2
+    assert all(r["texts_per_s"] > 0 for r in report["runs"])
@@ -0,0 +1,106 @@
+import threading
+import time
+
+import pytest
+
+from src.models.evaluate import _shadow_gate
+from src.monitoring.shadow_report import ShadowStats, read_reports, write_report
+from src.serving.metrics import SHADOW_DROPPED
+from src.serving.shadow import ShadowComparator
+
+
+def _wait(cond, timeout=5):
+    end = time.time() + timeout
+    while not cond():
+        assert time.time() < end
+        time.sleep(0.01)
+
+
+def test_stats_summary_and_merge(tmp_path):
+    a = ShadowStats(candidate_uri="models:/Sentiment/7")
+    a.add(("positive", 0.9), ("positive", 0.8), 0.010, 0.020)
+    a.add(("negative", 0.7), ("neutral", 0.6), 0.010, 0.020)
+    b = ShadowStats(candidate_uri="models:/Sentiment/7")
+    b.add(("positive", 0.9), ("positive", 0.7), 0.010, 0.010)
+    other = ShadowStats(candidate_uri="models:/Sentiment/6")
+    other.add(("neutral", 0.9), ("negative", 0.9), 0.010, 0.010)
+
+    for pid, stats in [(1, a), (2, b), (3, other)]:
+        write_report(stats, str(tmp_path), pid=pid)
+    summary = read_reports(str(tmp_path), candidate_uri="models:/Sentiment/7")
+    assert summary["samples"] == 3
+    assert summary["agreement_rate"] == pytest.approx(2 / 3)
+    assert summary["mean_score_divergence"] == pytest.approx((0.1 + 0.2) / 2)
+    assert summary["latency_ratio"] == pytest.approx(50 / 30)
+    assert summary["confusion"]["negative"] == {"neutral": 1}
+    assert read_reports(str(tmp_path))["samples"] == 4
+    assert read_reports(str(tmp_path / "missing")) is None
+
+
+def test_mirror_compares_off_the_response_path(tmp_path):
+    calls = []
+
+    def candidate(texts):
+        calls.append(list(texts))
+        return [("negative" if "bad" in t else "positive", 0.8) for t in texts]
+
+    shadow = ShadowComparator(
+        "runs:/abc/model",
+        sample_rate=1.0,
+        batch_size=8,
+        report_dir=str(tmp_path),
+        predict_batch=candidate,
+        flush_interval=0.05,
+    )
+    texts = ["good", "bad", "fine", "meh"]
+    prod = [("positive", 0.9), ("positive", 0.6), ("positive", 0.9), ("neutral", 0.5)]
+    shadow.mirror(texts, prod, 0.01)
+
+    # il report su disco arriva dopo l'aggiornamento delle stats in memoria
+    def summary():
+        return read_reports(str(tmp_path), candidate_uri="runs:/abc/model") or {}
+
+    _wait(lambda: summary().get("samples") == 4)
+    assert shadow.stats.samples == 4
+    assert sum(len(c) for c in calls) == 4 and len(calls) <= 2
+    assert summary()["agreement_rate"] == pytest.approx(0.5)
+
+
+def test_mirror_drops_when_queue_full():
+    entered, release = threading.Event(), threading.Event()
+
+    def slow_candidate(texts):
+        entered.set()
+        release.wait(5)
+        return [("neutral", 0.5)] * len(texts)
+
+    shadow = ShadowComparator(
+        "runs:/abc/model",
+        sample_rate=1.0,
+        batch_size=1,
+        queue_size=1,
+        report_dir=None,
+        predict_batch=slow_candidate,
+    )
+    before = SHADOW_DROPPED._value.get()
+    shadow.mirror(["a"], [("neutral", 0.5)], 0.01)
+    entered.wait(5)
+    shadow.mirror(["b", "c", "d"], [("neutral", 0.5)] * 3, 0.01)
+    assert SHADOW_DROPPED._value.get() - before == 2
+    release.set()
+    _wait(lambda: shadow.stats.samples == 2)
+
+
+def test_disabled_without_candidate():
+    shadow = ShadowComparator(None, sample_rate=1.0)
+    shadow.mirror(["a"], [("neutral", 0.5)], 0.01)
+    assert not shadow.enabled and shadow._thread is None
+
+
+def test_shadow_gate():
+    summary = {"samples": 500, "agreement_rate": 0.6}
+    assert _shadow_gate(None, 0.9, 100) == (True, None)
+    assert _shadow_gate({"samples": 10, "agreement_rate": 0.1}, 0.9, 100)[0]
+    ok, reason = _shadow_gate(summary, 0.9, 100)
+    assert not ok and "0.600" in reason
+    assert _shadow_gate(summary, 0.5, 100)[0]
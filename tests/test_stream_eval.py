@@ -0,0 +1,160 @@
+import joblib
+import mlflow
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.metrics import accuracy_score, f1_score
+
+from src.models import distill, stream_eval
+from src.utils.bootstrap import ConfusionCounts, bootstrap_counts, paired_bootstrap
+from src.utils.labels import LABELS, encode_labels
+
+
+class KeywordModel:
+    """Pyfunc finto: `positive` se il testo contiene `word`, altrimenti `negative`."""
+
+    def __init__(self, word):
+        self.word = word
+        self.calls = []
+
+    def predict(self, texts):
+        self.calls.append(len(texts))
+        return [
+            {"label": "positive" if self.word in t else "negative", "score": 1.0}
+            for t in texts
+        ]
+
+
+def _holdout(tmp_path, n=250):
+    rng = np.random.default_rng(0)
+    labels = rng.choice(LABELS, n)
+    noise = rng.random(n)
+    texts = [
+        f"row {i} {'good' if (lab == 'positive') ^ (p < 0.2) else 'bad'}"
+        f"{' great' if p < 0.5 else ''}"
+        for i, (lab, p) in enumerate(zip(labels, noise))
+    ]
+    path = tmp_path / "holdout.csv"
+    pd.DataFrame({"text": texts, "label": labels}).to_csv(path, index=False)
+    return str(path)
+
+
+def _predict_all(model, path):
+    df = pd.read_csv(path)
+    y = encode_labels(df["label"].to_numpy())
+    pred = stream_eval.predict_codes(model, df["text"].astype(str).tolist())
+    return y, pred
+
+
+def test_stream_matches_in_memory_metrics(tmp_path):
+    path = _holdout(tmp_path)
+    new, prod = KeywordModel("good"), KeywordModel("great")
+    counts = stream_eval.evaluate_stream([new, prod], path, chunksize=40)
+    assert max(new.calls) == 40 and counts.n == 250
+
+    y, pred = _predict_all(KeywordModel("good"), path)
+    _, ref = _predict_all(KeywordModel("great"), path)
+    summary = counts.summary(0)
+    assert summary["macro_f1"] == pytest.approx(f1_score(y, pred, average="macro"))
+    assert summary["accuracy"] == pytest.approx(accuracy_score(y, pred))
+    assert counts.summary(1)["accuracy"] == pytest.approx(accuracy_score(y, ref))
+    sk = f1_score(y, pred, labels=[0, 1, 2], average=None)
+    assert [c["f1"] for c in summary["per_class"].values()] == pytest.approx(
+        sk, abs=1e-4
+    )
+
+    # bootstrap sulle celle: stesse stime puntuali, intervalli equivalenti
+    cells = bootstrap_counts(counts, n_resamples=2000)
+    rows = paired_bootstrap(y, pred, ref, n_resamples=2000)
+    for key in ("macro_f1", "accuracy", "delta_macro_f1"):
+        assert cells[key]["value"] == rows[key]["value"]
+        assert cells[key]["ci"] == pytest.approx(rows[key]["ci"], abs=0.03)
+
+
+def test_bootstrap_point_estimates_use_each_models_classes():
+    # il riferimento predice anche "neutral", il nuovo modello no (e nessuna
+    # etichetta vera lo è): le maschere di classe dei due modelli differiscono
+    y = np.array([0, 2, 0, 2, 2, 0, 2, 0])
+    new = np.array([0, 2, 2, 2, 0, 0, 2, 0])
+    ref = np.array([1, 2, 0, 1, 2, 0, 0, 0])
+    counts = ConfusionCounts(2).update(y, new, ref)
+    new_f1 = counts.summary(0)["macro_f1"]
+    prod_f1 = counts.summary(1)["macro_f1"]
+    assert new_f1 == pytest.approx(f1_score(y, new, average="macro"))
+    assert prod_f1 == pytest.approx(f1_score(y, ref, average="macro"))
+
+    for result in (
+        bootstrap_counts(counts, n_resamples=200),
+        paired_bootstrap(y, new, ref, n_resamples=200),
+    ):
+        assert result["macro_f1"]["value"] == pytest.approx(new_f1, abs=1e-4)
+        assert result["delta_macro_f1"]["value"] == pytest.approx(
+            new_f1 - prod_f1, abs=1e-4
+        )
+
+
+def test_shards_merge_to_full_counts(tmp_path):
+    path = _holdout(tmp_path)
+    models = [KeywordModel("good"), KeywordModel("great")]
+    full = stream_eval.evaluate_stream(models, path, chunksize=30)
+    merged = ConfusionCounts(2)
+    for shard in range(3):
+        part = stream_eval.evaluate_stream(models, path, 30, shard, num_shards=3)
+        part.save(str(tmp_path / f"counts-{shard}.npy"))
+        merged.merge(part)
+    np.testing.assert_array_equal(merged.counts, full.counts)
+
+    loaded = ConfusionCounts.load(str(tmp_path / "counts-0.npy"))
+    assert loaded.n_models == 2 and 0 < loaded.n < full.n
+    with pytest.raises(ValueError):
+        loaded.merge(ConfusionCounts(1))
+    assert stream_eval.main(["--merge", str(tmp_path / "counts-*.npy")]) == 0
+
+
+def test_shards_do_not_build_the_token_store(tmp_path, monkeypatch):
+    path = _holdout(tmp_path, n=30)
+    attached = []
+    monkeypatch.setattr(
+        stream_eval.mlflow.pyfunc, "load_model", lambda uri: KeywordModel("good")
+    )
+    monkeypatch.setattr(
+        stream_eval.token_cache,
+        "attach",
+        lambda p, text_column="text", build=True: attached.append(build),
+    )
+    stream_eval._run_shard(["models:/a/1"], path, 10, 0, 1)
+    stream_eval._run_shard(["models:/a/1"], path, 10, 1, 3)
+    assert attached == [True, False]
+
+
+def test_parquet_chunks(tmp_path):
+    pytest.importorskip("pyarrow")
+    path = _holdout(tmp_path, n=50)
+    parquet = str(tmp_path / "holdout.parquet")
+    pd.read_csv(path).to_parquet(parquet)
+    chunks = list(stream_eval.iter_chunks(parquet, chunksize=20))
+    assert [len(c) for c in chunks] == [20, 20, 10]
+
+
+def test_evaluate_uris_in_worker_processes(tmp_path):
+    path = _holdout(tmp_path, n=120)
+    df = pd.read_csv(path)
+    soft = np.eye(3)[encode_labels(df["label"].to_numpy())]
+    pipeline = distill.train_student(df["text"].tolist(), soft)
+    joblib.dump(pipeline, tmp_path / "student.joblib")
+    mlflow.set_tracking_uri(f"file:{tmp_path / 'mlruns'}")
+    try:
+        mlflow.set_experiment("stream_eval_test")
+        with mlflow.start_run() as run:
+            mlflow.pyfunc.log_model(
+                artifact_path="model",
+                python_model=distill.StudentClassifier(),
+                artifacts={"student": str(tmp_path / "student.joblib")},
+            )
+        uri = f"runs:/{run.info.run_id}/model"
+        single = stream_eval.evaluate_uris([uri], path, chunksize=25)
+        sharded = stream_eval.evaluate_uris([uri], path, chunksize=25, workers=2)
+    finally:
+        mlflow.set_tracking_uri(None)
+    np.testing.assert_array_equal(single.counts, sharded.counts)
+    assert single.n == 120
@@ -0,0 +1,66 @@
+import pytest
+
+from src.utils import text_length
+from src.utils.text_length import (
+    LengthPolicy,
+    aggregate,
+    estimate_tokens,
+    length_bucket,
+    predict_texts,
+    split_windows,
+)
+
+
+def test_estimate_tokens_and_buckets():
+    assert estimate_tokens("I love this!") == 4 + 2
+    assert length_bucket(estimate_tokens("ok")) == "32"
+    assert length_bucket(200) == "256"
+    assert length_bucket(10_000) == "inf"
+
+
+def test_split_windows_overlap_and_limit():
+    text = " ".join(f"w{i}" for i in range(100))
+    windows = split_windows(text, window=40, stride=30, max_windows=8)
+    assert all(w in text for w in windows)
+    assert windows[0].startswith("w0 ") and windows[-1].endswith("w99")
+    assert [len(w.split()) for w in windows] == [40, 40, 40]
+    # finestre consecutive si sovrappongono di window - stride token
+    assert windows[1].split()[:10] == windows[0].split()[30:]
+    assert split_windows(text, 40, 30, max_windows=2)[-1].endswith("w69")
+    assert split_windows("short text", 40, 30, 8) == ["short text"]
+
+
+def test_aggregate_weights_by_length():
+    label, score = aggregate([("positive", 0.9), ("negative", 0.8)], [10, 30])
+    assert label == "negative"
+    assert score == pytest.approx(0.8 * 30 / 40)
+
+
+def test_predict_texts_chunks_long_texts_in_one_call():
+    calls = []
+
+    def fake_batch(texts, timings=None):
+        calls.append(list(texts))
+        return [("negative" if "bad" in t else "positive", 0.9) for t in texts]
+
+    long_text = " ".join(["good"] * 30 + ["bad"] * 90)
+    policy = LengthPolicy(mode="chunk", window=40, stride=40)
+    out = predict_texts(fake_batch, ["nice", long_text], policy)
+    assert len(calls) == 1 and len(calls[0]) == 1 + 3
+    assert out[0] == ("positive", 0.9)
+    assert out[1][0] == "negative"
+
+    calls.clear()
+    out = predict_texts(fake_batch, ["nice", long_text], LengthPolicy())
+    assert calls == [["nice", long_text]]
+
+
+def test_policy_from_env(monkeypatch):
+    monkeypatch.setenv("LONG_TEXT_POLICY", "chunk")
+    monkeypatch.setenv("CHUNK_WINDOW_TOKENS", "4096")
+    policy = LengthPolicy.from_env()
+    assert policy.mode == "chunk"
+    assert policy.window == text_length.MODEL_MAX_TOKENS - 2
+    monkeypatch.setenv("LONG_TEXT_POLICY", "drop")
+    with pytest.raises(ValueError):
+        LengthPolicy.from_env()
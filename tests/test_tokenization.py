@@ -0,0 +1,164 @@
+import os
+
+import pandas as pd
+import pytest
+
+from src.utils.tokenization import TokenCache, TokenStore, tokenizer_version
+
+torch = pytest.importorskip("torch")
+transformers = pytest.importorskip("transformers")
+tokenizers = pytest.importorskip("tokenizers")
+
+VOCAB = ["<s>", "<pad>", "</s>", "<unk>", "i", "love", "hate", "this", "rt", "@user"]
+
+
+class CountingTokenizer(transformers.PreTrainedTokenizerFast):
+    texts_seen = 0
+
+    def __call__(self, texts, *args, **kwargs):
+        CountingTokenizer.texts_seen += len(texts) if isinstance(texts, list) else 1
+        return super().__call__(texts, *args, **kwargs)
+
+
+def _tokenizer(max_length=6):
+    model = tokenizers.models.WordLevel(
+        {w: i for i, w in enumerate(VOCAB)}, unk_token="<unk>"
+    )
+    tok = tokenizers.Tokenizer(model)
+    tok.pre_tokenizer = tokenizers.pre_tokenizers.WhitespaceSplit()
+    tok.post_processor = tokenizers.processors.TemplateProcessing(
+        single="<s> $A </s>", special_tokens=[("<s>", 0), ("</s>", 2)]
+    )
+    return CountingTokenizer(
+        tokenizer_object=tok,
+        pad_token="<pad>",
+        unk_token="<unk>",
+        model_max_length=max_length,
+        name_or_path="word-level",
+    )
+
+
+TEXTS = ["i love this", "rt @user i hate this this this this", "love", "i love this"]
+
+
+def test_encode_matches_tokenizer_padding_and_caches():
+    tok = _tokenizer()
+    expected = tok(TEXTS, padding=True, truncation=True, return_tensors="pt")
+    cache = TokenCache(maxsize=10)
+    CountingTokenizer.texts_seen = 0
+    enc, hit = cache.encode(tok, TEXTS)
+    assert torch.equal(enc["input_ids"], expected["input_ids"])
+    assert torch.equal(enc["attention_mask"], expected["attention_mask"])
+    assert hit == 0 and CountingTokenizer.texts_seen == len(TEXTS)
+
+    enc, hit = cache.encode(tok, ["i love this", "love"])
+    assert hit == 2 and CountingTokenizer.texts_seen == len(TEXTS)
+    assert enc["input_ids"].tolist() == [[0, 4, 5, 7, 2], [0, 5, 2, 1, 1]]
+
+
+def test_cache_is_bounded_and_keyed_by_tokenizer_version():
+    short, long = _tokenizer(4), _tokenizer(8)
+    assert tokenizer_version(short) != tokenizer_version(long)
+    cache = TokenCache(maxsize=2)
+    cache.encode(short, ["i love this"])
+    enc, hit = cache.encode(long, ["i love this"])
+    assert hit == 0 and enc["input_ids"].shape[1] == 5
+    cache.encode(long, ["love", "hate"])
+    assert cache.stats()["size"] == 2
+    assert cache.encode(short, ["i love this"])[1] == 0  # uscito per LRU
+
+
+def test_token_store_is_reused_until_source_changes(tmp_path):
+    path = str(tmp_path / "holdout.csv")
+    pd.DataFrame({"text": TEXTS, "label": ["positive"] * 4}).to_csv(path, index=False)
+    tok = _tokenizer()
+
+    CountingTokenizer.texts_seen = 0
+    store = TokenStore.open(path, tok)
+    assert len(store) == 4 and CountingTokenizer.texts_seen == 4
+    assert store.row(1) == tok(TEXTS[1:2], truncation=True)["input_ids"][0]
+    assert os.path.isdir(f"{path}.tokens")
+
+    again = TokenStore.open(path, tok)  # run successivo: solo memmap
+    assert CountingTokenizer.texts_seen == 5
+    assert again.row(0) == store.row(0)
+
+    pd.DataFrame({"text": ["hate"], "label": ["negative"]}).to_csv(path, index=False)
+    rebuilt = TokenStore.open(path, tok)
+    assert len(rebuilt) == 1 and CountingTokenizer.texts_seen == 6
+
+
+def test_attached_dataset_skips_tokenizer(tmp_path):
+    path = str(tmp_path / "eval.csv")
+    pd.DataFrame({"text": TEXTS}).to_csv(path, index=False)
+    tok = _tokenizer()
+    TokenStore.open(path, tok)  # creato da un run precedente
+
+    cache = TokenCache(maxsize=0)  # nessuna LRU: tutto dallo store
+    cache.attach(path)
+    CountingTokenizer.texts_seen = 0
+    enc, hit = cache.encode(tok, TEXTS)
+    assert hit == len(TEXTS) and CountingTokenizer.texts_seen == 0
+    expected = tok(TEXTS, padding=True, truncation=True, return_tensors="pt")
+    assert torch.equal(enc["input_ids"], expected["input_ids"])
+
+    assert cache.encode(tok, ["hate this"])[1] == 0  # fuori dal dataset
+    cache.detach(path)
+    assert cache.encode(tok, TEXTS[:1])[1] == 0
+
+
+class TokenizerModel:
+    """Pyfunc finto che tokenizza come il wrapper RoBERTa (via `token_cache`)."""
+
+    def __init__(self, cache, tokenizer):
+        self.cache, self.tokenizer = cache, tokenizer
+
+    def predict(self, texts):
+        enc, _ = self.cache.encode(self.tokenizer, texts)
+        love = VOCAB.index("love")
+        return [
+            {"label": "positive" if love in row else "negative", "score": 1.0}
+            for row in enc["input_ids"].tolist()
+        ]
+
+
+def test_jsonl_dataset_is_tokenized_in_chunks(tmp_path):
+    from src.models import stream_eval
+
+    path = str(tmp_path / "holdout.jsonl")
+    labels = ["positive", "negative", "positive", "positive"]
+    pd.DataFrame({"text": TEXTS, "label": labels}).to_json(
+        path, orient="records", lines=True
+    )
+    tok = _tokenizer()
+    cache = TokenCache(maxsize=0)
+    cache.attach(path)
+
+    CountingTokenizer.texts_seen = 0
+    model = TokenizerModel(cache, tok)
+    counts = stream_eval.evaluate_stream([model, model], path, chunksize=2)
+    assert counts.summary(0)["accuracy"] == 1.0
+    # lo store viene creato una volta (a chunk), poi i due modelli lo leggono
+    assert CountingTokenizer.texts_seen == len(TEXTS)
+    assert cache.stats()["hits"] == 2 * len(TEXTS)
+
+    store = TokenStore.build(path, tok, batch_size=3)
+    assert len(store) == 4 and store.meta["rows"] == 4
+    assert store.row(1) == tok(TEXTS[1:2], truncation=True)["input_ids"][0]
+
+
+def test_attach_without_build_uses_only_existing_stores(tmp_path):
+    path = str(tmp_path / "shard.csv")
+    pd.DataFrame({"text": TEXTS}).to_csv(path, index=False)
+    tok = _tokenizer()
+    cache = TokenCache(maxsize=0)
+    cache.attach(path, build=False)
+    CountingTokenizer.texts_seen = 0
+    assert cache.encode(tok, TEXTS[:2])[1] == 0
+    assert CountingTokenizer.texts_seen == 2  # solo i testi richiesti
+    assert not os.path.exists(f"{path}.tokens")
+
+    TokenStore.open(path, tok)
+    cache.detach(path)
+    cache.attach(path, build=False)
+    assert cache.encode(tok, TEXTS)[1] == len(TEXTS)
@@ -167,3 +167,39 @@ def test_main_without_train_csv(monkeypatch):
     code = train_roberta.main(experiment="sentiment_test", train_csv=None)
     assert code == 0
     assert calls["pyfunc"] == 1
+
+
+def test_train_returns_registered_version(monkeypatch):
+    monkeypatch.setattr(train_roberta, "get_or_create_experiment", lambda x: "expid")
+    monkeypatch.setattr(mlflow, "set_experiment", lambda x: None)
+    monkeypatch.setattr(mlflow, "start_run", lambda experiment_id=None: DummyRun())
+    monkeypatch.setattr(
+        mlflow.pyfunc,
+        "log_model",
+        lambda *args, **kwargs: SimpleNamespace(registered_model_version="7"),
+    )
+    monkeypatch.setattr(mlflow, "log_param", lambda *args, **kwargs: None)
+
+    result = train_roberta.train(experiment="sentiment_test")
+    assert result["run_id"] == "dummy"
+    assert result["version"] == 7
+    assert result["model_uri"].endswith("/7")
+
+
+def test_hf_classifier_predict_batches_logits():
+    torch = pytest.importorskip("torch")
+
+    class FakeTokenizer:
+        def __call__(self, texts, **kwargs):
+            return {"input_ids": torch.zeros((len(texts), 4), dtype=torch.long)}
+
+    class FakeModel:
+        def __call__(self, input_ids):
+            logits = torch.tensor([[0.0, 0.0, 5.0], [5.0, 0.0, 0.0], [0.0, 5.0, 0.0]])
+            return SimpleNamespace(logits=logits[: len(input_ids)])
+
+    clf = train_roberta.HFTextClassifier()
+    clf.tokenizer, clf.model, clf.batch_size = FakeTokenizer(), FakeModel(), 2
+    out = clf.predict(None, ["a", "b", "c"])
+    assert [o["label"] for o in out] == ["positive", "negative", "positive"]
+    assert all(0.9 < o["score"] <= 1.0 for o in out)